@@ -0,0 +1,208 @@
+"""
+Audit trail: entri dikumpulkan per transaksi lalu ditulis dengan bulk_create
+saat commit, langsung (sync) atau lewat worker thread di background (thread)
+"""
+import atexit
+import logging
+import queue
+import threading
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .batching import CommitBatch
+from .models import AuditLog
+
+
+logger = logging.getLogger(__name__)
+
+
+# ==================== KONTEKS REQUEST ====================
+
+_context = ContextVar('audit_context', default=None)
+
+
+def get_client_ip(request):
+    """Get client IP from request"""
+    if hasattr(request, 'META'):
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if x_forwarded_for:
+            ip = x_forwarded_for.split(',')[0]
+        else:
+            ip = request.META.get('REMOTE_ADDR')
+        return ip
+    return None
+
+
+class AuditContext:
+    """Aktor, IP dan user agent request yang sedang berjalan"""
+
+    def __init__(self, request):
+        self.request = request
+        self.ip_address = get_client_ip(request)
+        self.user_agent = request.META.get('HTTP_USER_AGENT', '') if hasattr(request, 'META') else ''
+
+    @property
+    def user(self):
+        # Dibaca saat log: DRF menyalin user hasil autentikasi JWT ke HttpRequest
+        user = getattr(self.request, 'user', None)
+        return user if user is not None and user.is_authenticated else None
+
+
+def activate(request):
+    """Pasang konteks audit untuk request; kembalikan token untuk deactivate()"""
+    return _context.set(AuditContext(request))
+
+
+def deactivate(token):
+    _context.reset(token)
+
+
+def current_context():
+    return _context.get()
+
+
+def current_actor():
+    """User yang sedang login pada request berjalan (tanpa query tambahan), atau None"""
+    context = _context.get()
+    return context.user if context else None
+
+
+# ==================== WRITER ====================
+
+class AuditBatch(CommitBatch):
+    """AuditLog yang menunggu commit transaksi yang sedang berjalan"""
+    entries_factory = list
+
+    def add(self, log):
+        self.entries.append(log)
+
+    def write(self, entries):
+        get_writer().submit(entries)
+
+
+class SyncAuditWriter:
+    """Tulis batch langsung di thread pemanggil (setelah commit)"""
+    mode = 'sync'
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.metrics = {'submitted': 0, 'written': 0, 'backpressure': 0, 'errors': 0}
+
+    def count(self, **deltas):
+        with self.lock:
+            for key, value in deltas.items():
+                self.metrics[key] += value
+
+    def write(self, logs):
+        AuditLog.objects.bulk_create(logs, batch_size=self.batch_size)
+        self.count(written=len(logs))
+
+    def write_safe(self, logs):
+        """
+        Tulis di thread pemanggil. Dipanggil dari on_commit (data sudah commit),
+        jadi kegagalan dicatat di log dan metrik, tidak dinaikkan ke view.
+        """
+        try:
+            self.write(logs)
+        except Exception:
+            logger.exception('Gagal menulis %d entri audit log', len(logs))
+            self.count(errors=len(logs))
+
+    def submit(self, logs):
+        self.count(submitted=len(logs))
+        self.write_safe(logs)
+
+    def drain(self):
+        pass
+
+    def stats(self):
+        with self.lock:
+            return {'mode': self.mode, **self.metrics, 'queue_size': 0, 'queue_max': 0}
+
+
+class ThreadedAuditWriter(SyncAuditWriter):
+    """
+    Serahkan batch ke worker thread lewat antrian terbatas.
+    Jika antrian penuh (backpressure), sisa entri ditulis di thread pemanggil
+    sehingga tidak ada entri audit yang hilang.
+    """
+    mode = 'thread'
+
+    def __init__(self, max_size=10000, batch_size=500):
+        super().__init__(batch_size)
+        self.queue = queue.Queue(maxsize=max_size)
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='audit-writer', daemon=True)
+                self.thread.start()
+
+    def submit(self, logs):
+        self.start()
+        self.count(submitted=len(logs))
+        for i, log in enumerate(logs):
+            try:
+                self.queue.put_nowait(log)
+            except queue.Full:
+                sisa = logs[i:]
+                self.count(backpressure=len(sisa))
+                self.write_safe(sisa)
+                break
+
+    def run(self):
+        while True:
+            logs = [self.queue.get()]
+            while len(logs) < self.batch_size:
+                try:
+                    logs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(logs)
+            except Exception:
+                logger.exception('Gagal menulis %d entri audit log', len(logs))
+                self.count(errors=len(logs))
+            finally:
+                close_old_connections()
+                for _ in logs:
+                    self.queue.task_done()
+
+    def drain(self):
+        """Tunggu sampai semua entri di antrian ditulis"""
+        if self.thread is not None:
+            self.queue.join()
+
+    def stats(self):
+        data = super().stats()
+        data.update(queue_size=self.queue.qsize(), queue_max=self.queue.maxsize)
+        return data
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Writer audit log sesuai settings.AUDIT_LOG_WRITER ('sync' atau 'thread')"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            batch_size = getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 500)
+            if getattr(settings, 'AUDIT_LOG_WRITER', 'sync') == 'thread':
+                _writer = ThreadedAuditWriter(getattr(settings, 'AUDIT_LOG_QUEUE_SIZE', 10000), batch_size)
+                atexit.register(_writer.drain)
+            else:
+                _writer = SyncAuditWriter(batch_size)
+        return _writer
+
+
+def record(log):
+    """Antrikan AuditLog (belum disimpan); ditulis saat transaksi commit"""
+    batch = AuditBatch.current()
+    batch.add(log)
+    batch.register()
@@ -0,0 +1,121 @@
+"""
+Buffer per transaksi: entri dikumpulkan selama transaksi berjalan lalu
+di-flush sekali lewat transaction.on_commit. Tiap savepoint (atomic() bersarang)
+punya batch sendiri, sehingga entri dari savepoint yang di-rollback ikut dibuang;
+saat commit batch semua savepoint yang selamat digabung menjadi satu write.
+"""
+import itertools
+import threading
+import weakref
+
+from django.db import transaction
+
+
+_local = threading.local()
+
+_urutan = itertools.count()
+
+
+def _savepoint():
+    """Savepoint terdalam yang sedang berjalan, None untuk transaksi terluar/autocommit"""
+    connection = transaction.get_connection()
+    return next((sid for sid in reversed(connection.savepoint_ids) if sid), None)
+
+
+class _Flush:
+    """Callback on_commit satu batch; dibuang Django jika transaksi/savepoint-nya di-rollback"""
+
+    def __init__(self, batch):
+        self.batch = batch
+
+    def __call__(self):
+        self.batch.flush()
+
+
+class CommitBatch:
+    """
+    Entri yang menunggu commit transaksi yang sedang berjalan.
+    Subclass mengisi `entries` dan mengimplementasi write(entries).
+    Batch terikat pada savepoint tempat entri ditambahkan: jika savepoint atau
+    transaksinya di-rollback, flush ikut dibuang bersama entrinya.
+    """
+    entries_factory = dict
+
+    def __init__(self):
+        self.entries = self.entries_factory()
+        self.savepoint = None
+        self._flush = None
+        self._urutan = None
+
+    @classmethod
+    def current(cls):
+        """Batch milik savepoint/transaksi yang sedang berjalan di thread ini"""
+        batches = _local.__dict__.setdefault('batches', {})
+        # Batch yang sudah di-flush atau dibuang rollback tidak dipakai lagi
+        for key in [key for key, batch in batches.items() if not batch.registered]:
+            del batches[key]
+        savepoint = _savepoint()
+        batch = batches.get((cls, savepoint))
+        if batch is None:
+            batch = batches[cls, savepoint] = cls()
+            batch.savepoint = savepoint
+        return batch
+
+    @classmethod
+    def pending(cls):
+        """Semua batch kelas ini di thread ini yang masih menunggu commit, urut registrasi"""
+        batches = _local.__dict__.get('batches', {})
+        return sorted(
+            (batch for (klass, _), batch in batches.items() if klass is cls and batch.registered),
+            key=lambda batch: batch._urutan,
+        )
+
+    @property
+    def registered(self):
+        """
+        True selama flush masih menunggu commit. Batch hanya menyimpan weakref
+        ke callback-nya: saat rollback Django membuang callback tersebut sehingga
+        flag ikut hilang, tanpa membaca antrian on_commit milik connection.
+        """
+        return self._flush is not None and self._flush() is not None
+
+    def register(self):
+        """Daftarkan flush sekali; tanpa transaksi aktif flush langsung jalan"""
+        if not self.registered:
+            callback = _Flush(self)
+            self._flush = weakref.ref(callback)
+            self._urutan = next(_urutan)
+            transaction.on_commit(callback)
+
+    def _sudah_commit(self):
+        """Savepoint/transaksi batch ini sudah selesai (callback-nya hidup: tidak di-rollback)"""
+        connection = transaction.get_connection()
+        if self.savepoint is None:
+            return not connection.in_atomic_block
+        return self.savepoint not in connection.savepoint_ids
+
+    def flush(self):
+        """
+        Tulis entri batch ini bersama batch savepoint lain kelas yang sama yang
+        ikut commit, dalam satu write. Callback batch yang sudah digabung tetap
+        dipanggil Django, tapi tidak menulis apa-apa lagi.
+        """
+        entries = self.entries_factory()
+        for batch in self.pending():
+            if batch is self or batch._sudah_commit():
+                batch._flush = None
+                self.merge(entries, batch.entries)
+                batch.entries = batch.entries_factory()
+        self._flush = None
+        if entries:
+            self.write(entries)
+
+    def merge(self, entries, lain):
+        """Tambahkan entri batch lain (lebih baru) ke `entries`"""
+        if isinstance(entries, list):
+            entries.extend(lain)
+        else:
+            entries.update(lain)
+
+    def write(self, entries):
+        raise NotImplementedError
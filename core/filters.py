@@ -0,0 +1,51 @@
+"""
+Filter backend untuk list endpoint yang memakai index pencarian
+"""
+from django.db.models import Case, IntegerField, Q, Value, When
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from .models import Pasien
+from .search import cari_pasien, cari_rekam_medis, kondisi_pasien, kondisi_rekam_medis, urutkan_hasil
+
+
+class PasienSearchFilter(BaseFilterBackend):
+    """
+    Pengganti SearchFilter untuk queryset Pasien: ?search= (parameter sama)
+    dicari lewat index PasienSearch. Semua pasien yang cocok ikut dipaginasi;
+    PASIEN_SEARCH_LIMIT teratas terurut relevansi, sisanya menyusul.
+    Queryset yang sudah difilter (mis. pasien milik dokter) menjadi scope pencarian.
+    """
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        q = request.query_params.get(self.search_param, '').strip()
+        if not q:
+            return queryset
+        scope = queryset if queryset.query.has_filters() else None
+        return urutkan_hasil(queryset.filter(kondisi_pasien(q)), cari_pasien(q, scope))
+
+
+class RekamMedisSearchFilter(BaseFilterBackend):
+    """
+    Pengganti SearchFilter untuk queryset RekamMedis: ?search= mencocokkan teks
+    klinis lewat index FTS dan pasien lewat index PasienSearch (nama/no RM/
+    telepon), dalam scope queryset. Semua hasil ikut dipaginasi: skor teks
+    klinis tertinggi (REKAM_MEDIS_SEARCH_LIMIT) dulu, sisanya urut tanggal periksa terbaru.
+    """
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        q = request.query_params.get(self.search_param, '').strip()
+        if not q:
+            return queryset
+        scope = queryset if queryset.query.has_filters() else None
+        ids = [pk for pk, _ in cari_rekam_medis(q, scope)]
+        pasien = Pasien.objects.filter(kondisi_pasien(q)).values('pk')
+        return queryset.filter(kondisi_rekam_medis(q) | Q(pasien_id__in=pasien)).order_by(
+            Case(
+                *[When(pk=pk, then=Value(i)) for i, pk in enumerate(ids)],
+                default=Value(len(ids)), output_field=IntegerField(),
+            ),
+            '-tanggal_periksa',
+        )
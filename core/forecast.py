@@ -0,0 +1,149 @@
+"""
+Forecast kebutuhan obat: konsumsi harian dari riwayat resep yang sudah
+diserahkan, dihitung untuk semua obat sekaligus dengan NumPy (matriks
+obat x hari), menghasilkan reorder point dan days-of-cover per obat
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Case, Exists, F, FloatField, OuterRef, Q, Sum, When
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import DetailResep, Obat, ObatForecast
+from .stats import local_day_range
+
+
+def lead_time(supplier):
+    """Lead time (hari) supplier dari settings, default FORECAST_LEAD_TIME_HARI"""
+    per_supplier = getattr(settings, 'FORECAST_LEAD_TIME_SUPPLIER', {})
+    return per_supplier.get(supplier or '', getattr(settings, 'FORECAST_LEAD_TIME_HARI', 7))
+
+
+def konsumsi_harian(obat_ids, sampai, hari):
+    """
+    Matriks konsumsi [obat x hari] untuk `hari` hari yang berakhir di `sampai`
+    (inklusif), dari DetailResep resep delivered dalam satu query agregat.
+    `obat_ids` = semua obat aktif (urutan baris matriks).
+    """
+    mulai = sampai - timedelta(days=hari - 1)
+    awal, _ = local_day_range(mulai)
+    _, batas = local_day_range(sampai)
+
+    rows = DetailResep.objects.filter(
+        resep__status='delivered', obat__is_active=True
+    ).annotate(
+        waktu=Coalesce('resep__processed_at', 'resep__tanggal_resep')
+    ).filter(
+        waktu__gte=awal, waktu__lt=batas
+    ).annotate(
+        hari=TruncDate('waktu')
+    ).values('obat_id', 'hari').annotate(jumlah=Sum('jumlah')).order_by().values_list('obat_id', 'hari', 'jumlah')
+
+    matriks = np.zeros((len(obat_ids), hari))
+    rows = list(rows)
+    if rows:
+        index = {obat_id: i for i, obat_id in enumerate(obat_ids)}
+        baris, tanggal, jumlah = zip(*rows)
+        np.add.at(
+            matriks,
+            (np.fromiter((index[obat_id] for obat_id in baris), int), np.fromiter(((t - mulai).days for t in tanggal), int)),
+            np.asarray(jumlah, dtype=float),
+        )
+    return matriks
+
+
+def hitung_statistik(matriks, umur, lead_times, z):
+    """
+    Statistik konsumsi per baris matriks, semua vektor:
+    moving average 7 dan 28 hari terakhir, standar deviasi harian, safety stock
+    z * std * sqrt(lead time) dan reorder point kebutuhan * lead time + safety stock.
+    `umur` = jumlah hari obat sudah ada di window (hari sebelumnya tidak dihitung).
+    """
+    hari = matriks.shape[1]
+    umur = np.clip(umur, 1, hari)
+    valid = np.arange(hari) >= (hari - umur)[:, None]
+
+    ma_7 = matriks[:, -7:].sum(axis=1) / np.minimum(7, umur)
+    ma_28 = matriks[:, -28:].sum(axis=1) / np.minimum(28, umur)
+    rata_rata = matriks.sum(axis=1) / umur
+    varians = np.where(valid, (matriks - rata_rata[:, None]) ** 2, 0).sum(axis=1) / np.maximum(umur - 1, 1)
+    std = np.sqrt(varians)
+
+    # Laju naik cepat (MA pendek) langsung dipakai; laju turun menunggu MA panjang
+    kebutuhan = np.maximum(ma_7, ma_28)
+    # Dibulatkan dulu supaya galat float (mis. 9.999999) tidak ikut di-ceil
+    safety_stock = np.ceil(np.round(z * std * np.sqrt(lead_times), 6))
+    reorder_point = np.ceil(np.round(kebutuhan * lead_times + safety_stock, 6))
+    return {
+        'rata_rata_7_hari': ma_7,
+        'rata_rata_28_hari': ma_28,
+        'std_harian': std,
+        'kebutuhan_harian': kebutuhan,
+        'safety_stock': safety_stock,
+        'reorder_point': reorder_point,
+    }
+
+
+def hitung_forecast(sampai=None):
+    """
+    Hitung ulang forecast semua obat aktif dari konsumsi s/d `sampai`
+    (default kemarin, hari penuh terakhir) dan simpan dengan satu bulk upsert
+    """
+    sampai = sampai or timezone.localdate() - timedelta(days=1)
+    hari = getattr(settings, 'FORECAST_WINDOW_HARI', 90)
+    z = getattr(settings, 'FORECAST_SERVICE_LEVEL_Z', 1.65)
+
+    obat_list = list(Obat.objects.filter(is_active=True).order_by('id').values_list('id', 'supplier', 'created_at'))
+    if not obat_list:
+        return []
+    obat_ids = [obat_id for obat_id, _, _ in obat_list]
+    umur = np.array([(sampai - timezone.localdate(created_at)).days + 1 for _, _, created_at in obat_list])
+    lead_times = np.array([lead_time(supplier) for _, supplier, _ in obat_list], dtype=float)
+
+    hasil = hitung_statistik(konsumsi_harian(obat_ids, sampai, hari), umur, lead_times, z)
+
+    now = timezone.now()
+    kolom = {field: values.tolist() for field, values in hasil.items()}
+    for field in ('safety_stock', 'reorder_point'):
+        kolom[field] = [int(value) for value in kolom[field]]
+    return ObatForecast.objects.bulk_create(
+        [
+            ObatForecast(
+                obat_id=obat_id, lead_time_hari=int(lead_times[i]), dihitung_at=now,
+                **{field: values[i] for field, values in kolom.items()}
+            )
+            for i, obat_id in enumerate(obat_ids)
+        ],
+        update_conflicts=True,
+        unique_fields=['obat'],
+        update_fields=[*hasil, 'lead_time_hari', 'dihitung_at'],
+    )
+
+
+def with_days_of_cover(queryset):
+    """Annotate ObatForecast dengan stok sekarang / kebutuhan harian (NULL jika tidak terpakai)"""
+    return queryset.annotate(
+        days_of_cover=Case(
+            When(kebutuhan_harian__gt=0, then=Cast('obat__stok', FloatField()) / F('kebutuhan_harian')),
+            default=None,
+            output_field=FloatField(),
+        )
+    )
+
+
+def obat_stok_menipis():
+    """
+    Obat aktif dengan stok <= reorder point hasil forecast; obat yang belum punya
+    forecast memakai batas lama stok < 10. Kedua cabang digabung sebagai
+    pk IN (...) OR pk IN (...) supaya cabang batas tetap memakai index parsial
+    obat_aktif_stok_idx, bukan scan seluruh tabel obat.
+    """
+    tanpa_forecast = Obat.objects.filter(is_active=True, stok__lt=10).exclude(
+        Exists(ObatForecast.objects.filter(obat=OuterRef('pk')))
+    )
+    di_bawah_reorder = ObatForecast.objects.filter(obat__is_active=True, obat__stok__lte=F('reorder_point'))
+    return Obat.objects.filter(
+        Q(pk__in=tanpa_forecast.values('pk')) | Q(pk__in=di_bawah_reorder.values('obat_id'))
+    )
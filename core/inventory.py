@@ -0,0 +1,223 @@
+"""
+Mutasi stok obat: semua perubahan stok lewat sini, diterapkan atomik di SQL
+dengan F('stok') + delta dan guard stok tidak boleh negatif, lalu dicatat
+di ledger StokMovement
+"""
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, DateField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Trunc
+from django.utils import timezone
+
+from .models import Obat, ObatLot, StokMovement, StokSnapshot
+from .notifications import alert_stok_menipis
+from .stats import local_day_range
+
+
+class StokTidakCukup(ValidationError):
+    """Stok obat tidak cukup untuk perubahan yang diminta"""
+
+
+class LotTidakCocok(ValidationError):
+    """Nomor lot sudah ada dengan tanggal kedaluwarsa berbeda"""
+
+
+class _GuardGagal(Exception):
+    """Guard stok non-negatif di UPDATE obat menolak satu atau lebih baris"""
+
+
+def apply_stock_deltas(deltas, tipe, resep=None, adjustment=None, lot=None):
+    """
+    Terapkan {obat_id: delta} dalam satu UPDATE ... CASE untuk semua obat.
+    Baris yang akan menjadi negatif tidak ikut ter-update oleh WHERE, dan jika
+    ada yang gagal seluruh perubahan di-rollback lalu StokTidakCukup dinaikkan.
+    Delta juga diterapkan ke ObatLot: masuk ke `lot` (nomor_lot, expired_date)
+    atau lot default, keluar dialokasikan FEFO (lihat _alokasi_lot).
+    Setiap delta dicatat sebagai StokMovement `tipe` (lihat StokMovement.TIPE_CHOICES).
+    Mengembalikan {obat_id: stok_baru}.
+    """
+    deltas = {obat_id: delta for obat_id, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+
+    guard = Q()
+    for obat_id, delta in deltas.items():
+        guard |= Q(pk=obat_id, stok__gte=-delta) if delta < 0 else Q(pk=obat_id)
+
+    try:
+        with transaction.atomic():
+            updated = Obat.objects.filter(guard).update(
+                stok=F('stok') + Case(*[When(pk=obat_id, then=Value(delta)) for obat_id, delta in deltas.items()])
+            )
+            if updated != len(deltas):
+                raise _GuardGagal
+            _alokasi_lot(deltas, tipe, lot)
+            # Reorder point forecast ikut diambil untuk alert_stok_menipis
+            obat_list = list(
+                Obat.objects.filter(pk__in=deltas).select_related('forecast')
+                .only('id', 'nama', 'satuan', 'stok', 'forecast__reorder_point')
+            )
+            StokMovement.objects.bulk_create([
+                StokMovement(
+                    obat=obat, tipe=tipe, jumlah=deltas[obat.pk], stok_setelah=obat.stok,
+                    resep=resep, adjustment=adjustment
+                )
+                for obat in obat_list
+            ])
+    except _GuardGagal:
+        # Sudah di-rollback: stok yang terbaca adalah stok sebelum perubahan
+        kurang = [
+            f'{nama} (tersedia {stok})'
+            for obat_id, nama, stok in Obat.objects.filter(pk__in=deltas).values_list('id', 'nama', 'stok')
+            if stok + deltas[obat_id] < 0
+        ]
+        raise StokTidakCukup(f"Stok tidak cukup: {', '.join(kurang) or 'obat tidak ditemukan'}")
+
+    for obat in obat_list:
+        if deltas[obat.pk] < 0:
+            alert_stok_menipis(obat)
+    return {obat.pk: obat.stok for obat in obat_list}
+
+
+def _alokasi_lot(deltas, tipe, lot):
+    """
+    Terapkan delta ke ObatLot (dipanggil di dalam transaksi apply_stock_deltas).
+    Stok keluar diambil first-expire-first-out lewat index (obat, expired_date);
+    untuk resep, lot yang sudah kedaluwarsa dilewati.
+    """
+    for obat_id, delta in deltas.items():
+        if delta > 0:
+            nomor_lot, expired_date = lot or ('', None)
+            if expired_date is None:
+                # Lot baru tanpa tanggal kedaluwarsa mewarisi expired_date obat
+                expired_date = lambda obat_id=obat_id: Obat.objects.filter(pk=obat_id).values_list(
+                    'expired_date', flat=True
+                ).first()
+            obat_lot, created = ObatLot.objects.get_or_create(
+                obat_id=obat_id, nomor_lot=nomor_lot,
+                defaults={'jumlah': delta, 'expired_date': expired_date},
+            )
+            if not created:
+                # Lot yang sama tidak boleh punya dua tanggal kedaluwarsa (yang kedua akan hilang)
+                if lot and lot[1] is not None and obat_lot.expired_date != lot[1]:
+                    raise LotTidakCocok(
+                        f'Lot {nomor_lot} sudah tercatat dengan kedaluwarsa {obat_lot.expired_date}, '
+                        f'bukan {lot[1]}'
+                    )
+                ObatLot.objects.filter(pk=obat_lot.pk).update(jumlah=F('jumlah') + delta)
+
+    keluar = {obat_id: -delta for obat_id, delta in deltas.items() if delta < 0}
+    if keluar:
+        lots = ObatLot.objects.select_for_update().filter(obat_id__in=keluar, jumlah__gt=0)
+        if tipe == 'resep':
+            lots = lots.exclude(expired_date__lte=timezone.localdate())
+        lots = lots.order_by('obat_id', F('expired_date').asc(nulls_last=True), 'id')
+
+        ambil = {}
+        for obat_lot in lots.only('id', 'obat_id', 'jumlah'):
+            n = min(keluar[obat_lot.obat_id], obat_lot.jumlah)
+            if n:
+                ambil[obat_lot.pk] = n
+                keluar[obat_lot.obat_id] -= n
+
+        kurang = [obat_id for obat_id, sisa in keluar.items() if sisa]
+        if kurang:
+            nama = ', '.join(Obat.objects.filter(pk__in=kurang).values_list('nama', flat=True))
+            raise StokTidakCukup(f'Stok layak pakai (belum kedaluwarsa) tidak cukup: {nama}')
+        ObatLot.objects.filter(pk__in=ambil).update(
+            jumlah=F('jumlah') - Case(*[When(pk=lot_id, then=Value(n)) for lot_id, n in ambil.items()])
+        )
+
+    # expired_date obat = kedaluwarsa terdekat dari lot yang masih ada stoknya;
+    # jika tidak ada (stok habis / lot tanpa tanggal) nilai lama dipertahankan,
+    # supaya restock tanpa lot tetap mewarisi tanggal kedaluwarsa, bukan NULL
+    Obat.objects.filter(pk__in=deltas).update(expired_date=Coalesce(
+        Subquery(
+            ObatLot.objects.filter(
+                obat=OuterRef('pk'), jumlah__gt=0, expired_date__isnull=False
+            ).order_by('expired_date').values('expired_date')[:1]
+        ),
+        F('expired_date'),
+    ))
+
+
+def catat_saldo_awal(obat):
+    """Catat stok obat baru sebagai mutasi saldo awal (lot default)"""
+    if obat.stok:
+        StokMovement.objects.create(obat=obat, tipe='awal', jumlah=obat.stok, stok_setelah=obat.stok)
+        ObatLot.objects.create(obat=obat, nomor_lot='', expired_date=obat.expired_date, jumlah=obat.stok)
+
+
+def sinkron_expired_lot_default(obat):
+    """Perubahan manual expired_date obat diteruskan ke lot default"""
+    ObatLot.objects.filter(obat=obat, nomor_lot='').update(expired_date=obat.expired_date)
+
+
+def obat_kedaluwarsa(sampai, sejak=None):
+    """
+    Obat aktif yang punya lot berisi stok dengan expired_date <= sampai (dan > sejak).
+    Dimulai dari range scan index parsial obat_lot_expiry_idx, lalu lookup obat per pk.
+    """
+    lots = ObatLot.objects.filter(jumlah__gt=0, expired_date__lte=sampai)
+    if sejak:
+        lots = lots.filter(expired_date__gt=sejak)
+    return Obat.objects.filter(pk__in=lots.values('obat_id'), is_active=True)
+
+
+# ==================== RIWAYAT STOK ====================
+
+def _jumlah_mutasi(obat_id, **filters):
+    return StokMovement.objects.filter(obat_id=obat_id, **filters).aggregate(
+        total=Coalesce(Sum('jumlah'), 0)
+    )['total']
+
+
+def stok_pada(obat_id, tanggal):
+    """
+    Stok obat pada akhir hari `tanggal`: snapshot terakhir <= tanggal ditambah
+    mutasi sesudah snapshot itu (range terbatas, memakai index obat+created_at).
+    Sebelum snapshot pertama, dihitung dari awal ledger (dimulai saldo awal).
+    """
+    _, batas = local_day_range(tanggal)
+    snapshot = StokSnapshot.objects.filter(obat_id=obat_id, tanggal__lte=tanggal).order_by('-tanggal').first()
+    if snapshot is None:
+        return _jumlah_mutasi(obat_id, created_at__lt=batas)
+    _, mulai = local_day_range(snapshot.tanggal)
+    return snapshot.stok + _jumlah_mutasi(obat_id, created_at__gte=mulai, created_at__lt=batas)
+
+
+def konsumsi_mingguan(obat_id, minggu=4):
+    """Jumlah obat keluar lewat resep per minggu (Senin) untuk `minggu` minggu terakhir"""
+    today = timezone.localdate()
+    awal = today - timedelta(days=today.weekday() + 7 * (minggu - 1))
+    mulai, _ = local_day_range(awal)
+
+    rows = StokMovement.objects.filter(
+        obat_id=obat_id, tipe='resep', created_at__gte=mulai
+    ).annotate(
+        minggu=Trunc('created_at', 'week', output_field=DateField())
+    ).values('minggu').annotate(keluar=Sum('jumlah')).order_by()
+    keluar = {row['minggu']: -row['keluar'] for row in rows}
+
+    return [
+        {'minggu': awal + timedelta(weeks=i), 'jumlah': keluar.get(awal + timedelta(weeks=i), 0)}
+        for i in range(minggu)
+    ]
+
+
+def snapshot_stok(tanggal):
+    """
+    Simpan stok semua obat pada akhir hari `tanggal` dalam satu query agregat:
+    stok sekarang dikurangi mutasi sesudah hari itu. Dijalankan harian untuk kemarin.
+    """
+    _, batas = local_day_range(tanggal)
+    rows = Obat.objects.annotate(
+        sesudah=Coalesce(Sum('stok_movements__jumlah', filter=Q(stok_movements__created_at__gte=batas)), 0)
+    ).values_list('id', 'stok', 'sesudah')
+
+    return StokSnapshot.objects.bulk_create(
+        [StokSnapshot(obat_id=obat_id, tanggal=tanggal, stok=stok - sesudah) for obat_id, stok, sesudah in rows],
+        update_conflicts=True, unique_fields=['obat', 'tanggal'], update_fields=['stok'],
+    )
@@ -0,0 +1,103 @@
+"""
+Management command untuk membandingkan waktu query hot path sebelum/sesudah index
+(index dilepas sementara di dalam transaksi lalu di-rollback, data tidak berubah)
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from core.models import JanjiTemu, Pembayaran, RekamMedis, Resep
+from core.stats import local_day_range
+
+
+INDEXED_MODELS = (JanjiTemu, Pembayaran, Resep, RekamMedis)
+
+
+class Rollback(Exception):
+    pass
+
+
+def hot_queries():
+    """Query yang sama dengan access path view di core/views.py"""
+    today = timezone.localdate()
+    today_start, today_end = local_day_range(today)
+    month_start, _ = local_day_range(today.replace(day=1))
+    dokter_id = JanjiTemu.objects.values_list('dokter_id', flat=True).first()
+
+    return {
+        'antrian hari ini (AntrianView)': lambda: list(
+            JanjiTemu.objects.filter(tanggal=today, status__in=['confirmed', 'pending'])
+            .order_by('nomor_antrian').values_list('id', flat=True)[:50]
+        ),
+        'janji hari ini (dashboard)': lambda: JanjiTemu.objects.filter(tanggal=today).count(),
+        'pembayaran pending (PembayaranViewSet)': lambda: list(
+            Pembayaran.objects.filter(status='pending').order_by('-created_at').values_list('id', flat=True)[:20]
+        ),
+        'revenue bulan ini (dashboard)': lambda: Pembayaran.objects.filter(
+            status='lunas', tanggal_bayar__gte=month_start
+        ).count(),
+        'resep diserahkan hari ini (ApotekerStatsView)': lambda: Resep.objects.filter(
+            status='delivered', processed_at__gte=today_start, processed_at__lt=today_end
+        ).count(),
+        # Bentuk lama: fungsi tanggal atas kolom, index (status, processed_at) hanya terpakai untuk status
+        'resep hari ini via processed_at__date': lambda: Resep.objects.filter(
+            status='delivered', processed_at__date=today
+        ).count(),
+        'resep pending (ResepViewSet)': lambda: list(
+            Resep.objects.filter(status='pending').order_by('-tanggal_resep').values_list('id', flat=True)[:20]
+        ),
+        'rekam medis dokter (RekamMedisViewSet)': lambda: list(
+            RekamMedis.objects.filter(dokter_id=dokter_id).order_by('-tanggal_periksa')
+            .values_list('id', flat=True)[:20]
+        ),
+    }
+
+
+def measure(queries, ulang):
+    """Median waktu (ms) tiap query dari `ulang` kali eksekusi"""
+    hasil = {}
+    for label, query in queries.items():
+        query()  # warm-up cache halaman
+        waktu = []
+        for _ in range(ulang):
+            mulai = time.perf_counter()
+            query()
+            waktu.append((time.perf_counter() - mulai) * 1000)
+        hasil[label] = statistics.median(waktu)
+    return hasil
+
+
+class Command(BaseCommand):
+    help = 'Bandingkan waktu query hot path JanjiTemu/Pembayaran/Resep/RekamMedis dengan dan tanpa index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ulang', type=int, default=5, help='Jumlah eksekusi per query (median)')
+
+    def handle(self, *args, **options):
+        queries = hot_queries()
+        self.stdout.write(self.style.WARNING(
+            f"Data: {JanjiTemu.objects.count()} janji temu, {Pembayaran.objects.count()} pembayaran, "
+            f"{Resep.objects.count()} resep, {RekamMedis.objects.count()} rekam medis"
+        ))
+
+        sesudah = measure(queries, options['ulang'])
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for model in INDEXED_MODELS:
+                        for index in model._meta.indexes:
+                            cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+                sebelum = measure(queries, options['ulang'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"{'query':<48} {'tanpa index':>12} {'dengan index':>13} {'speedup':>8}")
+        for label in queries:
+            speedup = sebelum[label] / sesudah[label] if sesudah[label] else 0
+            self.stdout.write(
+                f'{label:<48} {sebelum[label]:>10.2f}ms {sesudah[label]:>11.2f}ms {speedup:>7.1f}x'
+            )
+        self.stdout.write(self.style.SUCCESS('✅ Benchmark selesai (index tidak diubah)'))
@@ -4,9 +4,9 @@ Tetap pertahankan data master (users, dokter, pasien, obat, layanan)
 """
 from django.core.management.base import BaseCommand
 from core.models import (
-    JanjiTemu, RekamMedis, Resep, DetailResep, Pembayaran,
+    JanjiTemu, AntrianCounter, RekamMedis, Resep, DetailResep, Pembayaran,
     AuditLog, StokAdjustment, Notifikasi, Cicilan, 
-    PaymentTransaction, InvoiceQRCode
+    PaymentTransaction, InvoiceQRCode, DailyRevenueRollup
 )
 
 
@@ -41,6 +41,8 @@ class Command(BaseCommand):
         Pembayaran.objects.all().delete()
         RekamMedis.objects.all().delete()
         JanjiTemu.objects.all().delete()
+        AntrianCounter.objects.all().delete()
+        DailyRevenueRollup.objects.all().delete()
         
         self.stdout.write(self.style.SUCCESS('✅ Data transaksi berhasil dibersihkan!'))
         self.stdout.write('')
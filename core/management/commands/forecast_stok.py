@@ -0,0 +1,24 @@
+"""
+Management command untuk menghitung ulang forecast reorder point obat (dijalankan tiap malam)
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from core.forecast import hitung_forecast
+
+
+class Command(BaseCommand):
+    help = 'Hitung ulang konsumsi harian, reorder point dan safety stock semua obat aktif ke ObatForecast'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sampai', help='Hari terakhir riwayat konsumsi (YYYY-MM-DD), default kemarin')
+
+    def handle(self, *args, **options):
+        try:
+            sampai = date.fromisoformat(options['sampai']) if options['sampai'] else None
+        except ValueError as e:
+            raise CommandError(f'Format tanggal tidak valid: {e}')
+
+        self.stdout.write(self.style.WARNING('Menghitung forecast stok obat...'))
+        hasil = hitung_forecast(sampai)
+        self.stdout.write(self.style.SUCCESS(f'✅ Forecast {len(hasil)} obat tersimpan'))
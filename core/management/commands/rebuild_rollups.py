@@ -0,0 +1,26 @@
+"""
+Management command untuk backfill/perbaikan DailyRevenueRollup
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from core.models import DailyRevenueRollup
+
+
+class Command(BaseCommand):
+    help = 'Hitung ulang rollup revenue harian dari pembayaran lunas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Tanggal awal (YYYY-MM-DD), default semua data')
+        parser.add_argument('--end', help='Tanggal akhir (YYYY-MM-DD), default semua data')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(f'Format tanggal tidak valid: {e}')
+
+        self.stdout.write(self.style.WARNING('Menghitung ulang rollup revenue harian...'))
+        jumlah = DailyRevenueRollup.rebuild(start=start, end=end)
+        self.stdout.write(self.style.SUCCESS(f'✅ {jumlah} baris rollup berhasil dibangun ulang'))
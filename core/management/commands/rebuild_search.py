@@ -0,0 +1,28 @@
+"""
+Management command untuk membangun ulang index pencarian (backfill/perbaikan)
+"""
+from django.core.management.base import BaseCommand
+from core.search import rebuild_pasien_search, rebuild_rekam_medis_search
+
+
+INDEX = {
+    'pasien': ('pasien', rebuild_pasien_search),
+    'rekam_medis': ('rekam medis', rebuild_rekam_medis_search),
+}
+
+
+class Command(BaseCommand):
+    help = 'Bangun ulang index pencarian pasien (nama, telepon) dan teks klinis rekam medis'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--index', choices=list(INDEX), action='append',
+            help='Index yang dibangun ulang (boleh diulang), default semua'
+        )
+
+    def handle(self, *args, **options):
+        for nama in options['index'] or list(INDEX):
+            label, rebuild = INDEX[nama]
+            self.stdout.write(self.style.WARNING(f'Membangun ulang index pencarian {label}...'))
+            jumlah = rebuild()
+            self.stdout.write(self.style.SUCCESS(f'✅ {jumlah} {label} ter-index'))
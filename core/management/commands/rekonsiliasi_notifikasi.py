@@ -0,0 +1,14 @@
+"""
+Management command untuk mencocokkan counter notifikasi belum dibaca dengan
+tabel notifikasi (jalankan berkala, mis. cron tiap jam)
+"""
+from django.core.management.base import BaseCommand
+from core.notifications import rekonsiliasi_unread
+
+
+class Command(BaseCommand):
+    help = 'Cocokkan dan perbaiki counter notifikasi belum dibaca per user'
+
+    def handle(self, *args, **options):
+        selisih = rekonsiliasi_unread()
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(selisih)} counter notifikasi diperbaiki'))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import date, time, timedelta
+import time as time_module
 from decimal import Decimal
 
 from core.models import (
@@ -10,7 +11,16 @@ from core.models import (
 
 
 class Command(BaseCommand):
-    help = 'Seed database dengan data dummy untuk testing'
+    help = 'Seed database dengan data dummy untuk testing (--scale N untuk volume capacity planning)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0,
+                            help='Tambah data sintetis: 1 = 1.000 pasien (100 = 100.000 pasien, 50 dokter, ~1 juta janji)')
+        parser.add_argument('--tahun', type=int, default=3, help='Rentang riwayat transaksi sintetis (tahun)')
+        parser.add_argument('--seed', type=int, default=42, help='Seed random (hasil sama untuk seed sama)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Proses paralel per partisi dokter (PostgreSQL/MySQL; SQLite selalu 1)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Ukuran batch bulk_create')
 
     def handle(self, *args, **options):
         self.stdout.write('🌱 Memulai seeding database...')
@@ -292,7 +302,7 @@ class Command(BaseCommand):
             tanggal=today - timedelta(days=1),
             waktu=time(11, 0),
             keluhan='Nyeri perut bagian kanan',
-            status='completed'
+            status='confirmed'
         )
         
         # Janji 4 - Pending (besok) untuk dokter gigi
@@ -312,7 +322,7 @@ class Command(BaseCommand):
             tanggal=today - timedelta(days=2),
             waktu=time(15, 0),
             keluhan='Kontrol setelah cabut gigi',
-            status='completed'
+            status='confirmed'
         )
         
         # ========== REKAM MEDIS ==========
@@ -329,6 +339,8 @@ class Command(BaseCommand):
             catatan='Pasien disarankan untuk diet lunak dan hindari makanan pedas/asam'
         )
         rekam1.tindakan.add(layanan_list[0])  # Pemeriksaan Umum
+        janji3.status = 'completed'
+        janji3.save()
         
         # Buat resep untuk rekam medis 1
         resep1 = Resep.objects.create(
@@ -363,6 +375,8 @@ class Command(BaseCommand):
             catatan='Sudah boleh makan normal, tetap jaga kebersihan mulut'
         )
         rekam2.tindakan.add(layanan_list[1])  # Pemeriksaan Gigi
+        janji5.status = 'completed'
+        janji5.save()
         
         # Buat resep untuk rekam medis 2
         resep2 = Resep.objects.create(
@@ -381,6 +395,21 @@ class Command(BaseCommand):
         pembayaran2.calculate_total()
         pembayaran2.save()
         
+        # ========== DATA SINTETIS (--scale) ==========
+        if options['scale'] > 0:
+            from core.seeding import seed_skala
+            
+            self.stdout.write(f"📈 Membuat data sintetis skala {options['scale']:g}...")
+            started = time_module.perf_counter()
+            jumlah = seed_skala(
+                options['scale'], tahun=options['tahun'], seed=options['seed'],
+                workers=options['workers'], batch_size=options['batch_size'], log=self.stdout.write
+            )
+            durasi = time_module.perf_counter() - started
+            self.stdout.write(f"   {sum(jumlah.values())} baris dalam {durasi:.0f} detik: " +
+                              ', '.join(f'{tabel} {n}' for tabel, n in jumlah.items()))
+            self.stdout.write('   Pasien sintetis: psn000001.. / pasien123, dokter: dr.sim001.. / dokter123')
+        
         # ========== SUMMARY ==========
         self.stdout.write(self.style.SUCCESS('\n✅ Seeding berhasil!'))
         self.stdout.write('=' * 50)
@@ -0,0 +1,26 @@
+"""
+Management command untuk snapshot stok harian (dijalankan tiap malam)
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.inventory import snapshot_stok
+
+
+class Command(BaseCommand):
+    help = 'Simpan stok semua obat pada akhir hari (default kemarin) ke StokSnapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tanggal', help='Tanggal snapshot (YYYY-MM-DD), default kemarin')
+
+    def handle(self, *args, **options):
+        try:
+            tanggal = date.fromisoformat(options['tanggal']) if options['tanggal'] \
+                else timezone.localdate() - timedelta(days=1)
+        except ValueError as e:
+            raise CommandError(f'Format tanggal tidak valid: {e}')
+
+        self.stdout.write(self.style.WARNING(f'Membuat snapshot stok {tanggal}...'))
+        jumlah = len(snapshot_stok(tanggal))
+        self.stdout.write(self.style.SUCCESS(f'✅ Snapshot stok {jumlah} obat tersimpan'))
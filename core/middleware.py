@@ -0,0 +1,39 @@
+"""
+Middleware core
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import audit
+
+
+class AuditContextMiddleware:
+    """
+    Simpan aktor, IP dan user agent request di contextvar sekali per request
+    sehingga signal audit tidak perlu menerima request dan tidak perlu query
+    untuk aktornya (object_str tetap dari __str__ model, yang bisa memuat
+    relasi). Mendukung WSGI maupun ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = audit.activate(request)
+        try:
+            return self.get_response(request)
+        finally:
+            audit.deactivate(token)
+
+    async def __acall__(self, request):
+        token = audit.activate(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            audit.deactivate(token)
@@ -0,0 +1,75 @@
+# Generated by Django 6.0 on 2026-10-18 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_antrian_counter(apps, schema_editor):
+    """
+    Isi counter dari nomor antrian yang sudah ada, dan beri nomor baru
+    untuk nomor antrian duplikat (hasil race condition generator lama)
+    supaya unique constraint bisa dipasang.
+    """
+    JanjiTemu = apps.get_model('core', 'JanjiTemu')
+    AntrianCounter = apps.get_model('core', 'AntrianCounter')
+
+    seen = {}
+    duplikat = []
+    for janji in JanjiTemu.objects.filter(nomor_antrian__isnull=False).order_by('created_at', 'pk'):
+        key = (janji.dokter_id, janji.tanggal)
+        kode, _, nomor = janji.nomor_antrian.rpartition('-')
+        try:
+            nomor = int(nomor)
+        except ValueError:
+            nomor = 0
+        numbers = seen.setdefault(key, {'last': 0, 'used': set()})
+        numbers['last'] = max(numbers['last'], nomor)
+        if janji.nomor_antrian in numbers['used']:
+            duplikat.append((janji, kode))
+        numbers['used'].add(janji.nomor_antrian)
+
+    for janji, kode in duplikat:
+        numbers = seen[(janji.dokter_id, janji.tanggal)]
+        numbers['last'] += 1
+        janji.nomor_antrian = f"{kode}-{numbers['last']:02d}"
+        janji.save(update_fields=['nomor_antrian'])
+
+    AntrianCounter.objects.bulk_create([
+        AntrianCounter(dokter_id=dokter_id, tanggal=tanggal, last_number=numbers['last'])
+        for (dokter_id, tanggal), numbers in seen.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_change_nomor_antrian_to_char'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AntrianCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tanggal', models.DateField()),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'antrian_counter',
+            },
+        ),
+        migrations.AddField(
+            model_name='antriancounter',
+            name='dokter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='antrian_counter', to='core.dokter'),
+        ),
+        migrations.AddConstraint(
+            model_name='antriancounter',
+            constraint=models.UniqueConstraint(fields=('dokter', 'tanggal'), name='unique_antrian_counter'),
+        ),
+        migrations.RunPython(seed_antrian_counter, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='janjitemu',
+            constraint=models.UniqueConstraint(fields=('dokter', 'tanggal', 'nomor_antrian'), name='unique_nomor_antrian_per_dokter_tanggal'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.0 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+def seed_sequence_counter(apps, schema_editor):
+    """Isi counter dari invoice_number dan no_rm yang sudah ada"""
+    Pembayaran = apps.get_model('core', 'Pembayaran')
+    Pasien = apps.get_model('core', 'Pasien')
+    SequenceCounter = apps.get_model('core', 'SequenceCounter')
+
+    last_values = {}
+
+    def track(name, value):
+        try:
+            value = int(value)
+        except ValueError:
+            return
+        last_values[name] = max(last_values.get(name, 0), value)
+
+    # INV-YYYYMMDD-XXXX
+    for invoice_number in Pembayaran.objects.values_list('invoice_number', flat=True):
+        prefix, _, nomor = invoice_number.rpartition('-')
+        if prefix:
+            track(prefix, nomor)
+
+    # RMYYYY + 5 digit
+    for no_rm in Pasien.objects.values_list('no_rm', flat=True):
+        if len(no_rm) > 6:
+            track(no_rm[:6], no_rm[6:])
+
+    SequenceCounter.objects.bulk_create([
+        SequenceCounter(name=name, last_value=value)
+        for name, value in last_values.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_antrian_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'sequence_counter',
+            },
+        ),
+        migrations.RunPython(seed_sequence_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-18 12:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_revenue_rollup(apps, schema_editor):
+    """Isi rollup dari pembayaran lunas yang sudah ada (sama dengan rebuild_rollups)"""
+    Pembayaran = apps.get_model('core', 'Pembayaran')
+    DailyRevenueRollup = apps.get_model('core', 'DailyRevenueRollup')
+
+    rows = Pembayaran.objects.filter(
+        status='lunas', tanggal_bayar__isnull=False
+    ).annotate(
+        tanggal=TruncDate('tanggal_bayar')
+    ).values('tanggal', 'metode', 'janji_temu__dokter').annotate(
+        jumlah_transaksi=Count('id'),
+        sum_total_biaya=Sum('total_biaya'),
+        sum_biaya_konsultasi=Sum('biaya_konsultasi'),
+        sum_biaya_obat=Sum('biaya_obat'),
+        sum_biaya_tindakan=Sum('biaya_tindakan'),
+    ).order_by()
+
+    DailyRevenueRollup.objects.bulk_create([
+        DailyRevenueRollup(
+            tanggal=row['tanggal'],
+            metode=row['metode'],
+            dokter_id=row['janji_temu__dokter'],
+            jumlah_transaksi=row['jumlah_transaksi'],
+            total_biaya=row['sum_total_biaya'],
+            biaya_konsultasi=row['sum_biaya_konsultasi'],
+            biaya_obat=row['sum_biaya_obat'],
+            biaya_tindakan=row['sum_biaya_tindakan'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_sequence_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tanggal', models.DateField()),
+                ('metode', models.CharField(choices=[('tunai', 'Tunai'), ('transfer', 'Transfer Bank'), ('asuransi', 'Asuransi'), ('qris', 'QRIS')], max_length=20)),
+                ('jumlah_transaksi', models.IntegerField(default=0)),
+                ('total_biaya', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('biaya_konsultasi', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('biaya_obat', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('biaya_tindakan', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('dokter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollup', to='core.dokter')),
+            ],
+            options={
+                'db_table': 'daily_revenue_rollup',
+                'ordering': ['-tanggal'],
+                'constraints': [models.UniqueConstraint(fields=('tanggal', 'metode', 'dokter'), name='unique_daily_revenue_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_revenue_rollup, migrations.RunPython.noop),
+    ]
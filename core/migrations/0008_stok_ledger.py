@@ -0,0 +1,60 @@
+# Generated by Django 6.0 on 2026-10-18 12:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_saldo_awal(apps, schema_editor):
+    """Mutasi saldo awal untuk stok yang sudah ada, supaya ledger sama dengan Obat.stok"""
+    Obat = apps.get_model('core', 'Obat')
+    StokMovement = apps.get_model('core', 'StokMovement')
+
+    StokMovement.objects.bulk_create([
+        StokMovement(obat_id=obat_id, tipe='awal', jumlah=stok, stok_setelah=stok)
+        for obat_id, stok in Obat.objects.values_list('id', 'stok')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_daily_revenue_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StokMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipe', models.CharField(choices=[('awal', 'Saldo Awal'), ('resep', 'Resep Diserahkan'), ('adjustment', 'Stok Adjustment'), ('restock', 'Restock'), ('koreksi', 'Koreksi Data Obat')], max_length=20)),
+                ('jumlah', models.IntegerField()),
+                ('stok_setelah', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('adjustment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stok_movements', to='core.stokadjustment')),
+                ('obat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stok_movements', to='core.obat')),
+                ('resep', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stok_movements', to='core.resep')),
+            ],
+            options={
+                'db_table': 'stok_movement',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['obat', 'created_at'], name='stok_moveme_obat_id_da32b2_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StokSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tanggal', models.DateField()),
+                ('stok', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('obat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stok_snapshots', to='core.obat')),
+            ],
+            options={
+                'db_table': 'stok_snapshot',
+                'ordering': ['-tanggal'],
+                'constraints': [models.UniqueConstraint(fields=('obat', 'tanggal'), name='unique_stok_snapshot')],
+            },
+        ),
+        migrations.RunPython(seed_saldo_awal, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-18 12:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_lot_default(apps, schema_editor):
+    """Stok yang sudah ada menjadi lot default dengan expired_date obat"""
+    Obat = apps.get_model('core', 'Obat')
+    ObatLot = apps.get_model('core', 'ObatLot')
+
+    ObatLot.objects.bulk_create([
+        ObatLot(obat_id=obat_id, nomor_lot='', expired_date=expired_date, jumlah=stok)
+        for obat_id, expired_date, stok in Obat.objects.filter(stok__gt=0).values_list('id', 'expired_date', 'stok')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_stok_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ObatLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nomor_lot', models.CharField(blank=True, max_length=50)),
+                ('expired_date', models.DateField(blank=True, null=True)),
+                ('jumlah', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('obat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='core.obat')),
+            ],
+            options={
+                'db_table': 'obat_lot',
+                'ordering': ['obat', 'expired_date'],
+                'indexes': [models.Index(fields=['obat', 'expired_date'], name='obat_lot_fefo_idx'), models.Index(condition=models.Q(('jumlah__gt', 0)), fields=['expired_date'], name='obat_lot_expiry_idx')],
+                'constraints': [models.UniqueConstraint(fields=('obat', 'nomor_lot'), name='unique_obat_lot'), models.CheckConstraint(condition=models.Q(('jumlah__gte', 0)), name='obat_lot_jumlah_non_negatif')],
+            },
+        ),
+        migrations.RunPython(seed_lot_default, migrations.RunPython.noop),
+    ]
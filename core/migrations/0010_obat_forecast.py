@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_obat_lot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ObatForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rata_rata_7_hari', models.FloatField(default=0)),
+                ('rata_rata_28_hari', models.FloatField(default=0)),
+                ('std_harian', models.FloatField(default=0)),
+                ('kebutuhan_harian', models.FloatField(default=0, help_text='Laju pemakaian yang dipakai untuk reorder point')),
+                ('lead_time_hari', models.PositiveIntegerField()),
+                ('safety_stock', models.PositiveIntegerField(default=0)),
+                ('reorder_point', models.PositiveIntegerField(default=0)),
+                ('dihitung_at', models.DateTimeField()),
+                ('obat', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='forecast', to='core.obat')),
+            ],
+            options={
+                'db_table': 'obat_forecast',
+            },
+        ),
+    ]
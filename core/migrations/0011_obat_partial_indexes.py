@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_obat_forecast'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='obat',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['stok'], name='obat_aktif_stok_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_obat_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='janjitemu',
+            index=models.Index(fields=['tanggal', 'status'], name='janji_tanggal_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pembayaran',
+            index=models.Index(fields=['status', 'tanggal_bayar'], name='pembayaran_status_bayar_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pembayaran',
+            index=models.Index(fields=['status', '-created_at'], name='pembayaran_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rekammedis',
+            index=models.Index(fields=['dokter', '-tanggal_periksa'], name='rekam_medis_dokter_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rekammedis',
+            index=models.Index(fields=['pasien', '-tanggal_periksa'], name='rekam_medis_pasien_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resep',
+            index=models.Index(fields=['status', 'processed_at'], name='resep_status_processed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resep',
+            index=models.Index(fields=['status', '-tanggal_resep'], name='resep_status_tanggal_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-18 14:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_notifikasi_unread(apps, schema_editor):
+    """Isi counter dari notifikasi belum dibaca yang sudah ada (sama dengan rekonsiliasi_notifikasi)"""
+    Notifikasi = apps.get_model('core', 'Notifikasi')
+    NotifikasiUnread = apps.get_model('core', 'NotifikasiUnread')
+
+    rows = Notifikasi.objects.filter(is_read=False).values('user').annotate(jumlah=Count('id')).order_by()
+    NotifikasiUnread.objects.bulk_create([
+        NotifikasiUnread(user_id=row['user'], jumlah=row['jumlah']) for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotifikasiUnread',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notifikasi_unread', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('jumlah', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'notifikasi_unread',
+            },
+        ),
+        migrations.RunPython(backfill_notifikasi_unread, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 6.0 on 2026-10-18 15:10
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SQLITE_FTS = [
+    # External content: teks disimpan sekali di pasien_search, FTS5 hanya index-nya
+    """CREATE VIRTUAL TABLE pasien_fts USING fts5(
+        nama, content='pasien_search', content_rowid='pasien_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER pasien_search_ai AFTER INSERT ON pasien_search BEGIN
+        INSERT INTO pasien_fts(rowid, nama) VALUES (new.pasien_id, new.nama);
+    END""",
+    """CREATE TRIGGER pasien_search_ad AFTER DELETE ON pasien_search BEGIN
+        INSERT INTO pasien_fts(pasien_fts, rowid, nama) VALUES ('delete', old.pasien_id, old.nama);
+    END""",
+    """CREATE TRIGGER pasien_search_au AFTER UPDATE ON pasien_search BEGIN
+        INSERT INTO pasien_fts(pasien_fts, rowid, nama) VALUES ('delete', old.pasien_id, old.nama);
+        INSERT INTO pasien_fts(rowid, nama) VALUES (new.pasien_id, new.nama);
+    END""",
+]
+
+SQLITE_FTS_DROP = [
+    'DROP TRIGGER IF EXISTS pasien_search_au',
+    'DROP TRIGGER IF EXISTS pasien_search_ad',
+    'DROP TRIGGER IF EXISTS pasien_search_ai',
+    'DROP TABLE IF EXISTS pasien_fts',
+]
+
+POSTGRES_TRIGRAM = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX pasien_search_nama_trgm ON pasien_search USING gin (nama gin_trgm_ops)',
+]
+
+
+def normalisasi_telepon(value):
+    """Sama dengan core.search.normalisasi_telepon"""
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith('62'):
+        return '0' + digits[2:]
+    if digits.startswith('8'):
+        return '0' + digits
+    return digits
+
+
+def create_search_index(apps, schema_editor):
+    """Index teks per database, lalu isi dari pasien yang sudah ada (sama dengan rebuild_search)"""
+    vendor = schema_editor.connection.vendor
+    for sql in SQLITE_FTS if vendor == 'sqlite' else POSTGRES_TRIGRAM if vendor == 'postgresql' else []:
+        schema_editor.execute(sql)
+
+    Pasien = apps.get_model('core', 'Pasien')
+    PasienSearch = apps.get_model('core', 'PasienSearch')
+    rows = Pasien.objects.values_list('pk', 'user__first_name', 'user__last_name', 'user__phone')
+    PasienSearch.objects.bulk_create([
+        PasienSearch(
+            pasien_id=pk,
+            nama=' '.join(filter(None, [first_name, last_name])).lower(),
+            telepon=normalisasi_telepon(phone),
+        )
+        for pk, first_name, last_name, phone in rows.iterator()
+    ], batch_size=1000)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_FTS_DROP:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_notifikasi_unread'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PasienSearch',
+            fields=[
+                ('pasien', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='core.pasien')),
+                ('nama', models.CharField(max_length=301)),
+                ('telepon', models.CharField(blank=True, max_length=20)),
+            ],
+            options={
+                'db_table': 'pasien_search',
+                'indexes': [models.Index(fields=['telepon'], name='pasien_search_telepon_idx')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
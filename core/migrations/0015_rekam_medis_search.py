@@ -0,0 +1,172 @@
+# Generated by Django 6.0 on 2026-10-18 16:20
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+FIELDS = ('diagnosa', 'anamnesa', 'pemeriksaan_fisik', 'catatan')
+
+SQLITE_FTS = [
+    # External content atas rekam_medis_search (teks ternormalisasi, lihat core/search.py)
+    """CREATE VIRTUAL TABLE rekam_medis_fts USING fts5(
+        diagnosa, anamnesa, pemeriksaan_fisik, catatan,
+        content='rekam_medis_search', content_rowid='rekam_medis_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='3'
+    )""",
+    """CREATE TRIGGER rekam_medis_search_ai AFTER INSERT ON rekam_medis_search BEGIN
+        INSERT INTO rekam_medis_fts(rowid, diagnosa, anamnesa, pemeriksaan_fisik, catatan)
+        VALUES (new.rekam_medis_id, new.diagnosa, new.anamnesa, new.pemeriksaan_fisik, new.catatan);
+    END""",
+    """CREATE TRIGGER rekam_medis_search_ad AFTER DELETE ON rekam_medis_search BEGIN
+        INSERT INTO rekam_medis_fts(rekam_medis_fts, rowid, diagnosa, anamnesa, pemeriksaan_fisik, catatan)
+        VALUES ('delete', old.rekam_medis_id, old.diagnosa, old.anamnesa, old.pemeriksaan_fisik, old.catatan);
+    END""",
+    """CREATE TRIGGER rekam_medis_search_au AFTER UPDATE ON rekam_medis_search BEGIN
+        INSERT INTO rekam_medis_fts(rekam_medis_fts, rowid, diagnosa, anamnesa, pemeriksaan_fisik, catatan)
+        VALUES ('delete', old.rekam_medis_id, old.diagnosa, old.anamnesa, old.pemeriksaan_fisik, old.catatan);
+        INSERT INTO rekam_medis_fts(rowid, diagnosa, anamnesa, pemeriksaan_fisik, catatan)
+        VALUES (new.rekam_medis_id, new.diagnosa, new.anamnesa, new.pemeriksaan_fisik, new.catatan);
+    END""",
+]
+
+SQLITE_FTS_DROP = [
+    'DROP TRIGGER IF EXISTS rekam_medis_search_au',
+    'DROP TRIGGER IF EXISTS rekam_medis_search_ad',
+    'DROP TRIGGER IF EXISTS rekam_medis_search_ai',
+    'DROP TABLE IF EXISTS rekam_medis_fts',
+]
+
+
+# Normalisasi teks disalin dari core/search.py (migrasi tidak boleh bergantung pada
+# kode aplikasi yang bisa berubah). Jika normalisasi di core/search.py diubah,
+# bangun ulang index dengan: python manage.py rebuild_search --index rekam_medis
+
+# Singkatan klinis yang umum ditulis dokter; kepanjangannya ikut di-index
+SINGKATAN = {
+    'ispa': 'infeksi saluran pernapasan akut',
+    'isk': 'infeksi saluran kemih',
+    'ht': 'hipertensi',
+    'dm': 'diabetes melitus',
+    'dbd': 'demam berdarah dengue',
+    'tb': 'tuberkulosis',
+    'tbc': 'tuberkulosis',
+    'gerd': 'gastroesophageal reflux disease',
+    'ppok': 'penyakit paru obstruktif kronik',
+    'chf': 'gagal jantung kongestif',
+    'ckd': 'penyakit ginjal kronik',
+    'td': 'tekanan darah',
+    'hb': 'hemoglobin',
+}
+
+# Ejaan tidak baku yang diseragamkan sebelum di-index dan dicari
+EJAAN = {
+    'nafas': 'napas',
+    'pernafasan': 'pernapasan',
+    'sesek': 'sesak',
+    'mellitus': 'melitus',
+    'hypertensi': 'hipertensi',
+}
+
+PARTIKEL = ('lah', 'kah', 'tah', 'pun')
+KATA_GANTI = ('nya', 'ku', 'mu')
+AKHIRAN = ('kan', 'an', 'i')
+# (awalan, huruf awal kata dasar yang luluh): menyakiti -> sakit, mengeluh -> keluh,
+# memeriksa -> periksa, menular -> tular; awalan tanpa peluluhan cukup dibuang
+AWALAN = (
+    ('meny', 's'), ('peny', 's'), ('meng', 'k'), ('peng', 'k'), ('mem', 'p'), ('pem', 'p'),
+    ('men', 't'), ('pen', 't'), ('ber', ''), ('ter', ''), ('per', ''),
+    ('me', ''), ('pe', ''), ('di', ''), ('ke', ''), ('se', ''),
+)
+VOKAL = 'aiueo'
+# Kata dasar tidak dipotong lebih pendek dari ini (ISPA, batuk, mual tetap utuh)
+PANJANG_DASAR = 4
+
+
+def kata_dasar(kata):
+    """
+    Kandidat kata dasar (stemmer Indonesia ringan: partikel, kata ganti,
+    akhiran, lalu awalan). Peluluhan ambigu menghasilkan dua kandidat
+    (mengeluh -> eluh, keluh). Tidak harus sempurna secara linguistik: yang
+    penting konsisten antara teks yang di-index dan kata yang dicari.
+    """
+    for daftar in (PARTIKEL, KATA_GANTI, AKHIRAN):
+        for akhiran in daftar:
+            if kata.endswith(akhiran) and len(kata) - len(akhiran) >= PANJANG_DASAR:
+                kata = kata[:-len(akhiran)]
+                break
+    for awalan, luluh in AWALAN:
+        sisa = kata[len(awalan):]
+        if kata.startswith(awalan) and len(sisa) >= PANJANG_DASAR:
+            if awalan in ('meny', 'peny'):
+                return {luluh + sisa}
+            if luluh and sisa[0] in VOKAL:
+                return {sisa, luluh + sisa}
+            return {sisa}
+    return {kata}
+
+
+def _kata(teks):
+    return [EJAAN.get(kata, kata) for kata in re.findall(r'\w+', (teks or '').lower())]
+
+
+def _kepanjangan(kata):
+    """Kata dasar kepanjangan singkatan, berurutan ([] jika bukan singkatan)"""
+    return [min(kata_dasar(k)) for k in SINGKATAN.get(kata, '').split()]
+
+
+def normalisasi_klinis(teks):
+    """Salinan core.search.normalisasi_klinis saat migrasi ini dibuat"""
+    hasil = []
+    for kata in _kata(teks):
+        hasil.append(kata)
+        hasil.extend(sorted(kata_dasar(kata) - {kata}))
+        hasil.extend(_kepanjangan(kata))
+    return ' '.join(hasil)
+
+
+def create_search_index(apps, schema_editor):
+    """FTS5 (SQLite), lalu isi dari rekam medis yang sudah ada (sama dengan rebuild_search)"""
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_FTS:
+            schema_editor.execute(sql)
+
+    RekamMedis = apps.get_model('core', 'RekamMedis')
+    RekamMedisSearch = apps.get_model('core', 'RekamMedisSearch')
+    RekamMedisSearch.objects.bulk_create([
+        RekamMedisSearch(rekam_medis_id=row[0], **{
+            field: normalisasi_klinis(value) for field, value in zip(FIELDS, row[1:])
+        })
+        for row in RekamMedis.objects.values_list('pk', *FIELDS).iterator()
+    ], batch_size=1000)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_FTS_DROP:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_pasien_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RekamMedisSearch',
+            fields=[
+                ('rekam_medis', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='core.rekammedis')),
+                ('diagnosa', models.TextField(blank=True)),
+                ('anamnesa', models.TextField(blank=True)),
+                ('pemeriksaan_fisik', models.TextField(blank=True)),
+                ('catatan', models.TextField(blank=True)),
+            ],
+            options={
+                'db_table': 'rekam_medis_search',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 17:05
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def cek_slot_ganda(apps, schema_editor):
+    """Gagal dengan pesan jelas jika data lama sudah punya dua janji aktif di slot yang sama"""
+    JanjiTemu = apps.get_model('core', 'JanjiTemu')
+    ganda = list(
+        JanjiTemu.objects.exclude(status='cancelled')
+        .values('dokter_id', 'tanggal', 'waktu').annotate(n=Count('id')).filter(n__gt=1)
+        .order_by('tanggal', 'waktu')[:20]
+    )
+    if ganda:
+        daftar = ', '.join(f"dokter {row['dokter_id']} {row['tanggal']} {row['waktu']}" for row in ganda)
+        raise RuntimeError(
+            'Ada janji temu aktif ganda di slot yang sama; jadwal ulang atau batalkan '
+            f'salah satunya sebelum migrasi: {daftar}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_rekam_medis_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(cek_slot_ganda, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='janjitemu',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'cancelled'), _negated=True), fields=('dokter', 'tanggal', 'waktu'), name='unique_slot_aktif_per_dokter_tanggal'),
+        ),
+    ]
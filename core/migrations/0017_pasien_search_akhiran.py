@@ -0,0 +1,73 @@
+# Generated by Django 6.0 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+# SQLite membuat ulang tabel pasien_search saat AddField/RemoveField sehingga
+# trigger FTS5 dari migrasi 0014 ikut hilang; dipasang kembali (sama dengan 0014)
+SQLITE_TRIGGER = [
+    'DROP TRIGGER IF EXISTS pasien_search_ai',
+    'DROP TRIGGER IF EXISTS pasien_search_ad',
+    'DROP TRIGGER IF EXISTS pasien_search_au',
+    """CREATE TRIGGER pasien_search_ai AFTER INSERT ON pasien_search BEGIN
+        INSERT INTO pasien_fts(rowid, nama) VALUES (new.pasien_id, new.nama);
+    END""",
+    """CREATE TRIGGER pasien_search_ad AFTER DELETE ON pasien_search BEGIN
+        INSERT INTO pasien_fts(pasien_fts, rowid, nama) VALUES ('delete', old.pasien_id, old.nama);
+    END""",
+    """CREATE TRIGGER pasien_search_au AFTER UPDATE ON pasien_search BEGIN
+        INSERT INTO pasien_fts(pasien_fts, rowid, nama) VALUES ('delete', old.pasien_id, old.nama);
+        INSERT INTO pasien_fts(rowid, nama) VALUES (new.pasien_id, new.nama);
+    END""",
+]
+
+
+def pasang_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_TRIGGER:
+            schema_editor.execute(sql)
+
+
+def isi_kolom_balik(apps, schema_editor):
+    """Isi kolom terbalik dari baris index yang sudah ada (sama dengan core.search._baris_index)"""
+    PasienSearch = apps.get_model('core', 'PasienSearch')
+    batch = []
+    for baris in PasienSearch.objects.only('pk', 'telepon', 'pasien__no_rm').select_related('pasien').iterator(chunk_size=1000):
+        baris.telepon_balik = baris.telepon[::-1]
+        baris.no_rm_balik = baris.pasien.no_rm[::-1]
+        batch.append(baris)
+        if len(batch) == 1000:
+            PasienSearch.objects.bulk_update(batch, ['telepon_balik', 'no_rm_balik'])
+            batch = []
+    PasienSearch.objects.bulk_update(batch, ['telepon_balik', 'no_rm_balik'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_janji_temu_slot_unik'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, pasang_trigger),
+        migrations.AddField(
+            model_name='pasiensearch',
+            name='telepon_balik',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='pasiensearch',
+            name='no_rm_balik',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.RunPython(pasang_trigger, migrations.RunPython.noop),
+        migrations.RunPython(isi_kolom_balik, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='pasiensearch',
+            index=models.Index(fields=['telepon_balik'], name='pasien_search_telp_balik_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pasiensearch',
+            index=models.Index(fields=['no_rm_balik'], name='pasien_search_rm_balik_idx'),
+        ),
+    ]
@@ -1,11 +1,76 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Prefetch, Subquery, F, Count, Sum
+from django.db.models.functions import TruncDate
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
+from datetime import datetime, time
+import threading
 import uuid
 
 
+class SequenceCounter(models.Model):
+    """Counter bernama untuk nomor dokumen (INV-YYYYMMDD, RMYYYY, ...)"""
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    # Blok nomor yang sudah dipesan oleh worker ini: {name: [next_value, last_value]}
+    _blocks = {}
+    _blocks_lock = threading.Lock()
+    
+    class Meta:
+        db_table = 'sequence_counter'
+    
+    def __str__(self):
+        return f"{self.name} ({self.last_value})"
+    
+    @classmethod
+    def next_value(cls, name, block_size=None):
+        """
+        Ambil nilai berikutnya dari sequence `name` secara atomic.
+        
+        Dengan block_size > 1 (default dari settings.SEQUENCE_BLOCK_SIZE), worker
+        memesan satu blok nomor sekaligus dan membagikan sisanya dari memori,
+        sehingga insert berikutnya tidak menyentuh tabel counter sama sekali.
+        Sisa blok baru dipakai setelah transaksi pemesanan commit, jadi rollback
+        tidak pernah membuat nomor yang sama dibagikan dua kali.
+        """
+        if block_size is None:
+            block_size = getattr(settings, 'SEQUENCE_BLOCK_SIZE', 1)
+        
+        with cls._blocks_lock:
+            block = cls._blocks.get(name)
+            if block:
+                value = block[0]
+                if value >= block[1]:
+                    del cls._blocks[name]
+                else:
+                    block[0] += 1
+                return value
+        
+        start = cls.reserve(name, block_size)
+        if block_size > 1:
+            transaction.on_commit(lambda: cls._store_block(name, start + 1, start + block_size - 1))
+        return start
+    
+    @classmethod
+    def reserve(cls, name, count):
+        """Pesan `count` nomor berurutan dari sequence `name` secara atomic; kembalikan nomor pertama"""
+        with transaction.atomic():
+            counter, _ = cls.objects.select_for_update().get_or_create(name=name)
+            cls.objects.filter(pk=counter.pk).update(last_value=F('last_value') + count)
+            counter.refresh_from_db(fields=['last_value'])
+        return counter.last_value - count + 1
+    
+    @classmethod
+    def _store_block(cls, name, start, end):
+        with cls._blocks_lock:
+            cls._blocks[name] = [start, end]
+
+
 class CustomUser(AbstractUser):
     """Custom User model dengan 6 roles"""
     ROLE_CHOICES = [
@@ -89,17 +154,42 @@ class Pasien(models.Model):
         return f"{self.no_rm} - {self.user.get_full_name()}"
     
     def save(self, *args, **kwargs):
-        if not self.no_rm:
+        if self.no_rm:
+            super().save(*args, **kwargs)
+            return
+        
+        with transaction.atomic():
             # Auto-generate no_rm: RM + tahun + 5 digit increment
-            year = timezone.now().year
-            last_pasien = Pasien.objects.filter(no_rm__startswith=f'RM{year}').order_by('-no_rm').first()
-            if last_pasien:
-                last_number = int(last_pasien.no_rm[-5:])
-                new_number = last_number + 1
-            else:
-                new_number = 1
-            self.no_rm = f'RM{year}{new_number:05d}'
-        super().save(*args, **kwargs)
+            prefix = f'RM{timezone.now().year}'
+            self.no_rm = f'{prefix}{SequenceCounter.next_value(prefix):05d}'
+            super().save(*args, **kwargs)
+
+
+class PasienSearch(models.Model):
+    """
+    Index pencarian pasien: nama (lowercase) dan telepon ternormalisasi,
+    disinkronkan dari signal CustomUser/Pasien. Kolom nama di-index FTS5
+    (SQLite) atau trigram (PostgreSQL) oleh migrasi 0014, lihat core/search.py.
+    Telepon dan no RM juga disimpan terbalik agar pencarian digit terakhir
+    (nomor urut RM, ekor nomor HP) tetap berupa range scan prefix.
+    """
+    pasien = models.OneToOneField(Pasien, on_delete=models.CASCADE, primary_key=True, related_name='search_index')
+    nama = models.CharField(max_length=301)
+    telepon = models.CharField(max_length=20, blank=True)
+    telepon_balik = models.CharField(max_length=20, blank=True)
+    no_rm_balik = models.CharField(max_length=20, blank=True)
+    
+    class Meta:
+        db_table = 'pasien_search'
+        indexes = [
+            # Prefix telepon sebagai range scan (telepon >= awalan AND < awalan + U+FFFF)
+            models.Index(fields=['telepon'], name='pasien_search_telepon_idx'),
+            models.Index(fields=['telepon_balik'], name='pasien_search_telp_balik_idx'),
+            models.Index(fields=['no_rm_balik'], name='pasien_search_rm_balik_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.pasien_id}: {self.nama}"
 
 
 class Resepsionis(models.Model):
@@ -181,6 +271,21 @@ class LayananTindakan(models.Model):
         return f"{self.nama_tindakan} - Rp {self.biaya:,.0f}"
 
 
+class JanjiTemuQuerySet(models.QuerySet):
+    """QuerySet Janji Temu dengan query plan untuk endpoint API"""
+    
+    def for_api(self):
+        """
+        Eager-load relasi yang dibaca JanjiTemuSerializer (pasien.user, dokter.user)
+        dan annotate flag rekam_medis/pembayaran supaya jumlah query konstan
+        berapapun jumlah baris yang dikembalikan.
+        """
+        return self.select_related('pasien__user', 'dokter__user').annotate(
+            rekam_medis_exists=Exists(RekamMedis.objects.filter(janji_temu=OuterRef('pk'))),
+            pembayaran_exists=Exists(Pembayaran.objects.filter(janji_temu=OuterRef('pk'))),
+        )
+
+
 class JanjiTemu(models.Model):
     """Model Janji Temu (Appointment)"""
     STATUS_CHOICES = [
@@ -201,14 +306,44 @@ class JanjiTemu(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = JanjiTemuQuerySet.as_manager()
+    
     class Meta:
         db_table = 'janji_temu'
         verbose_name_plural = 'Janji Temu'
         ordering = ['-tanggal', 'waktu']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dokter', 'tanggal', 'nomor_antrian'],
+                name='unique_nomor_antrian_per_dokter_tanggal'
+            ),
+            # Satu janji temu aktif per slot; yang dibatalkan membebaskan slotnya
+            models.UniqueConstraint(
+                fields=['dokter', 'tanggal', 'waktu'],
+                condition=~models.Q(status='cancelled'),
+                name='unique_slot_aktif_per_dokter_tanggal'
+            ),
+        ]
+        # Akses per dokter (+ tanggal) sudah dilayani index constraint di atas
+        indexes = [
+            # Antrian & janji hari ini semua dokter, filter status resepsionis
+            models.Index(fields=['tanggal', 'status'], name='janji_tanggal_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.pasien.user.get_full_name()} - Dr. {self.dokter.user.get_full_name()} ({self.tanggal})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Status saat dimuat, supaya delta live antrian tahu transisinya
+        if 'status' in field_names:
+            instance._status_awal = instance.status
+        # Slot yang ditempati saat dimuat, supaya cache slot lama ikut dihapus saat dijadwal ulang
+        if 'dokter_id' in field_names and 'tanggal' in field_names:
+            instance._slot_awal = (instance.dokter_id, instance.tanggal)
+        return instance
+    
     def _generate_kode_dokter(self):
         """Generate kode dokter dari 3 huruf pertama nama"""
         nama = self.dokter.user.first_name.upper()
@@ -217,29 +352,79 @@ class JanjiTemu(models.Model):
         return kode
     
     def save(self, *args, **kwargs):
-        if not self.nomor_antrian:
-            # Generate kode dokter
-            kode_dokter = self._generate_kode_dokter()
-            
-            # Auto-generate nomor_antrian per dokter per tanggal dengan format KODE-NN
-            last_antrian = JanjiTemu.objects.filter(
-                dokter=self.dokter,
-                tanggal=self.tanggal,
-                nomor_antrian__isnull=False
-            ).exclude(pk=self.pk).order_by('-nomor_antrian').first()
-            
-            if last_antrian and last_antrian.nomor_antrian:
-                # Extract number from format like "SIT-01"
-                try:
-                    last_number = int(last_antrian.nomor_antrian.split('-')[1])
-                    new_number = last_number + 1
-                except (IndexError, ValueError):
-                    new_number = 1
-            else:
-                new_number = 1
-            
-            self.nomor_antrian = f"{kode_dokter}-{new_number:02d}"
-        super().save(*args, **kwargs)
+        # Dijadwal ulang ke dokter/tanggal lain: nomor lama milik antrian lama
+        # (bisa bentrok di antrian baru dan berprefix dokter lama), ambil nomor baru
+        slot_awal = getattr(self, '_slot_awal', None)
+        if self.nomor_antrian and slot_awal not in (None, (self.dokter_id, self.tanggal)):
+            self.nomor_antrian = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'nomor_antrian'}
+        
+        if self.nomor_antrian:
+            super().save(*args, **kwargs)
+        else:
+            # Nomor antrian dan insert janji temu harus commit bersama,
+            # supaya nomor yang gagal disimpan ikut di-rollback
+            with transaction.atomic():
+                # Auto-generate nomor_antrian per dokter per tanggal dengan format KODE-NN
+                new_number = AntrianCounter.next_number(self.dokter, self.tanggal)
+                self.nomor_antrian = f"{self._generate_kode_dokter()}-{new_number:02d}"
+                super().save(*args, **kwargs)
+        # Dibaca signal post_save (yang berjalan di dalam super().save()) sebagai posisi sebelumnya
+        self._slot_awal = (self.dokter_id, self.tanggal)
+
+
+class AntrianCounter(models.Model):
+    """Counter nomor antrian per dokter per tanggal"""
+    dokter = models.ForeignKey(Dokter, on_delete=models.CASCADE, related_name='antrian_counter')
+    tanggal = models.DateField()
+    last_number = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'antrian_counter'
+        constraints = [
+            models.UniqueConstraint(fields=['dokter', 'tanggal'], name='unique_antrian_counter'),
+        ]
+    
+    def __str__(self):
+        return f"{self.dokter} - {self.tanggal} ({self.last_number})"
+    
+    @classmethod
+    def next_number(cls, dokter, tanggal):
+        """
+        Ambil nomor antrian berikutnya secara atomic.
+        Row counter dikunci dengan select_for_update dan dinaikkan dengan F(),
+        sehingga dua booking bersamaan tidak pernah mendapat nomor yang sama.
+        Di SQLite (tanpa row lock) transaksi dibuka BEGIN IMMEDIATE, lihat
+        DATABASES di settings: booking kedua menunggu, bukan gagal.
+        """
+        with transaction.atomic():
+            counter, _ = cls.objects.select_for_update().get_or_create(dokter=dokter, tanggal=tanggal)
+            cls.objects.filter(pk=counter.pk).update(last_number=F('last_number') + 1)
+            counter.refresh_from_db(fields=['last_number'])
+        return counter.last_number
+
+
+class RekamMedisQuerySet(models.QuerySet):
+    """QuerySet Rekam Medis dengan query plan untuk endpoint API"""
+    
+    def for_api(self):
+        """
+        Eager-load seluruh pohon yang dibaca RekamMedisSerializer: pasien/dokter,
+        janji_temu (beserta pembayaran), tindakan, dan resep -> detail_resep -> obat.
+        Resep yang di-prefetch otomatis menunjuk balik ke rekam medis induknya,
+        sehingga pasien_nama/dokter_nama tidak memicu query tambahan.
+        """
+        return self.select_related(
+            'pasien__user',
+            'dokter__user',
+            'janji_temu__pasien__user',
+            'janji_temu__dokter__user',
+            'janji_temu__pembayaran',
+        ).prefetch_related(
+            Prefetch('tindakan', queryset=LayananTindakan.objects.all()),
+            Prefetch('resep', queryset=Resep.objects.with_detail()),
+        )
 
 
 class RekamMedis(models.Model):
@@ -259,6 +444,8 @@ class RekamMedis(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = RekamMedisQuerySet.as_manager()
+    
     class Meta:
         db_table = 'rekam_medis'
         verbose_name_plural = 'Rekam Medis'
@@ -271,6 +458,11 @@ class RekamMedis(models.Model):
                 name='unique_rekam_medis_per_janji'
             )
         ]
+        indexes = [
+            # Riwayat rekam medis per dokter / per pasien, urut terbaru
+            models.Index(fields=['dokter', '-tanggal_periksa'], name='rekam_medis_dokter_idx'),
+            models.Index(fields=['pasien', '-tanggal_periksa'], name='rekam_medis_pasien_idx'),
+        ]
     
     def __str__(self):
         return f"RM - {self.pasien.user.get_full_name()} ({self.tanggal_periksa.strftime('%Y-%m-%d')})"
@@ -306,6 +498,27 @@ class RekamMedis(models.Model):
         super().save(*args, **kwargs)
 
 
+class RekamMedisSearch(models.Model):
+    """
+    Index teks klinis rekam medis: diagnosa, anamnesa, pemeriksaan fisik dan
+    catatan yang sudah dinormalisasi (kata asli + kata dasar + kepanjangan
+    singkatan), di-index FTS5 oleh migrasi 0015, lihat core/search.py
+    """
+    rekam_medis = models.OneToOneField(
+        RekamMedis, on_delete=models.CASCADE, primary_key=True, related_name='search_index'
+    )
+    diagnosa = models.TextField(blank=True)
+    anamnesa = models.TextField(blank=True)
+    pemeriksaan_fisik = models.TextField(blank=True)
+    catatan = models.TextField(blank=True)
+    
+    class Meta:
+        db_table = 'rekam_medis_search'
+    
+    def __str__(self):
+        return f"{self.rekam_medis_id}: {self.diagnosa[:50]}"
+
+
 class Obat(models.Model):
     """Model Obat"""
     KATEGORI_CHOICES = [
@@ -344,6 +557,10 @@ class Obat(models.Model):
     class Meta:
         db_table = 'obat'
         verbose_name_plural = 'Obat'
+        indexes = [
+            # Laporan stok menipis hanya melihat obat aktif (kedaluwarsa lewat obat_lot_expiry_idx)
+            models.Index(fields=['stok'], name='obat_aktif_stok_idx', condition=models.Q(is_active=True)),
+        ]
     
     def __str__(self):
         return f"{self.nama} (Stok: {self.stok})"
@@ -370,12 +587,37 @@ class Obat(models.Model):
             return delta.days
         return None
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Expired date saat dimuat, supaya perubahan manual bisa diteruskan ke lot default
+        if 'expired_date' in field_names:
+            instance._expired_awal = instance.expired_date
+        return instance
+    
     # PHASE 1: Validasi expired
     def clean(self):
         if self.is_expired:
             raise ValidationError(f"Obat {self.nama} sudah kadaluarsa pada {self.expired_date}")
 
 
+class ResepQuerySet(models.QuerySet):
+    """QuerySet Resep dengan query plan untuk endpoint API"""
+    
+    def with_detail(self):
+        """Prefetch detail_resep beserta obat dalam satu query tambahan"""
+        return self.prefetch_related(
+            Prefetch('detail_resep', queryset=DetailResep.objects.select_related('obat'))
+        )
+    
+    def for_api(self):
+        """Eager-load relasi yang dibaca ResepSerializer"""
+        return self.select_related(
+            'rekam_medis__pasien__user',
+            'rekam_medis__dokter__user',
+        ).with_detail()
+
+
 class Resep(models.Model):
     """Model Resep"""
     STATUS_CHOICES = [
@@ -393,16 +635,33 @@ class Resep(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ResepQuerySet.as_manager()
+    
     class Meta:
         db_table = 'resep'
         verbose_name_plural = 'Resep'
         ordering = ['-tanggal_resep']
+        indexes = [
+            # Resep diserahkan per hari (statistik apoteker)
+            models.Index(fields=['status', 'processed_at'], name='resep_status_processed_idx'),
+            # Antrian resep per status, urut terbaru
+            models.Index(fields=['status', '-tanggal_resep'], name='resep_status_tanggal_idx'),
+        ]
     
     def __str__(self):
         return f"Resep #{self.pk} - {self.rekam_medis.pasien.user.get_full_name()}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Status saat dimuat, supaya stok hanya dikurangi saat transisi ke delivered
+        if 'status' in field_names:
+            instance._status_awal = instance.status
+        return instance
+    
     @property
     def total_harga(self):
+        # detail_resep.all() membaca cache prefetch dari with_detail()/for_api()
         return sum(detail.subtotal for detail in self.detail_resep.all())
 
 
@@ -431,6 +690,23 @@ class DetailResep(models.Model):
         super().save(*args, **kwargs)
 
 
+class PembayaranQuerySet(models.QuerySet):
+    """QuerySet Pembayaran dengan query plan untuk endpoint API"""
+    
+    def for_api(self):
+        """
+        Eager-load janji_temu beserta relasinya untuk PembayaranSerializer.
+        Reverse one-to-one rekam_medis ikut di-join sehingga has_rekam_medis
+        tidak memicu query tambahan per baris.
+        """
+        return self.select_related(
+            'janji_temu__pasien__user',
+            'janji_temu__dokter__user',
+            'janji_temu__rekam_medis',
+            'processed_by__user',
+        )
+
+
 class Pembayaran(models.Model):
     """Model Pembayaran"""
     METODE_CHOICES = [
@@ -459,50 +735,162 @@ class Pembayaran(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = PembayaranQuerySet.as_manager()
+    
     class Meta:
         db_table = 'pembayaran'
         verbose_name_plural = 'Pembayaran'
         ordering = ['-created_at']
+        indexes = [
+            # Revenue per rentang tanggal_bayar (dashboard, time series, rollup)
+            models.Index(fields=['status', 'tanggal_bayar'], name='pembayaran_status_bayar_idx'),
+            # List pending / filter status, urut terbaru
+            models.Index(fields=['status', '-created_at'], name='pembayaran_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Invoice #{self.invoice_number} - {self.janji_temu.pasien.user.get_full_name()}"
     
+    ROLLUP_FIELDS = ('status', 'tanggal_bayar', 'metode', 'total_biaya',
+                     'biaya_konsultasi', 'biaya_obat', 'biaya_tindakan')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Simpan kontribusi rollup saat dimuat, supaya post_save cukup menerapkan delta
+        if all(name in field_names for name in cls.ROLLUP_FIELDS):
+            instance._rollup_awal = instance.revenue_contribution()
+        return instance
+    
+    def revenue_contribution(self):
+        """Kontribusi ke DailyRevenueRollup: ((tanggal, metode), nilai), None jika belum lunas"""
+        if self.status != 'lunas' or not self.tanggal_bayar:
+            return None
+        return (
+            (timezone.localdate(self.tanggal_bayar), self.metode),
+            (self.total_biaya, self.biaya_konsultasi, self.biaya_obat, self.biaya_tindakan),
+        )
+    
     def save(self, *args, **kwargs):
-        if not self.invoice_number:
+        if self.invoice_number:
+            super().save(*args, **kwargs)
+            return
+        
+        with transaction.atomic():
             # Auto-generate invoice number: INV-YYYYMMDD-XXXX
-            today = timezone.now()
-            prefix = f"INV-{today.strftime('%Y%m%d')}"
-            last_invoice = Pembayaran.objects.filter(
-                invoice_number__startswith=prefix
-            ).order_by('-invoice_number').first()
-            
-            if last_invoice:
-                last_number = int(last_invoice.invoice_number[-4:])
-                new_number = last_number + 1
-            else:
-                new_number = 1
-            self.invoice_number = f"{prefix}-{new_number:04d}"
-        super().save(*args, **kwargs)
+            prefix = f"INV-{timezone.now().strftime('%Y%m%d')}"
+            self.invoice_number = f"{prefix}-{SequenceCounter.next_value(prefix):04d}"
+            super().save(*args, **kwargs)
     
     def calculate_total(self):
-        """Calculate total biaya dari konsultasi + obat + tindakan"""
-        # Biaya konsultasi dari dokter
-        self.biaya_konsultasi = self.janji_temu.dokter.biaya_konsultasi
+        """
+        Calculate total biaya dari konsultasi + obat + tindakan.
+        Semua komponen dihitung dalam satu query (subquery agregat per komponen).
+        """
+        obat = DetailResep.objects.filter(
+            resep__rekam_medis__janji_temu=OuterRef('pk')
+        ).values('resep__rekam_medis__janji_temu').annotate(
+            total=Sum(F('jumlah') * F('harga_satuan'), output_field=models.DecimalField())
+        ).values('total')
+        tindakan = RekamMedis.tindakan.through.objects.filter(
+            rekammedis__janji_temu=OuterRef('pk')
+        ).values('rekammedis__janji_temu').annotate(
+            total=Sum('layanantindakan__biaya')
+        ).values('total')
         
-        # Biaya obat dari resep (jika ada rekam medis)
-        self.biaya_obat = 0
-        if hasattr(self.janji_temu, 'rekam_medis'):
-            rekam_medis = self.janji_temu.rekam_medis
-            for resep in rekam_medis.resep.all():
-                self.biaya_obat += resep.total_harga
-            
-            # Biaya tindakan
-            self.biaya_tindakan = sum(t.biaya for t in rekam_medis.tindakan.all())
+        biaya = JanjiTemu.objects.filter(pk=self.janji_temu_id).values(
+            konsultasi=F('dokter__biaya_konsultasi'),
+            ada_rekam_medis=Exists(RekamMedis.objects.filter(janji_temu=OuterRef('pk'))),
+            obat=Subquery(obat),
+            tindakan=Subquery(tindakan),
+        ).get()
+        
+        self.biaya_konsultasi = biaya['konsultasi']
+        self.biaya_obat = biaya['obat'] or 0
+        if biaya['ada_rekam_medis']:
+            self.biaya_tindakan = biaya['tindakan'] or 0
         
         self.total_biaya = self.biaya_konsultasi + self.biaya_obat + self.biaya_tindakan
         return self.total_biaya
 
 
+class DailyRevenueRollup(models.Model):
+    """Rekap revenue harian per metode per dokter, dipelihara incremental dari Pembayaran"""
+    tanggal = models.DateField()
+    metode = models.CharField(max_length=20, choices=Pembayaran.METODE_CHOICES)
+    dokter = models.ForeignKey(Dokter, on_delete=models.CASCADE, related_name='revenue_rollup')
+    jumlah_transaksi = models.IntegerField(default=0)
+    total_biaya = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    biaya_konsultasi = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    biaya_obat = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    biaya_tindakan = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'daily_revenue_rollup'
+        ordering = ['-tanggal']
+        constraints = [
+            models.UniqueConstraint(fields=['tanggal', 'metode', 'dokter'], name='unique_daily_revenue_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.tanggal} {self.metode} - {self.dokter_id}: Rp {self.total_biaya:,.0f}"
+    
+    @classmethod
+    def apply(cls, dokter_id, contribution, sign=1):
+        """Tambah (sign=1) atau kurangi (sign=-1) satu kontribusi Pembayaran.revenue_contribution()"""
+        (tanggal, metode), (total, konsultasi, obat, tindakan) = contribution
+        with transaction.atomic():
+            rollup, _ = cls.objects.select_for_update().get_or_create(
+                tanggal=tanggal, metode=metode, dokter_id=dokter_id
+            )
+            cls.objects.filter(pk=rollup.pk).update(
+                jumlah_transaksi=F('jumlah_transaksi') + sign,
+                total_biaya=F('total_biaya') + sign * total,
+                biaya_konsultasi=F('biaya_konsultasi') + sign * konsultasi,
+                biaya_obat=F('biaya_obat') + sign * obat,
+                biaya_tindakan=F('biaya_tindakan') + sign * tindakan,
+            )
+    
+    @classmethod
+    def rebuild(cls, start=None, end=None):
+        """Hitung ulang rollup dari Pembayaran lunas (backfill/repair), opsional per rentang tanggal"""
+        pembayaran = Pembayaran.objects.filter(status='lunas', tanggal_bayar__isnull=False)
+        rollups = cls.objects.all()
+        if start:
+            pembayaran = pembayaran.filter(tanggal_bayar__gte=timezone.make_aware(datetime.combine(start, time.min)))
+            rollups = rollups.filter(tanggal__gte=start)
+        if end:
+            pembayaran = pembayaran.filter(tanggal_bayar__lte=timezone.make_aware(datetime.combine(end, time.max)))
+            rollups = rollups.filter(tanggal__lte=end)
+        
+        rows = pembayaran.annotate(
+            tanggal=TruncDate('tanggal_bayar')
+        ).values('tanggal', 'metode', 'janji_temu__dokter').annotate(
+            jumlah_transaksi=Count('id'),
+            sum_total_biaya=Sum('total_biaya'),
+            sum_biaya_konsultasi=Sum('biaya_konsultasi'),
+            sum_biaya_obat=Sum('biaya_obat'),
+            sum_biaya_tindakan=Sum('biaya_tindakan'),
+        ).order_by()
+        
+        with transaction.atomic():
+            rollups.delete()
+            created = cls.objects.bulk_create([
+                cls(
+                    tanggal=row['tanggal'],
+                    metode=row['metode'],
+                    dokter_id=row['janji_temu__dokter'],
+                    jumlah_transaksi=row['jumlah_transaksi'],
+                    total_biaya=row['sum_total_biaya'],
+                    biaya_konsultasi=row['sum_biaya_konsultasi'],
+                    biaya_obat=row['sum_biaya_obat'],
+                    biaya_tindakan=row['sum_biaya_tindakan'],
+                )
+                for row in rows
+            ], batch_size=1000)
+        return len(created)
+
 
 # ============================================
 # PHASE 2: AUDIT TRAIL SYSTEM
@@ -582,10 +970,114 @@ class StokAdjustment(models.Model):
         return f"{self.obat.nama} {self.jumlah:+d} ({self.get_reason_display()})"
     
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # Update stok obat
-        self.obat.stok += self.jumlah
-        self.obat.save()
+        from .inventory import apply_stock_deltas
+        
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Update stok obat (sekali, saat adjustment dibuat)
+            if adding:
+                stok_baru = apply_stock_deltas({self.obat_id: self.jumlah}, 'adjustment', adjustment=self)
+                if StokAdjustment.obat.is_cached(self):
+                    self.obat.stok = stok_baru[self.obat_id]
+
+
+class ObatLot(models.Model):
+    """Stok per lot/batch obat dengan tanggal kedaluwarsa masing-masing"""
+    obat = models.ForeignKey(Obat, on_delete=models.CASCADE, related_name='lots')
+    nomor_lot = models.CharField(max_length=50, blank=True)  # '' = lot default (stok tanpa nomor lot)
+    expired_date = models.DateField(null=True, blank=True)
+    jumlah = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'obat_lot'
+        ordering = ['obat', 'expired_date']
+        constraints = [
+            models.UniqueConstraint(fields=['obat', 'nomor_lot'], name='unique_obat_lot'),
+            models.CheckConstraint(condition=models.Q(jumlah__gte=0), name='obat_lot_jumlah_non_negatif'),
+        ]
+        indexes = [
+            # Alokasi FEFO per obat
+            models.Index(fields=['obat', 'expired_date'], name='obat_lot_fefo_idx'),
+            # Laporan kedaluwarsa: range scan hanya atas lot yang masih ada stoknya
+            models.Index(fields=['expired_date'], name='obat_lot_expiry_idx', condition=models.Q(jumlah__gt=0)),
+        ]
+    
+    def __str__(self):
+        return f"{self.obat_id} lot {self.nomor_lot or '-'} ({self.expired_date}): {self.jumlah}"
+
+
+class StokMovement(models.Model):
+    """Ledger mutasi stok (append-only); jumlah semua mutasi satu obat = Obat.stok"""
+    TIPE_CHOICES = [
+        ('awal', 'Saldo Awal'),
+        ('resep', 'Resep Diserahkan'),
+        ('adjustment', 'Stok Adjustment'),
+        ('restock', 'Restock'),
+        ('koreksi', 'Koreksi Data Obat'),
+    ]
+    
+    obat = models.ForeignKey(Obat, on_delete=models.CASCADE, related_name='stok_movements')
+    tipe = models.CharField(max_length=20, choices=TIPE_CHOICES)
+    jumlah = models.IntegerField()  # Positif masuk, negatif keluar
+    stok_setelah = models.IntegerField()
+    resep = models.ForeignKey(Resep, on_delete=models.SET_NULL, null=True, blank=True, related_name='stok_movements')
+    adjustment = models.ForeignKey(
+        StokAdjustment, on_delete=models.SET_NULL, null=True, blank=True, related_name='stok_movements'
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'stok_movement'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['obat', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.obat_id} {self.jumlah:+d} ({self.get_tipe_display()})"
+
+
+class StokSnapshot(models.Model):
+    """Stok obat pada akhir hari `tanggal` (timezone lokal), dibuat oleh `manage.py snapshot_stok`"""
+    obat = models.ForeignKey(Obat, on_delete=models.CASCADE, related_name='stok_snapshots')
+    tanggal = models.DateField()
+    stok = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'stok_snapshot'
+        ordering = ['-tanggal']
+        constraints = [
+            models.UniqueConstraint(fields=['obat', 'tanggal'], name='unique_stok_snapshot'),
+        ]
+    
+    def __str__(self):
+        return f"{self.obat_id} {self.tanggal}: {self.stok}"
+
+
+class ObatForecast(models.Model):
+    """
+    Hasil forecast kebutuhan obat, dihitung ulang tiap malam oleh
+    `manage.py forecast_stok` (lihat core/forecast.py)
+    """
+    obat = models.OneToOneField(Obat, on_delete=models.CASCADE, related_name='forecast')
+    rata_rata_7_hari = models.FloatField(default=0)
+    rata_rata_28_hari = models.FloatField(default=0)
+    std_harian = models.FloatField(default=0)
+    kebutuhan_harian = models.FloatField(default=0, help_text='Laju pemakaian yang dipakai untuk reorder point')
+    lead_time_hari = models.PositiveIntegerField()
+    safety_stock = models.PositiveIntegerField(default=0)
+    reorder_point = models.PositiveIntegerField(default=0)
+    dihitung_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'obat_forecast'
+    
+    def __str__(self):
+        return f"{self.obat_id}: reorder di {self.reorder_point}"
 
 
 # ============================================
@@ -626,6 +1118,31 @@ class Notifikasi(models.Model):
     
     def __str__(self):
         return f"{self.user} - {self.judul}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Status baca saat dimuat, supaya counter unread cukup menerapkan delta
+        if 'is_read' in field_names:
+            instance._is_read_awal = instance.is_read
+        return instance
+
+
+class NotifikasiUnread(models.Model):
+    """Jumlah notifikasi belum dibaca per user, dipelihara incremental (lihat core/notifications.py)"""
+    user = models.OneToOneField(
+        CustomUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notifikasi_unread'
+    )
+    jumlah = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'notifikasi_unread'
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.jumlah} belum dibaca"
 
 
 # ============================================
@@ -0,0 +1,197 @@
+"""
+Pengiriman notifikasi: dikumpulkan selama transaksi lalu ditulis sekali
+dengan bulk_create saat commit. Jumlah belum dibaca per user dipelihara
+incremental di NotifikasiUnread dan cache, tanpa COUNT atas tabel notifikasi.
+"""
+import itertools
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from django.utils import timezone
+
+from .batching import CommitBatch
+from .models import Apoteker, Notifikasi, NotifikasiUnread, ObatForecast
+from .realtime import get_broker
+
+
+# Penerima khusus: semua apoteker, di-resolve sekali saat flush
+APOTEKER = 'apoteker'
+
+_counter = itertools.count()
+
+
+class NotificationBatch(CommitBatch):
+    """Notifikasi yang menunggu commit transaksi yang sedang berjalan"""
+
+    def add(self, recipient, tipe, judul, pesan, data, dedup_key):
+        # Notifikasi dengan dedup_key yang sama untuk penerima yang sama
+        # cukup dikirim sekali; isi terakhir (mis. stok terbaru) yang dipakai
+        key = (recipient, dedup_key) if dedup_key else (recipient, next(_counter))
+        if dedup_key:
+            data = {**data, 'dedup_key': dedup_key}
+        self.entries[key] = (tipe, judul, pesan, data)
+
+    def write(self, entries):
+        apoteker_ids = []
+        if any(recipient == APOTEKER for recipient, _ in entries):
+            apoteker_ids = list(Apoteker.objects.values_list('user_id', flat=True))
+
+        rows = {}
+        for (recipient, _), (tipe, judul, pesan, data) in entries.items():
+            for user_id in (apoteker_ids if recipient == APOTEKER else [recipient]):
+                key = (user_id, data.get('dedup_key') or object())
+                rows[key] = Notifikasi(user_id=user_id, tipe=tipe, judul=judul, pesan=pesan, data=data)
+
+        # Jangan ulangi notifikasi yang dedup_key-nya sudah terkirim dalam window
+        dedup_keys = {key for _, key in rows if isinstance(key, str)}
+        if dedup_keys:
+            window = getattr(settings, 'NOTIFIKASI_DEDUP_WINDOW', 3600)
+            terkirim = Notifikasi.objects.filter(
+                created_at__gte=timezone.now() - timedelta(seconds=window),
+                data__dedup_key__in=dedup_keys,
+            ).values_list('user_id', 'data__dedup_key')
+            for key in terkirim:
+                rows.pop(key, None)
+
+        if rows:
+            Notifikasi.objects.bulk_create(rows.values())
+            ubah_unread(Counter(notifikasi.user_id for notifikasi in rows.values()))
+
+
+def notify(recipient, tipe, judul, pesan, data=None, dedup_key=None):
+    """
+    Antrikan notifikasi untuk `recipient` (user, user id, atau APOTEKER).
+    Ditulis saat transaksi commit; tanpa transaksi aktif langsung ditulis.
+    """
+    if recipient != APOTEKER and not isinstance(recipient, int):
+        recipient = recipient.pk
+    batch = NotificationBatch.current()
+    batch.add(recipient, tipe, judul, pesan, data or {}, dedup_key)
+    batch.register()
+
+
+def alert_stok_menipis(obat):
+    """
+    Notify semua apoteker jika stok obat menipis (sekali per obat dalam window
+    dedup): stok <= reorder point forecast, atau < 10 untuk obat yang belum
+    punya forecast, sama dengan forecast.obat_stok_menipis
+    """
+    try:
+        menipis = obat.stok <= obat.forecast.reorder_point
+    except ObatForecast.DoesNotExist:
+        menipis = obat.stok < 10
+    if obat.stok > 0 and menipis:
+        notify(
+            APOTEKER,
+            tipe='stok',
+            judul='Stok Obat Menipis',
+            pesan=f'Stok {obat.nama} tinggal {obat.stok} {obat.satuan}. '
+                  f'Segera lakukan pemesanan.',
+            data={'obat_id': obat.id},
+            dedup_key=f'stok:{obat.id}'
+        )
+
+
+# ==================== COUNTER BELUM DIBACA ====================
+
+UNREAD_CACHE_KEY = 'notifikasi:unread:{user_id}'
+
+
+def channel_notifikasi(user_id):
+    """Channel broker perubahan jumlah notifikasi belum dibaca satu user"""
+    return f'notifikasi:{user_id}'
+
+
+class UnreadCacheBatch(CommitBatch):
+    """
+    User yang counternya berubah dalam transaksi ini. Saat commit cache-nya
+    dihapus (dibaca ulang dari baris counter oleh unread_count, sehingga commit
+    bersamaan yang selesai tidak berurutan tidak meninggalkan nilai lama) dan
+    nilai counter dipublikasikan ke stream notifikasi.
+    """
+    entries_factory = set
+
+    def write(self, user_ids):
+        cache.delete_many([UNREAD_CACHE_KEY.format(user_id=user_id) for user_id in user_ids])
+        jumlah = dict(NotifikasiUnread.objects.filter(user_id__in=user_ids).values_list('user_id', 'jumlah'))
+        counts = {user_id: jumlah.get(user_id, 0) for user_id in user_ids}
+        broker = get_broker()
+        for user_id, count in counts.items():
+            broker.publish(channel_notifikasi(user_id), {'unread_count': count})
+
+
+def ubah_unread(deltas):
+    """
+    Terapkan {user_id: delta} ke counter belum dibaca dalam satu UPDATE ... CASE
+    (ikut transaksi pemanggil); cache dihapus saat commit
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Baris counter hanya dibuat untuk penambahan; pengurangan untuk user yang
+    # sedang dihapus (cascade) tidak boleh membuat baris baru
+    NotifikasiUnread.objects.bulk_create(
+        [NotifikasiUnread(user_id=user_id) for user_id, delta in deltas.items() if delta > 0],
+        ignore_conflicts=True,
+    )
+    NotifikasiUnread.objects.filter(user_id__in=deltas).update(
+        jumlah=F('jumlah') + Case(*[When(user_id=user_id, then=Value(delta)) for user_id, delta in deltas.items()])
+    )
+    batch = UnreadCacheBatch.current()
+    batch.entries.update(deltas)
+    batch.register()
+
+
+def unread_count(user_id):
+    """Jumlah notifikasi belum dibaca dari cache, atau dari baris counter jika cache kosong"""
+    key = UNREAD_CACHE_KEY.format(user_id=user_id)
+    count = cache.get(key)
+    if count is None:
+        count = NotifikasiUnread.objects.filter(user_id=user_id).values_list('jumlah', flat=True).first() or 0
+        cache.set(key, count, getattr(settings, 'NOTIFIKASI_UNREAD_CACHE_TIMEOUT', 60 * 60 * 24))
+    return count
+
+
+def tandai_semua_dibaca(user_id):
+    """Tandai semua notifikasi user sudah dibaca; counter dikurangi sebanyak baris yang berubah"""
+    jumlah = Notifikasi.objects.filter(user_id=user_id, is_read=False).update(is_read=True)
+    ubah_unread({user_id: -jumlah})
+    return jumlah
+
+
+def rekonsiliasi_unread():
+    """
+    Cocokkan counter dengan COUNT notifikasi belum dibaca (satu query agregat)
+    dan perbaiki yang selisih. Cache semua user dihapus (bukan hanya yang
+    selisih) agar nilai lama yang sempat tersimpan dari baca bersamaan commit
+    tidak bertahan sampai timeout. Dijalankan berkala untuk menutup perubahan
+    di luar jalur incremental (mis. update() langsung).
+    Mengembalikan {user_id: jumlah_benar} yang diperbaiki.
+    """
+    aktual = dict(
+        Notifikasi.objects.filter(is_read=False).values('user').annotate(jumlah=Count('id'))
+        .order_by().values_list('user', 'jumlah')
+    )
+    tercatat = dict(NotifikasiUnread.objects.values_list('user_id', 'jumlah'))
+    selisih = {
+        user_id: aktual.get(user_id, 0)
+        for user_id in aktual.keys() | tercatat.keys()
+        if aktual.get(user_id, 0) != tercatat.get(user_id, 0)
+    }
+    if selisih:
+        NotifikasiUnread.objects.bulk_create(
+            [NotifikasiUnread(user_id=user_id, jumlah=jumlah) for user_id, jumlah in selisih.items()],
+            update_conflicts=True, unique_fields=['user'], update_fields=['jumlah'],
+        )
+        batch = UnreadCacheBatch.current()
+        batch.entries.update(selisih)
+        batch.register()
+    user_ids = aktual.keys() | tercatat.keys()
+    transaction.on_commit(
+        lambda: cache.delete_many([UNREAD_CACHE_KEY.format(user_id=user_id) for user_id in user_ids])
+    )
+    return selisih
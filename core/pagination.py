@@ -0,0 +1,59 @@
+"""
+Pagination classes untuk list endpoint bervolume tinggi
+"""
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination: halaman berikutnya diambil dengan
+    WHERE <ordering> < posisi cursor, tanpa OFFSET dan tanpa COUNT(*).
+    Subclass cukup mengganti `ordering` agar sesuai index tabelnya.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class SelectablePagination(PageNumberPagination):
+    """
+    Page number secara default (kompatibel dengan frontend yang memakai count/page),
+    keyset pagination jika client mengirim ?pagination=cursor atau ?cursor=...
+    """
+    cursor_ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def use_cursor(self, request):
+        return request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = KeysetPagination()
+            self.cursor_paginator.ordering = self.cursor_ordering
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class AuditLogPagination(KeysetPagination):
+    """Memakai index audit_log (user, -timestamp)"""
+    ordering = ('-timestamp', '-id')
+
+
+class NotifikasiPagination(KeysetPagination):
+    """Memakai index notifikasi (user, -created_at)"""
+    ordering = ('-created_at', '-id')
+
+
+class PembayaranPagination(SelectablePagination):
+    cursor_ordering = ('-created_at', '-id')
+
+
+class ResepPagination(SelectablePagination):
+    cursor_ordering = ('-tanggal_resep', '-id')
@@ -0,0 +1,289 @@
+"""
+Push realtime lewat Server-Sent Events: perubahan dipublikasikan ke channel
+broker pub/sub saat commit lalu di-stream ke klien yang berlangganan.
+Live antrian: delta JanjiTemu per tanggal dan per dokter+tanggal
+(lihat views.antrian_stream).
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+from .batching import CommitBatch
+from .models import CustomUser, JanjiTemu
+
+
+# Penanda untuk subscriber yang tertinggal: antriannya penuh, event dibuang
+# dan stream harus mengirim snapshot ulang
+RESET = object()
+
+
+def channel_antrian(tanggal, dokter_id=None):
+    """Nama channel antrian satu tanggal (semua dokter) atau satu dokter"""
+    if dokter_id:
+        return f'antrian:{tanggal}:{dokter_id}'
+    return f'antrian:{tanggal}'
+
+
+# ==================== BROKER ====================
+
+class Subscription:
+    """
+    Satu layar yang berlangganan channel. Event dikirim ke asyncio.Queue milik
+    event loop subscriber; saat tidak ada event, get() hanya menunggu tanpa
+    query atau polling.
+    """
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, event):
+        """Dipanggil di event loop subscriber (lewat call_soon_threadsafe)"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESET)
+
+    async def get(self, timeout=None):
+        """Event berikutnya, atau None jika tidak ada event dalam `timeout` detik"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Pub/sub di dalam satu proses. Publish boleh dari thread mana saja (signal
+    berjalan di thread view sinkron), event diteruskan ke loop tiap subscriber.
+    Untuk deployment multi-proses ganti REALTIME_BROKER dengan broker yang
+    mengimplementasikan subscribe/unsubscribe/publish/has_subscribers yang sama (mis. Redis).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel):
+        """Daftarkan subscriber baru; harus dipanggil dari dalam event loop"""
+        maxsize = getattr(settings, 'SSE_QUEUE_SIZE', 100)
+        subscription = Subscription(self, channel, maxsize)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def has_subscribers(self, channel):
+        with self._lock:
+            return channel in self._subscribers
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # Event loop subscriber sudah ditutup
+                self.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Broker dari settings.REALTIME_BROKER, dibuat sekali per proses"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'REALTIME_BROKER', 'core.realtime.InProcessBroker'))()
+    return _broker
+
+
+# ==================== EVENT ANTRIAN ====================
+
+def data_antrian(janji):
+    """Baris antrian ringkas untuk layar: cukup untuk menampilkan tanpa query lain"""
+    return {
+        'id': janji['id'],
+        'dokter_id': janji['dokter_id'],
+        'tanggal': janji['tanggal'],
+        'waktu': janji['waktu'],
+        'nomor_antrian': janji['nomor_antrian'],
+        'status': janji['status'],
+        'pasien_nama': ' '.join(filter(None, [
+            janji['pasien__user__first_name'], janji['pasien__user__last_name']
+        ])),
+    }
+
+
+FIELDS_ANTRIAN = (
+    'id', 'dokter_id', 'tanggal', 'waktu', 'nomor_antrian', 'status',
+    'pasien__user__first_name', 'pasien__user__last_name',
+)
+
+
+def snapshot_antrian(tanggal, dokter_id=None):
+    """Antrian aktif (pending/confirmed) satu tanggal, sama seperti AntrianView"""
+    queryset = JanjiTemu.objects.filter(tanggal=tanggal, status__in=['confirmed', 'pending'])
+    if dokter_id:
+        queryset = queryset.filter(dokter_id=dokter_id)
+    return [data_antrian(row) for row in queryset.order_by('nomor_antrian').values(*FIELDS_ANTRIAN)]
+
+
+class AntrianEventBatch(CommitBatch):
+    """
+    Delta antrian yang menunggu commit: layar tidak pernah melihat perubahan
+    yang di-rollback. Perubahan berulang pada janji temu yang sama dalam satu
+    transaksi digabung menjadi satu delta dengan aksi terakhir. `keluar` berisi
+    janji temu yang hilang dari antrian lama (dihapus atau dipindah ke dokter/tanggal lain).
+    """
+
+    @staticmethod
+    def entries_factory():
+        return {'delta': {}, 'keluar': {}}
+
+    def merge(self, entries, lain):
+        entries['delta'].update(lain['delta'])
+        entries['keluar'].update(lain['keluar'])
+        for aksi, _, janji in lain['keluar'].values():
+            if aksi == 'dihapus':
+                entries['delta'].pop(janji['id'], None)
+
+    def write(self, entries):
+        broker = get_broker()
+        # Cukup id untuk menghapus baris dari layar: tanpa query (baris yang dihapus sudah tidak ada)
+        for aksi, channels, janji in entries['keluar'].values():
+            for channel in channels:
+                broker.publish(channel, {'aksi': aksi, 'janji': janji})
+
+        aksi = {
+            janji_id: aksi for janji_id, (aksi, channels) in entries['delta'].items()
+            if any(broker.has_subscribers(channel) for channel in channels)
+        }
+        if not aksi:
+            # Tidak ada layar yang membuka antrian ini: tanpa query
+            return
+        # Baris yang sudah commit untuk semua delta dalam satu query
+        for row in JanjiTemu.objects.filter(pk__in=aksi).values(*FIELDS_ANTRIAN):
+            event = {'aksi': aksi[row['id']], 'janji': data_antrian(row)}
+            broker.publish(channel_antrian(row['tanggal']), event)
+            broker.publish(channel_antrian(row['tanggal'], row['dokter_id']), event)
+
+
+def _channels(dokter_id, tanggal):
+    return (channel_antrian(tanggal), channel_antrian(tanggal, dokter_id))
+
+
+def publish_antrian(janji, aksi):
+    """Kirim delta `aksi` untuk janji temu ini ke layar antrian saat transaksi commit"""
+    batch = AntrianEventBatch.current()
+    batch.entries['delta'][janji.pk] = (aksi, _channels(janji.dokter_id, janji.tanggal))
+    batch.register()
+
+
+def publish_keluar_antrian(janji_id, dokter_id, tanggal, aksi, kecuali=()):
+    """
+    Kirim `aksi` (dihapus/dipindah) ke layar antrian (dokter_id, tanggal) saat
+    transaksi commit, supaya barisnya hilang tanpa menunggu snapshot ulang.
+    Channel di `kecuali` (antrian tujuan yang tetap menampilkannya) dilewati.
+    """
+    channels = tuple(channel for channel in _channels(dokter_id, tanggal) if channel not in kecuali)
+    if not channels:
+        return
+    batch = AntrianEventBatch.current()
+    batch.entries['keluar'][(janji_id, channels)] = (
+        aksi, channels, {'id': janji_id, 'dokter_id': dokter_id, 'tanggal': tanggal}
+    )
+    if aksi == 'dihapus':
+        batch.entries['delta'].pop(janji_id, None)
+    batch.register()
+
+
+# ==================== SERVER-SENT EVENTS ====================
+
+def format_sse(event, data):
+    """Satu event Server-Sent Events"""
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def sse_events(channel, snapshot, event):
+    """
+    Event `snapshot` (hasil fungsi sinkron `snapshot()`), lalu event `event` untuk
+    setiap publish ke `channel`. Selama tidak ada publish hanya menunggu, dengan
+    komentar keep-alive tiap SSE_HEARTBEAT detik.
+    """
+    heartbeat = getattr(settings, 'SSE_HEARTBEAT', 15)
+    # Subscribe sebelum snapshot supaya tidak ada event yang terlewat;
+    # event yang sudah termasuk snapshot aman diterapkan ulang oleh klien
+    subscription = get_broker().subscribe(channel)
+    try:
+        yield format_sse('snapshot', await sync_to_async(snapshot)())
+        while True:
+            data = await subscription.get(timeout=heartbeat)
+            if data is None:
+                yield ': keep-alive\n\n'
+            elif data is RESET:
+                yield format_sse('snapshot', await sync_to_async(snapshot)())
+            else:
+                yield format_sse(event, data)
+    finally:
+        # Dijalankan juga saat klien putus (handler ASGI membatalkan stream)
+        subscription.close()
+
+
+def sse_response(channel, snapshot, event):
+    """StreamingHttpResponse text/event-stream dari sse_events (butuh server ASGI)"""
+    response = StreamingHttpResponse(sse_events(channel, snapshot, event), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# ==================== TIKET STREAM ====================
+
+# Salt khusus: tiket stream tidak bisa dipakai sebagai tanda tangan lain, dan
+# access token JWT tidak pernah masuk URL / access log
+TIKET_SALT = 'core.realtime.tiket-stream'
+
+
+def buat_tiket_stream(user):
+    """
+    Tiket ?ticket= untuk membuka stream SSE (EventSource tidak bisa mengirim
+    header Authorization). Hanya berlaku untuk endpoint stream dan hanya
+    STREAM_TICKET_TIMEOUT detik; koneksi ulang meminta tiket baru.
+    """
+    return signing.dumps(user.pk, salt=TIKET_SALT)
+
+
+def user_tiket_stream(tiket):
+    """User aktif pemilik tiket stream, atau None jika tiket tidak valid/kedaluwarsa"""
+    try:
+        user_id = signing.loads(tiket, salt=TIKET_SALT, max_age=getattr(settings, 'STREAM_TICKET_TIMEOUT', 60))
+    except signing.BadSignature:
+        return None
+    return CustomUser.objects.filter(pk=user_id, is_active=True).first()
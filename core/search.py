@@ -0,0 +1,418 @@
+"""
+Index pencarian, menggantikan OR icontains lintas join dari SearchFilter:
+- pasien: prefix/akhiran no RM dan telepon sebagai range scan B-tree, nama
+  lewat FTS5 (SQLite) atau trigram (PostgreSQL)
+- teks klinis rekam medis: FTS5 atas teks yang dinormalisasi untuk bahasa
+  Indonesia (kata dasar, singkatan klinis), dengan skor bm25 dan highlight
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import Pasien, PasienSearch, RekamMedis, RekamMedisSearch
+
+
+# Batas atas range prefix: awalan <= nilai < awalan + AKHIR
+AKHIR = '\uffff'
+
+
+def normalisasi_telepon(value):
+    """Hanya digit, awalan 62 / 8 diseragamkan menjadi 0 (0812..., +62 812-..., 812...)"""
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith('62'):
+        return '0' + digits[2:]
+    if digits.startswith('8'):
+        return '0' + digits
+    return digits
+
+
+KOLOM_INDEX = ('pk', 'no_rm', 'user__first_name', 'user__last_name', 'user__phone')
+
+
+def _baris_index(pk, no_rm, first_name, last_name, phone):
+    telepon = normalisasi_telepon(phone)
+    return PasienSearch(
+        pasien_id=pk,
+        nama=' '.join(filter(None, [first_name, last_name])).lower(),
+        telepon=telepon,
+        telepon_balik=telepon[::-1],
+        no_rm_balik=no_rm[::-1],
+    )
+
+
+def sinkron_pasien_search(pasien_ids):
+    """Upsert baris index pasien ini dalam satu query (trigger DB memperbarui FTS5)"""
+    rows = Pasien.objects.filter(pk__in=pasien_ids).values_list(*KOLOM_INDEX)
+    PasienSearch.objects.bulk_create(
+        [_baris_index(*row) for row in rows],
+        update_conflicts=True, unique_fields=['pasien'],
+        update_fields=['nama', 'telepon', 'telepon_balik', 'no_rm_balik'],
+    )
+
+
+def rebuild_pasien_search(batch_size=2000):
+    """Bangun ulang seluruh index pasien (backfill/perbaikan). Mengembalikan jumlah baris"""
+    rows = Pasien.objects.order_by('pk').values_list(*KOLOM_INDEX)
+    jumlah = 0
+    with transaction.atomic():
+        PasienSearch.objects.all().delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(_baris_index(*row))
+            if len(batch) == batch_size:
+                jumlah += len(PasienSearch.objects.bulk_create(batch))
+                batch = []
+        jumlah += len(PasienSearch.objects.bulk_create(batch))
+    return jumlah
+
+
+# ==================== QUERY ====================
+
+def _dalam_scope(queryset, scope, field='pk'):
+    return queryset.filter(**{f'{field}__in': scope.order_by().values('pk')}) if scope is not None else queryset
+
+
+def _prefix(field, awalan):
+    return Q(**{f'{field}__gte': awalan, f'{field}__lt': awalan + AKHIR})
+
+
+def _kriteria(q):
+    """
+    Kriteria no RM/telepon dari `q` urut prioritas, [(model, kolom id pasien,
+    kondisi, urutan)] masing-masing range scan B-tree, dan token nama ([] jika
+    `q` berupa nomor telepon). Digit terakhir (nomor urut RM "00123", ekor
+    nomor HP) dicari sebagai prefix kolom terbalik.
+    """
+    kompak = re.sub(r'[\s.\-()]', '', q)
+    kriteria = []
+
+    if re.fullmatch(r'(?i)rm\d*|\d+', kompak):
+        awalan = kompak.upper() if kompak[:2].upper() == 'RM' else f'RM{kompak}'
+        kriteria.append((Pasien, 'pk', _prefix('no_rm', awalan), 'no_rm'))
+        if len(kompak) >= 3 and kompak.isdigit():
+            kriteria.append((PasienSearch, 'pasien_id', _prefix('no_rm_balik', kompak[::-1]), 'no_rm_balik'))
+
+    if re.fullmatch(r'\+?\d{4,}', kompak):
+        kriteria.append((PasienSearch, 'pasien_id', _prefix('telepon', normalisasi_telepon(kompak)), 'telepon'))
+        kriteria.append((PasienSearch, 'pasien_id', _prefix('telepon_balik', kompak.lstrip('+')[::-1]), 'telepon_balik'))
+        return kriteria, []
+    return kriteria, re.findall(r'\w+', q.lower())
+
+
+def _match_nama(tokens):
+    # Token hanya \w dan dikutip, jadi tidak bisa menyisipkan sintaks FTS5
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _nama_cocok(tokens):
+    """Queryset PasienSearch yang namanya memuat semua token (selain SQLite)"""
+    queryset = PasienSearch.objects.all()
+    for token in tokens:
+        # PostgreSQL: ILIKE '%token%' dilayani index GIN gin_trgm_ops
+        queryset = queryset.filter(nama__icontains=token)
+    return queryset
+
+
+def _cari_nama(tokens, scope, limit):
+    """Id pasien yang namanya memuat semua token (prefix), terurut relevansi"""
+    if connection.vendor == 'sqlite':
+        sql, params = 'SELECT rowid FROM pasien_fts WHERE pasien_fts MATCH %s', [_match_nama(tokens)]
+        if scope is not None:
+            scope_sql, scope_params = scope.order_by().values('pk').query.sql_with_params()
+            sql += f' AND rowid IN ({scope_sql})'
+            params += scope_params
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} ORDER BY rank LIMIT %s', [*params, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    queryset = _dalam_scope(_nama_cocok(tokens), scope, 'pasien')
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        queryset = queryset.annotate(kemiripan=TrigramSimilarity('nama', ' '.join(tokens))).order_by('-kemiripan')
+    else:
+        queryset = queryset.order_by('nama')
+    return list(queryset.values_list('pasien_id', flat=True)[:limit])
+
+
+def cari_pasien(q, scope=None, limit=None):
+    """
+    Id pasien teratas yang cocok dengan `q`, terurut relevansi: prefix no RM
+    ("RM2026", "2026000"), nomor urut RM, prefix lalu ekor telepon, lalu nama.
+    `scope` = queryset Pasien pembatas (mis. pasien milik dokter), None untuk
+    semua pasien. Untuk seluruh hasil (paginasi) pakai kondisi_pasien.
+    """
+    limit = limit or getattr(settings, 'PASIEN_SEARCH_LIMIT', 50)
+    kriteria, tokens = _kriteria(q)
+    hasil = []
+    for model, kolom, kondisi, urutan in kriteria:
+        queryset = _dalam_scope(model.objects.filter(kondisi), scope, 'pk' if model is Pasien else 'pasien')
+        hasil += queryset.order_by(urutan).values_list(kolom, flat=True)[:limit]
+    if tokens:
+        hasil += _cari_nama(tokens, scope, limit)
+    return list(dict.fromkeys(hasil))[:limit]
+
+
+def kondisi_pasien(q):
+    """
+    Q atas Pasien untuk SEMUA pasien yang cocok dengan `q` (tanpa batas
+    PASIEN_SEARCH_LIMIT), sehingga count dan halaman berikutnya benar.
+    """
+    kriteria, tokens = _kriteria(q)
+    bagian = [Q(pk__in=model.objects.filter(kondisi).values(kolom)) for model, kolom, kondisi, _ in kriteria]
+    if tokens:
+        if connection.vendor == 'sqlite':
+            bagian.append(Q(pk__in=RawSQL(
+                'SELECT rowid FROM pasien_fts WHERE pasien_fts MATCH %s', [_match_nama(tokens)]
+            )))
+        else:
+            bagian.append(Q(pk__in=_nama_cocok(tokens).values('pasien_id')))
+    return reduce(or_, bagian, Q(pk__in=[]))
+
+
+def urutkan_hasil(queryset, ids):
+    """Urutkan queryset: `ids` (relevansi dari cari_pasien) dulu, sisanya menyusul urut pk"""
+    if not ids:
+        return queryset.order_by('pk')
+    return queryset.order_by(
+        Case(
+            *[When(pk=pk, then=Value(i)) for i, pk in enumerate(ids)],
+            default=Value(len(ids)), output_field=IntegerField(),
+        ),
+        'pk',
+    )
+
+
+# ==================== TEKS KLINIS ====================
+
+FIELDS_KLINIS = ('diagnosa', 'anamnesa', 'pemeriksaan_fisik', 'catatan')
+
+# Bobot bm25 per kolom (urutan FIELDS_KLINIS): kecocokan di diagnosa paling relevan
+BOBOT_KLINIS = (4.0, 2.0, 1.0, 1.0)
+
+# Singkatan klinis yang umum ditulis dokter; kepanjangannya ikut di-index
+SINGKATAN = {
+    'ispa': 'infeksi saluran pernapasan akut',
+    'isk': 'infeksi saluran kemih',
+    'ht': 'hipertensi',
+    'dm': 'diabetes melitus',
+    'dbd': 'demam berdarah dengue',
+    'tb': 'tuberkulosis',
+    'tbc': 'tuberkulosis',
+    'gerd': 'gastroesophageal reflux disease',
+    'ppok': 'penyakit paru obstruktif kronik',
+    'chf': 'gagal jantung kongestif',
+    'ckd': 'penyakit ginjal kronik',
+    'td': 'tekanan darah',
+    'hb': 'hemoglobin',
+}
+
+# Ejaan tidak baku yang diseragamkan sebelum di-index dan dicari
+EJAAN = {
+    'nafas': 'napas',
+    'pernafasan': 'pernapasan',
+    'sesek': 'sesak',
+    'mellitus': 'melitus',
+    'hypertensi': 'hipertensi',
+}
+
+PARTIKEL = ('lah', 'kah', 'tah', 'pun')
+KATA_GANTI = ('nya', 'ku', 'mu')
+AKHIRAN = ('kan', 'an', 'i')
+# (awalan, huruf awal kata dasar yang luluh): menyakiti -> sakit, mengeluh -> keluh,
+# memeriksa -> periksa, menular -> tular; awalan tanpa peluluhan cukup dibuang
+AWALAN = (
+    ('meny', 's'), ('peny', 's'), ('meng', 'k'), ('peng', 'k'), ('mem', 'p'), ('pem', 'p'),
+    ('men', 't'), ('pen', 't'), ('ber', ''), ('ter', ''), ('per', ''),
+    ('me', ''), ('pe', ''), ('di', ''), ('ke', ''), ('se', ''),
+)
+VOKAL = 'aiueo'
+# Kata dasar tidak dipotong lebih pendek dari ini (ISPA, batuk, mual tetap utuh)
+PANJANG_DASAR = 4
+
+
+def kata_dasar(kata):
+    """
+    Kandidat kata dasar (stemmer Indonesia ringan: partikel, kata ganti,
+    akhiran, lalu awalan). Peluluhan ambigu menghasilkan dua kandidat
+    (mengeluh -> eluh, keluh). Tidak harus sempurna secara linguistik: yang
+    penting konsisten antara teks yang di-index dan kata yang dicari.
+    """
+    for daftar in (PARTIKEL, KATA_GANTI, AKHIRAN):
+        for akhiran in daftar:
+            if kata.endswith(akhiran) and len(kata) - len(akhiran) >= PANJANG_DASAR:
+                kata = kata[:-len(akhiran)]
+                break
+    for awalan, luluh in AWALAN:
+        sisa = kata[len(awalan):]
+        if kata.startswith(awalan) and len(sisa) >= PANJANG_DASAR:
+            if awalan in ('meny', 'peny'):
+                return {luluh + sisa}
+            if luluh and sisa[0] in VOKAL:
+                return {sisa, luluh + sisa}
+            return {sisa}
+    return {kata}
+
+
+def _kata(teks):
+    return [EJAAN.get(kata, kata) for kata in re.findall(r'\w+', (teks or '').lower())]
+
+
+def _kepanjangan(kata):
+    """Kata dasar kepanjangan singkatan, berurutan ([] jika bukan singkatan)"""
+    return [min(kata_dasar(k)) for k in SINGKATAN.get(kata, '').split()]
+
+
+def _bentuk(kata):
+    """Kata asli, kandidat kata dasarnya dan kata dasar kepanjangan singkatan"""
+    return {kata} | kata_dasar(kata) | set(_kepanjangan(kata))
+
+
+def normalisasi_klinis(teks):
+    """Teks untuk kolom FTS: tiap kata diikuti kata dasarnya dan kepanjangan singkatannya"""
+    hasil = []
+    for kata in _kata(teks):
+        hasil.append(kata)
+        hasil.extend(sorted(kata_dasar(kata) - {kata}))
+        hasil.extend(_kepanjangan(kata))
+    return ' '.join(hasil)
+
+
+def index_rekam_medis(rekam_medis_list):
+    """Upsert baris index dari instance RekamMedis (trigger DB memperbarui FTS5)"""
+    RekamMedisSearch.objects.bulk_create(
+        [
+            RekamMedisSearch(rekam_medis_id=rm.pk, **{
+                field: normalisasi_klinis(getattr(rm, field)) for field in FIELDS_KLINIS
+            })
+            for rm in rekam_medis_list
+        ],
+        update_conflicts=True, unique_fields=['rekam_medis'], update_fields=list(FIELDS_KLINIS),
+    )
+
+
+def sinkron_rekam_medis_search(rekam_medis_ids):
+    """Perbarui index teks klinis rekam medis ini"""
+    index_rekam_medis(RekamMedis.objects.filter(pk__in=rekam_medis_ids).only('id', *FIELDS_KLINIS))
+
+
+def rebuild_rekam_medis_search(batch_size=2000):
+    """Bangun ulang seluruh index teks klinis (backfill/perbaikan). Mengembalikan jumlah baris"""
+    rekam_medis = RekamMedis.objects.order_by('pk').only('id', *FIELDS_KLINIS)
+    jumlah = 0
+    with transaction.atomic():
+        RekamMedisSearch.objects.all().delete()
+        batch = []
+        for rm in rekam_medis.iterator(chunk_size=batch_size):
+            batch.append(rm)
+            if len(batch) == batch_size:
+                index_rekam_medis(batch)
+                jumlah += len(batch)
+                batch = []
+        index_rekam_medis(batch)
+        jumlah += len(batch)
+    return jumlah
+
+
+def _match_klinis(tokens):
+    """
+    Query FTS5: semua kata harus ada (AND); tiap kata boleh cocok sebagai prefix
+    kata asli atau kata dasarnya. Singkatan dicari lewat kata-kata kepanjangannya
+    yang berdekatan (NEAR): index selalu memuat kepanjangan di samping singkatan,
+    sehingga "HT" dan "hipertensi" cocok dengan dokumen yang sama dan skornya setara.
+    """
+    bagian = []
+    for kata in tokens:
+        if kata in SINGKATAN:
+            frasa = ' '.join(f'"{k}"*' for k in _kepanjangan(kata))
+            bagian.append(f'NEAR({frasa}, 10)')
+        else:
+            alternatif = [f'"{v}"*' for v in sorted({kata} | kata_dasar(kata))]
+            bagian.append(f"({' OR '.join(alternatif)})")
+    return ' AND '.join(bagian)
+
+
+def _klinis_cocok(tokens):
+    """Queryset RekamMedisSearch yang memuat semua kata (selain SQLite): icontains atas teks ternormalisasi"""
+    queryset = RekamMedisSearch.objects.all()
+    for kata in tokens:
+        queryset = queryset.filter(reduce(or_, [
+            Q(**{f'{field}__icontains': v}) for field in FIELDS_KLINIS for v in _bentuk(kata)
+        ]))
+    return queryset
+
+
+def cari_rekam_medis(q, scope=None, limit=None):
+    """
+    [(rekam_medis_id, skor)] yang cocok dengan `q` di teks klinis, skor tertinggi
+    dulu (bm25, diagnosa berbobot paling besar). `scope` = queryset RekamMedis
+    pembatas (mis. milik dokter yang login).
+    """
+    limit = limit or getattr(settings, 'REKAM_MEDIS_SEARCH_LIMIT', 50)
+    tokens = list(dict.fromkeys(_kata(q)))
+    if not tokens:
+        return []
+
+    if connection.vendor == 'sqlite':
+        bobot = ', '.join(str(b) for b in BOBOT_KLINIS)
+        sql = f'SELECT rowid, -bm25(rekam_medis_fts, {bobot}) FROM rekam_medis_fts WHERE rekam_medis_fts MATCH %s'
+        params = [_match_klinis(tokens)]
+        if scope is not None:
+            scope_sql, scope_params = scope.order_by().values('pk').query.sql_with_params()
+            sql += f' AND rowid IN ({scope_sql})'
+            params += scope_params
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} ORDER BY 2 DESC LIMIT %s', [*params, limit])
+            return cursor.fetchall()
+
+    # Database lain: icontains atas teks ternormalisasi, urut terbaru
+    queryset = _dalam_scope(_klinis_cocok(tokens), scope, 'rekam_medis')
+    ids = queryset.order_by('-rekam_medis__tanggal_periksa').values_list('rekam_medis_id', flat=True)[:limit]
+    return [(pk, None) for pk in ids]
+
+
+def kondisi_rekam_medis(q):
+    """
+    Q atas RekamMedis untuk SEMUA rekam medis yang teks klinisnya cocok dengan
+    `q` (tanpa batas REKAM_MEDIS_SEARCH_LIMIT), untuk paginasi ?search=
+    """
+    tokens = list(dict.fromkeys(_kata(q)))
+    if not tokens:
+        return Q(pk__in=[])
+    if connection.vendor == 'sqlite':
+        return Q(pk__in=RawSQL(
+            'SELECT rowid FROM rekam_medis_fts WHERE rekam_medis_fts MATCH %s', [_match_klinis(tokens)]
+        ))
+    return Q(pk__in=_klinis_cocok(tokens).values('rekam_medis_id'))
+
+
+def sorot(teks, q):
+    """
+    HTML `teks` (di-escape) dengan kata yang cocok dengan `q` dibungkus <mark>,
+    memakai normalisasi yang sama dengan index (prefix kata asli/dasar, singkatan).
+    None jika tidak ada kata yang cocok.
+    """
+    if not teks:
+        return None
+    awalan = set().union(*[_bentuk(kata) for kata in _kata(q)])
+
+    def cocok(kata):
+        kata = kata.lower()
+        return any(b.startswith(a) for b in _bentuk(EJAAN.get(kata, kata)) for a in awalan)
+
+    bagian, ada, posisi = [], False, 0
+    for match in re.finditer(r'\w+', teks):
+        bagian.append(escape(teks[posisi:match.start()]))
+        if cocok(match.group()):
+            bagian.append(f'<mark>{escape(match.group())}</mark>')
+            ada = True
+        else:
+            bagian.append(escape(match.group()))
+        posisi = match.end()
+    bagian.append(escape(teks[posisi:]))
+    return ''.join(bagian) if ada else None
@@ -0,0 +1,353 @@
+"""
+Generator data sintetis berskala besar untuk capacity planning (seed_data --scale N).
+Semua tabel diisi dengan bulk_create per batch tanpa signal, password di-hash
+sekali, dan hasilnya deterministik untuk seed yang sama (berapa pun jumlah worker).
+Skala 1 = 1.000 pasien; skala 100 = 100.000 pasien, 50 dokter, ~1 juta janji temu.
+"""
+import math
+import multiprocessing
+import random
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .models import (
+    AntrianCounter, Apoteker, CustomUser, DailyRevenueRollup, DetailResep, Dokter, JanjiTemu,
+    Kasir, LayananTindakan, Obat, Pasien, Pembayaran, RekamMedis, Resep, SequenceCounter
+)
+from .search import index_rekam_medis, sinkron_pasien_search
+from .stats import invalidate_dashboard_stats
+
+
+PASIEN_PER_SKALA = 1000
+DOKTER_PER_SKALA = 0.5
+JANJI_PER_PASIEN = 10
+HARI_KE_DEPAN = 14
+
+NAMA_DEPAN = [
+    'Agus', 'Budi', 'Citra', 'Dewi', 'Eka', 'Fajar', 'Gita', 'Hadi', 'Indah', 'Joko',
+    'Kartika', 'Lina', 'Made', 'Nur', 'Oki', 'Putri', 'Rizky', 'Sari', 'Tono', 'Umar',
+    'Vina', 'Wahyu', 'Yanti', 'Zainal', 'Bayu', 'Dian', 'Hendra', 'Lestari', 'Rina', 'Slamet',
+]
+NAMA_BELAKANG = [
+    'Saputra', 'Wijaya', 'Pratama', 'Lestari', 'Hidayat', 'Nugroho', 'Siregar', 'Wibowo',
+    'Kusuma', 'Santoso', 'Permana', 'Halim', 'Simanjuntak', 'Rahman', 'Setiawan', 'Utami',
+]
+SPESIALISASI = [('umum', Decimal('100000'))] * 4 + [
+    ('gigi', Decimal('150000')), ('anak', Decimal('125000')), ('kandungan', Decimal('200000')),
+    ('mata', Decimal('175000')), ('tht', Decimal('175000')), ('kulit', Decimal('175000')),
+]
+KELUHAN = [
+    'Demam dan batuk sejak 3 hari', 'Sakit kepala berulang', 'Nyeri perut setelah makan',
+    'Gigi berlubang terasa nyeri', 'Gatal dan ruam di kulit', 'Pilek dan hidung tersumbat',
+    'Kontrol rutin tekanan darah', 'Nyeri sendi lutut', 'Mata merah dan berair', 'Diare sejak kemarin',
+]
+DIAGNOSA = [
+    ('ISPA', 'Batuk berdahak, demam ringan, tenggorokan gatal'),
+    ('Gastritis akut', 'Nyeri ulu hati, mual, memberat setelah makan'),
+    ('Hipertensi grade 1', 'Kontrol tekanan darah, pusing di tengkuk'),
+    ('Karies dentin', 'Gigi berlubang, ngilu saat minum dingin'),
+    ('Dermatitis kontak', 'Gatal dan kemerahan setelah memakai sabun baru'),
+    ('Rinitis alergi', 'Bersin pagi hari, hidung tersumbat'),
+    ('Konjungtivitis', 'Mata merah, berair, terasa mengganjal'),
+    ('Diare akut', 'BAB cair 5x sejak kemarin, tanpa darah'),
+]
+GOLONGAN_DARAH = [value for value, _ in Pasien.GOLONGAN_DARAH_CHOICES]
+METODE = ['tunai'] * 5 + ['transfer'] * 2 + ['qris'] * 2 + ['asuransi']
+
+# Model yang timestamp auto_now/auto_now_add-nya diisi sendiri (tanggal historis)
+MODEL_HISTORIS = (CustomUser, Dokter, Pasien, JanjiTemu, RekamMedis, Resep, Pembayaran)
+
+# Konteks yang diwarisi worker lewat fork (diisi sebelum pool dibuat)
+_konteks = {}
+
+
+@contextmanager
+def timestamp_manual(*models):
+    """Matikan auto_now/auto_now_add sementara supaya created_at dkk. bisa diisi tanggal historis"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    semula = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in semula:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _waktu(tanggal, jam):
+    return timezone.make_aware(datetime.combine(tanggal, jam))
+
+
+def _nama(rng):
+    return rng.choice(NAMA_DEPAN), rng.choice(NAMA_BELAKANG)
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# ==================== MASTER DATA ====================
+
+def _buat_dokter(rng, jumlah, mulai, password):
+    """Dokter + user-nya; kembalikan [(dokter_id, kode, biaya_konsultasi)]"""
+    users, profil = [], []
+    for i in range(1, jumlah + 1):
+        depan, belakang = _nama(rng)
+        spesialisasi, biaya = SPESIALISASI[(i - 1) % len(SPESIALISASI)]
+        dibuat = _waktu(mulai, time(8))
+        users.append(CustomUser(
+            username=f'dr.sim{i:03d}', email=f'dr.sim{i:03d}@kliniksehat.com', password=password,
+            first_name=depan, last_name=belakang, role='dokter', date_joined=dibuat,
+        ))
+        profil.append(dict(
+            spesialisasi=spesialisasi, no_str=f'STR-SIM-{i:04d}', biaya_konsultasi=biaya, created_at=dibuat,
+            jadwal_praktik={hari: {'mulai': '08:00', 'selesai': '16:00'}
+                            for hari in ('senin', 'selasa', 'rabu', 'kamis', 'jumat', 'sabtu')},
+        ))
+    CustomUser.objects.bulk_create(users)
+    dokter = Dokter.objects.bulk_create([
+        Dokter(user=user, updated_at=data['created_at'], **data) for user, data in zip(users, profil)
+    ])
+    return [
+        (obj.pk, (user.first_name.upper()[:3] + 'XXX')[:3], obj.biaya_konsultasi)
+        for obj, user in zip(dokter, users)
+    ]
+
+
+def _buat_pasien(rng, jumlah, mulai, akhir, password, batch_size, log):
+    """Pasien + user-nya; no_rm dipesan per tahun daftar dari SequenceCounter. Kembalikan list pasien_id"""
+    rentang = (akhir - mulai).days
+    daftar = sorted(mulai + timedelta(days=rng.randrange(rentang)) for _ in range(jumlah))
+    nomor = {}
+    for tahun, n in Counter(tanggal.year for tanggal in daftar).items():
+        nomor[tahun] = SequenceCounter.reserve(f'RM{tahun}', n)
+
+    pasien_ids = []
+    for offset, chunk in enumerate(_batches(daftar, batch_size)):
+        users, profil = [], []
+        for i, tanggal in enumerate(chunk, offset * batch_size + 1):
+            depan, belakang = _nama(rng)
+            dibuat = _waktu(tanggal, time(rng.randrange(7, 20), rng.randrange(60)))
+            users.append(CustomUser(
+                username=f'psn{i:06d}', email=f'psn{i:06d}@mail.com', password=password,
+                first_name=depan, last_name=belakang, role='pasien', date_joined=dibuat,
+                phone=f'08{rng.randrange(10 ** 9, 10 ** 10)}',
+            ))
+            no_rm = f'RM{tanggal.year}{nomor[tanggal.year]:05d}'
+            nomor[tanggal.year] += 1
+            profil.append(Pasien(
+                no_rm=no_rm, created_at=dibuat, updated_at=dibuat,
+                tanggal_lahir=date(rng.randrange(1950, 2022), rng.randrange(1, 13), rng.randrange(1, 29)),
+                golongan_darah=rng.choice(GOLONGAN_DARAH),
+                alergi=rng.choice(['Tidak ada'] * 8 + ['Amoxicillin', 'Seafood']),
+            ))
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users)
+            for user, pasien in zip(users, profil):
+                pasien.user = user
+            ids = [pasien.pk for pasien in Pasien.objects.bulk_create(profil)]
+            # bulk_create tidak mengirim signal: index pencarian diisi langsung
+            sinkron_pasien_search(ids)
+        pasien_ids += ids
+        log(f'   pasien {len(pasien_ids)}/{jumlah}')
+    return pasien_ids
+
+
+# ==================== TRANSAKSI PER PARTISI DOKTER ====================
+
+def _isi_partisi(partisi):
+    """
+    Janji temu beserta rekam medis, tindakan, resep, detail resep dan pembayaran
+    untuk satu dokter sepanjang periode. Nomor antrian per (dokter, tanggal) hanya
+    dibuat oleh partisi ini, jadi partisi bisa jalan paralel.
+    """
+    index, (dokter_id, kode, biaya_konsultasi) = partisi
+    k = _konteks
+    rng = random.Random(f"{k['seed']}:dokter:{index}")
+    today = timezone.localdate()
+    jumlah = Counter()
+    buffer = []
+    antrian_ke_depan = []
+
+    tanggal = k['mulai']
+    while tanggal <= today + timedelta(days=HARI_KE_DEPAN):
+        # Minggu libur; Senin paling ramai
+        faktor = (1.3, 1.0, 1.0, 1.0, 1.0, 0.7, 0)[tanggal.weekday()]
+        lam = k['per_hari'] * faktor
+        n = max(0, round(rng.gauss(lam, math.sqrt(lam)))) if lam else 0
+        for nomor in range(1, n + 1):
+            buffer.append((tanggal, nomor))
+        if n and tanggal >= today:
+            antrian_ke_depan.append(AntrianCounter(dokter_id=dokter_id, tanggal=tanggal, last_number=n))
+        if len(buffer) >= k['batch_size']:
+            jumlah.update(_tulis_batch(rng, buffer, dokter_id, kode, biaya_konsultasi))
+            buffer = []
+        tanggal += timedelta(days=1)
+    if buffer:
+        jumlah.update(_tulis_batch(rng, buffer, dokter_id, kode, biaya_konsultasi))
+    AntrianCounter.objects.bulk_create(antrian_ke_depan)
+    return dict(jumlah)
+
+
+def _status_janji(rng, tanggal, today):
+    if tanggal > today:
+        return rng.choice(['pending'] * 3 + ['confirmed'])
+    if tanggal == today:
+        return rng.choice(['pending', 'confirmed', 'completed'])
+    return rng.choice(['completed'] * 17 + ['cancelled'] * 2 + ['pending'])
+
+
+def _tulis_batch(rng, slots, dokter_id, kode, biaya_konsultasi):
+    k = _konteks
+    today = timezone.localdate()
+    janji, rekam, tindakan, resep, detail, bayar = [], [], [], [], [], []
+
+    for tanggal, nomor in slots:
+        jam = (datetime.combine(tanggal, time(8)) + timedelta(minutes=15 * (nomor - 1))).time()
+        waktu = _waktu(tanggal, jam)
+        dibuat = waktu - timedelta(days=rng.randrange(0, 8), hours=rng.randrange(0, 5))
+        status = _status_janji(rng, tanggal, today)
+        janji.append(JanjiTemu(
+            pasien_id=rng.choice(k['pasien_ids']), dokter_id=dokter_id, tanggal=tanggal, waktu=jam,
+            keluhan=rng.choice(KELUHAN), status=status, nomor_antrian=f'{kode}-{nomor:02d}',
+            created_at=dibuat, updated_at=waktu if status == 'completed' else dibuat,
+        ))
+
+    with transaction.atomic():
+        JanjiTemu.objects.bulk_create(janji)
+
+        selesai = [obj for obj in janji if obj.status == 'completed']
+        for obj in selesai:
+            diagnosa, anamnesa = rng.choice(DIAGNOSA)
+            waktu = _waktu(obj.tanggal, obj.waktu)
+            rekam.append(RekamMedis(
+                pasien_id=obj.pasien_id, dokter_id=dokter_id, janji_temu=obj,
+                diagnosa=diagnosa, anamnesa=anamnesa, pemeriksaan_fisik='TD 120/80 mmHg, suhu 36.8°C',
+                tanggal_periksa=waktu, waktu_mulai=waktu, waktu_selesai=waktu + timedelta(minutes=15),
+                created_at=waktu, updated_at=waktu,
+            ))
+        RekamMedis.objects.bulk_create(rekam)
+        index_rekam_medis(rekam)
+
+        biaya = {}
+        for obj, rm in zip(selesai, rekam):
+            waktu = rm.tanggal_periksa
+            biaya_tindakan = biaya_obat = Decimal('0')
+            if rng.random() < 0.3:
+                layanan_id, harga = rng.choice(k['layanan'])
+                tindakan.append(RekamMedis.tindakan.through(rekammedis_id=rm.pk, layanantindakan_id=layanan_id))
+                biaya_tindakan = harga
+            if rng.random() < 0.75:
+                diserahkan = obj.tanggal < today
+                resep.append(Resep(
+                    rekam_medis=rm, status='delivered' if diserahkan else 'pending',
+                    processed_by_id=rng.choice(k['apoteker']) if diserahkan and k['apoteker'] else None,
+                    processed_at=waktu + timedelta(minutes=45) if diserahkan else None,
+                    tanggal_resep=waktu, created_at=waktu, updated_at=waktu,
+                ))
+                for obat_id, harga in rng.sample(k['obat'], min(len(k['obat']), rng.randint(1, 3))):
+                    jumlah_obat = rng.choice([5, 10, 10, 15, 20])
+                    detail.append((len(resep) - 1, obat_id, jumlah_obat, harga))
+                    biaya_obat += harga * jumlah_obat
+            biaya[obj.pk] = (biaya_tindakan, biaya_obat)
+        RekamMedis.tindakan.through.objects.bulk_create(tindakan)
+        Resep.objects.bulk_create(resep)
+        DetailResep.objects.bulk_create([
+            DetailResep(resep=resep[i], obat_id=obat_id, jumlah=jumlah_obat, harga_satuan=harga,
+                        aturan_pakai='3x1 setelah makan')
+            for i, obat_id, jumlah_obat, harga in detail
+        ])
+
+        # Invoice INV-YYYYMMDD-XXXX: nomor dipesan per tanggal dari SequenceCounter
+        per_tanggal = defaultdict(list)
+        for obj in selesai:
+            per_tanggal[obj.tanggal].append(obj)
+        for tanggal, daftar in per_tanggal.items():
+            prefix = f"INV-{tanggal.strftime('%Y%m%d')}"
+            nomor = SequenceCounter.reserve(prefix, len(daftar))
+            for i, obj in enumerate(daftar):
+                biaya_tindakan, biaya_obat = biaya[obj.pk]
+                waktu = _waktu(obj.tanggal, obj.waktu) + timedelta(minutes=30)
+                lunas = (today - tanggal).days > 3 or rng.random() < 0.6
+                bayar.append(Pembayaran(
+                    janji_temu=obj, metode=rng.choice(METODE), status='lunas' if lunas else 'pending',
+                    tanggal_bayar=waktu if lunas else None, invoice_number=f'{prefix}-{nomor + i:04d}',
+                    processed_by_id=rng.choice(k['kasir']) if lunas and k['kasir'] else None,
+                    biaya_konsultasi=biaya_konsultasi, biaya_obat=biaya_obat, biaya_tindakan=biaya_tindakan,
+                    total_biaya=biaya_konsultasi + biaya_obat + biaya_tindakan,
+                    created_at=waktu, updated_at=waktu,
+                ))
+        Pembayaran.objects.bulk_create(bayar)
+
+    return {
+        'janji_temu': len(janji), 'rekam_medis': len(rekam), 'tindakan': len(tindakan),
+        'resep': len(resep), 'detail_resep': len(detail), 'pembayaran': len(bayar),
+    }
+
+
+def _init_worker():
+    # Koneksi hasil fork milik proses induk; worker membuka koneksinya sendiri
+    connections.close_all()
+
+
+def seed_skala(scale, tahun=3, seed=42, workers=1, batch_size=2000, log=lambda pesan: None):
+    """
+    Isi database dengan volume sintetis sebesar `scale` unit (lihat PASIEN_PER_SKALA dkk.)
+    yang tersebar `tahun` tahun ke belakang sampai HARI_KE_DEPAN hari ke depan.
+    Transaksi diisi per partisi dokter; dengan workers > 1 partisi dikerjakan paralel
+    oleh proses terpisah (hanya untuk database yang mendukung banyak writer).
+    Kembalikan jumlah baris per tabel.
+    """
+    rng = random.Random(seed)
+    today = timezone.localdate()
+    mulai = today - timedelta(days=365 * tahun)
+    jumlah_pasien = max(1, round(PASIEN_PER_SKALA * scale))
+    jumlah_dokter = max(1, round(DOKTER_PER_SKALA * scale))
+    hari_kerja = (365 * tahun + HARI_KE_DEPAN) * 6 / 7
+    password = make_password('pasien123')
+
+    if workers > 1 and connection.vendor == 'sqlite':
+        log('   SQLite hanya punya satu writer: partisi dikerjakan berurutan')
+        workers = 1
+
+    with timestamp_manual(*MODEL_HISTORIS):
+        log(f'   {jumlah_dokter} dokter, {jumlah_pasien} pasien')
+        dokter = _buat_dokter(rng, jumlah_dokter, mulai, make_password('dokter123'))
+        pasien_ids = _buat_pasien(rng, jumlah_pasien, mulai, today, password, batch_size, log)
+
+        _konteks.update(
+            seed=seed, mulai=mulai, batch_size=batch_size, pasien_ids=pasien_ids,
+            per_hari=jumlah_pasien * JANJI_PER_PASIEN / jumlah_dokter / hari_kerja,
+            obat=list(Obat.objects.filter(is_active=True).order_by('id').values_list('id', 'harga_jual')),
+            layanan=list(LayananTindakan.objects.filter(is_active=True).order_by('id').values_list('id', 'biaya')),
+            apoteker=list(Apoteker.objects.order_by('id').values_list('id', flat=True)),
+            kasir=list(Kasir.objects.order_by('id').values_list('id', flat=True)),
+        )
+        partisi = list(enumerate(dokter))
+        total = Counter(pasien=jumlah_pasien, dokter=jumlah_dokter)
+        if workers > 1:
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker) as pool:
+                for selesai, hasil in enumerate(pool.imap_unordered(_isi_partisi, partisi), 1):
+                    total.update(hasil)
+                    log(f'   partisi dokter {selesai}/{len(partisi)}: {total["janji_temu"]} janji temu')
+        else:
+            for selesai, item in enumerate(partisi, 1):
+                total.update(_isi_partisi(item))
+                log(f'   partisi dokter {selesai}/{len(partisi)}: {total["janji_temu"]} janji temu')
+
+    # Rollup revenue & cache dashboard tidak ikut ter-update oleh bulk_create
+    DailyRevenueRollup.rebuild()
+    invalidate_dashboard_stats()
+    return dict(total)
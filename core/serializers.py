@@ -1,10 +1,15 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .inventory import StokTidakCukup, apply_stock_deltas
 from .models import (
     CustomUser, Dokter, Pasien, Resepsionis, Apoteker, Kasir,
-    LayananTindakan, JanjiTemu, RekamMedis, Obat, Resep, DetailResep, Pembayaran
+    LayananTindakan, JanjiTemu, RekamMedis, Obat, ObatLot, ObatForecast, Resep, DetailResep, Pembayaran
 )
+from .slots import cek_slot
 
 
 # ==================== USER SERIALIZERS ====================
@@ -353,9 +358,63 @@ class ObatSerializer(serializers.ModelSerializer):
                   'supplier', 'deskripsi', 'is_active', 'status_stok', 'created_at']
 
 
+
+class ObatLotSerializer(serializers.ModelSerializer):
+    """Serializer untuk lot/batch Obat"""
+    class Meta:
+        model = ObatLot
+        fields = ['id', 'obat', 'nomor_lot', 'expired_date', 'jumlah', 'created_at']
+
+
+class ObatForecastSerializer(serializers.ModelSerializer):
+    """Serializer untuk forecast reorder point Obat (queryset dari forecast.with_days_of_cover)"""
+    obat_nama = serializers.CharField(source='obat.nama', read_only=True)
+    stok = serializers.IntegerField(source='obat.stok', read_only=True)
+    days_of_cover = serializers.FloatField(read_only=True)
+    perlu_restock = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ObatForecast
+        fields = ['obat', 'obat_nama', 'stok', 'rata_rata_7_hari', 'rata_rata_28_hari', 'std_harian',
+                  'kebutuhan_harian', 'lead_time_hari', 'safety_stock', 'reorder_point',
+                  'days_of_cover', 'perlu_restock', 'dihitung_at']
+    
+    def get_perlu_restock(self, obj):
+        return obj.obat.stok <= obj.reorder_point
+
 # ==================== JANJI TEMU SERIALIZERS ====================
 
-class JanjiTemuSerializer(serializers.ModelSerializer):
+class SlotUnikMixin:
+    """
+    Simpan janji temu dengan constraint slot unik sebagai penjaga terakhir:
+    dua request bersamaan untuk slot yang sama sama-sama lolos validasi, yang
+    kedua ditolak database dan dikembalikan sebagai 400, bukan 500.
+    IntegrityError lain (nomor antrian, FK, NOT NULL) tetap diteruskan.
+    """
+    SLOT_BENTROK = 'Slot ini baru saja dibooking. Pilih slot lain.'
+    # PostgreSQL menyebut nama constraint, SQLite menyebut kolomnya
+    SLOT_CONSTRAINT = (
+        'unique_slot_aktif_per_dokter_tanggal',
+        'janji_temu.dokter_id, janji_temu.tanggal, janji_temu.waktu',
+    )
+    
+    def _simpan(self, simpan):
+        try:
+            with transaction.atomic():
+                return simpan()
+        except IntegrityError as e:
+            if not any(penanda in str(e) for penanda in self.SLOT_CONSTRAINT):
+                raise
+            raise serializers.ValidationError(self.SLOT_BENTROK)
+    
+    def create(self, validated_data):
+        return self._simpan(lambda: super(SlotUnikMixin, self).create(validated_data))
+    
+    def update(self, instance, validated_data):
+        return self._simpan(lambda: super(SlotUnikMixin, self).update(instance, validated_data))
+
+
+class JanjiTemuSerializer(SlotUnikMixin, serializers.ModelSerializer):
     """Serializer untuk Janji Temu"""
     pasien = PasienSerializer(read_only=True)
     dokter = DokterPublicSerializer(read_only=True)
@@ -375,15 +434,35 @@ class JanjiTemuSerializer(serializers.ModelSerializer):
                   'waktu', 'keluhan', 'status', 'status_display', 'nomor_antrian', 
                   'catatan', 'has_rekam_medis', 'has_pembayaran', 'created_at']
         read_only_fields = ['nomor_antrian']
+        # nomor_antrian diisi ulang oleh JanjiTemu.save saat dokter/tanggal berubah;
+        # validator unique (dokter, tanggal, nomor_antrian) DRF akan memeriksa nomor lama
+        validators = []
+    
+    def validate(self, data):
+        # Jadwal ulang (dokter/tanggal/waktu berubah) harus ke slot praktik yang masih kosong
+        if self.instance is not None:
+            dokter = data.get('dokter', self.instance.dokter)
+            tanggal = data.get('tanggal', self.instance.tanggal)
+            waktu = data.get('waktu', self.instance.waktu)
+            if (dokter.pk, tanggal, waktu) != (self.instance.dokter_id, self.instance.tanggal, self.instance.waktu):
+                pesan = cek_slot(dokter, tanggal, waktu, kecuali=self.instance.pk)
+                if pesan:
+                    raise serializers.ValidationError(pesan)
+        return data
     
     def get_has_rekam_medis(self, obj):
+        # Pakai flag hasil JanjiTemu.objects.for_api() jika tersedia
+        if hasattr(obj, 'rekam_medis_exists'):
+            return obj.rekam_medis_exists
         return hasattr(obj, 'rekam_medis')
     
     def get_has_pembayaran(self, obj):
+        if hasattr(obj, 'pembayaran_exists'):
+            return obj.pembayaran_exists
         return hasattr(obj, 'pembayaran')
 
 
-class JanjiTemuBookingSerializer(serializers.ModelSerializer):
+class JanjiTemuBookingSerializer(SlotUnikMixin, serializers.ModelSerializer):
     """Serializer untuk booking janji temu (pasien)"""
     dokter_id = serializers.PrimaryKeyRelatedField(
         queryset=Dokter.objects.filter(status_aktif=True), source='dokter'
@@ -400,28 +479,11 @@ class JanjiTemuBookingSerializer(serializers.ModelSerializer):
         
         if not dokter or not tanggal or not waktu:
             return data
-            
-        # Get day of week in Indonesian
-        days = ['senin', 'selasa', 'rabu', 'kamis', 'jumat', 'sabtu', 'minggu']
-        day_name = days[tanggal.weekday()]
-        
-        jadwal = dokter.jadwal_praktik or {}
-        if day_name not in jadwal:
-            raise serializers.ValidationError(
-                f"Dokter {dokter.user.get_full_name()} tidak praktik pada hari {day_name.capitalize()}."
-            )
-            
-        shift = jadwal[day_name]
-        mulai = shift.get('mulai')
-        selesai = shift.get('selesai')
-        
-        if mulai and selesai:
-            waktu_str = waktu.strftime('%H:%M')
-            if waktu_str < mulai or waktu_str > selesai:
-                raise serializers.ValidationError(
-                    f"Jam praktik Dokter {dokter.user.get_full_name()} pada hari {day_name.capitalize()} adalah {mulai} - {selesai}."
-                )
-                
+        
+        pesan = cek_slot(dokter, tanggal, waktu)
+        if pesan:
+            raise serializers.ValidationError(pesan)
+        
         return data
 
     def create(self, validated_data):
@@ -473,7 +535,8 @@ class RekamMedisSerializer(serializers.ModelSerializer):
 class RekamMedisCreateSerializer(serializers.ModelSerializer):
     """Serializer untuk create Rekam Medis (dokter)"""
     janji_temu_id = serializers.PrimaryKeyRelatedField(
-        queryset=JanjiTemu.objects.filter(status='confirmed'), source='janji_temu'
+        queryset=JanjiTemu.objects.filter(status='confirmed').select_related('pasien__user', 'dokter'),
+        source='janji_temu'
     )
     tindakan_ids = serializers.PrimaryKeyRelatedField(
         queryset=LayananTindakan.objects.all(), many=True, source='tindakan', required=False
@@ -485,7 +548,49 @@ class RekamMedisCreateSerializer(serializers.ModelSerializer):
         fields = ['janji_temu_id', 'diagnosa', 'anamnesa', 'pemeriksaan_fisik', 
                   'tindakan_ids', 'catatan', 'obat_list']
     
+    def validate_obat_list(self, value):
+        """Validasi semua baris resep sekaligus: satu query obat, cek aktif, stok dan expired"""
+        from django.utils import timezone
+        
+        lines = []
+        for item in value:
+            try:
+                obat_id = int(item['obat_id'])
+                jumlah = int(item.get('jumlah', 1))
+            except (KeyError, TypeError, ValueError):
+                raise serializers.ValidationError('Setiap obat wajib memiliki obat_id dan jumlah berupa angka')
+            if jumlah < 1:
+                raise serializers.ValidationError('Jumlah obat minimal 1')
+            lines.append((obat_id, jumlah, item.get('aturan_pakai', '')))
+        
+        obat_ids = {obat_id for obat_id, _, _ in lines}
+        obat_map = Obat.objects.in_bulk(obat_ids)
+        # Stok layak pakai = isi lot yang belum kedaluwarsa (sama dengan alokasi FEFO resep)
+        layak = dict(
+            ObatLot.objects.filter(obat_id__in=obat_ids, jumlah__gt=0)
+            .exclude(expired_date__lte=timezone.localdate())
+            .values('obat_id').annotate(total=Sum('jumlah')).values_list('obat_id', 'total')
+        )
+        kebutuhan = {}
+        for obat_id, jumlah, _ in lines:
+            obat = obat_map.get(obat_id)
+            if obat is None or not obat.is_active:
+                raise serializers.ValidationError(f'Obat dengan id {obat_id} tidak ditemukan')
+            tersedia = layak.get(obat_id, 0)
+            if not tersedia and obat.stok:
+                raise serializers.ValidationError(f'{obat.nama} sudah kedaluwarsa')
+            kebutuhan[obat_id] = kebutuhan.get(obat_id, 0) + jumlah
+            if kebutuhan[obat_id] > tersedia:
+                raise serializers.ValidationError(f'Stok {obat.nama} tidak cukup (tersedia {tersedia})')
+        
+        return [
+            {'obat': obat_map[obat_id], 'jumlah': jumlah, 'aturan_pakai': aturan_pakai}
+            for obat_id, jumlah, aturan_pakai in lines
+        ]
+    
     def create(self, validated_data):
+        from .signals import unschedule_recalculate
+        
         obat_list = validated_data.pop('obat_list', [])
         tindakan = validated_data.pop('tindakan', [])
         
@@ -493,37 +598,40 @@ class RekamMedisCreateSerializer(serializers.ModelSerializer):
         dokter = request.user.dokter_profile
         janji_temu = validated_data['janji_temu']
         
-        # Create rekam medis
-        rekam_medis = RekamMedis.objects.create(
-            dokter=dokter,
-            pasien=janji_temu.pasien,
-            **validated_data
-        )
-        
-        # Add tindakan
-        rekam_medis.tindakan.set(tindakan)
-        
-        # Create resep if obat_list provided
-        if obat_list:
-            resep = Resep.objects.create(rekam_medis=rekam_medis)
-            for obat_data in obat_list:
-                obat = Obat.objects.get(pk=obat_data['obat_id'])
-                DetailResep.objects.create(
-                    resep=resep,
-                    obat=obat,
-                    jumlah=obat_data.get('jumlah', 1),
-                    aturan_pakai=obat_data.get('aturan_pakai', ''),
-                    harga_satuan=obat.harga_jual
-                )
-        
-        # Update janji temu status
-        janji_temu.status = 'completed'
-        janji_temu.save()
-        
-        # Create pembayaran
-        pembayaran = Pembayaran.objects.create(janji_temu=janji_temu)
-        pembayaran.calculate_total()
-        pembayaran.save()
+        with transaction.atomic():
+            # Create rekam medis
+            rekam_medis = RekamMedis.objects.create(
+                dokter=dokter,
+                pasien=janji_temu.pasien,
+                **validated_data
+            )
+            
+            # Add tindakan
+            rekam_medis.tindakan.set(tindakan)
+            
+            # Create resep if obat_list provided (satu bulk insert untuk semua baris)
+            if obat_list:
+                resep = Resep.objects.create(rekam_medis=rekam_medis)
+                DetailResep.objects.bulk_create([
+                    DetailResep(
+                        resep=resep,
+                        obat=line['obat'],
+                        jumlah=line['jumlah'],
+                        aturan_pakai=line['aturan_pakai'],
+                        harga_satuan=line['obat'].harga_jual
+                    )
+                    for line in obat_list
+                ])
+            
+            # Update janji temu status
+            janji_temu.status = 'completed'
+            janji_temu.save()
+            
+            # Create pembayaran dengan total final; tidak perlu dihitung ulang saat commit
+            pembayaran = Pembayaran(janji_temu=janji_temu)
+            pembayaran.calculate_total()
+            pembayaran.save()
+            unschedule_recalculate(janji_temu.id)
         
         return rekam_medis
 
@@ -608,14 +716,14 @@ class ResepProcessSerializer(serializers.ModelSerializer):
         if instance.status == 'delivered':
             instance.processed_by = request.user.apoteker_profile
             instance.processed_at = timezone.now()
-            
-            # Kurangi stok obat
-            for detail in instance.detail_resep.all():
-                obat = detail.obat
-                obat.stok -= detail.jumlah
-                obat.save()
         
-        instance.save()
+        # Stok dikurangi sekali oleh signal reduce_stok_on_resep_delivered (core/inventory.py);
+        # notifikasi (stok menipis, resep siap) ditulis sekali saat commit
+        try:
+            with transaction.atomic():
+                instance.save()
+        except StokTidakCukup as e:
+            raise serializers.ValidationError({'status': e.messages})
         return instance
 
 
@@ -722,6 +830,12 @@ class StokAdjustmentSerializer(serializers.ModelSerializer):
             'catatan', 'created_by', 'created_by_name', 'created_at'
         ]
         read_only_fields = ['created_by', 'created_at']
+    
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except StokTidakCukup as e:
+            raise serializers.ValidationError({'jumlah': e.messages})
 
 
 # ==================== PHASE 2: NOTIFIKASI SERIALIZERS ====================
@@ -879,3 +993,19 @@ class ObatSerializer(serializers.ModelSerializer):
                   'satuan_display', 'harga_jual', 'harga_beli', 'expired_date', 
                   'supplier', 'deskripsi', 'is_active', 'status_stok', 
                   'is_expired', 'days_until_expired', 'created_at']
+    
+    def update(self, instance, validated_data):
+        # Stok tidak ditulis lewat save() (bisa menimpa mutasi paralel); perubahan
+        # stok dicatat sebagai koreksi lewat core/inventory.py
+        stok = validated_data.pop('stok', None)
+        with transaction.atomic():
+            for field, value in validated_data.items():
+                setattr(instance, field, value)
+            instance.save(update_fields=[*validated_data, 'updated_at'])
+            if stok is not None and stok != instance.stok:
+                try:
+                    stok_baru = apply_stock_deltas({instance.pk: stok - instance.stok}, 'koreksi')
+                except StokTidakCukup as e:
+                    raise serializers.ValidationError({'stok': e.messages})
+                instance.stok = stok_baru[instance.pk]
+        return instance
@@ -1,51 +1,135 @@
 """
 Django Signals untuk Auto-Calculation dan Audit Trail
 """
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
 from .models import (
     RekamMedis, DetailResep, Pembayaran, JanjiTemu, 
-    Resep, AuditLog, Notifikasi, Obat
+    Resep, AuditLog, Notifikasi, Obat, Pasien, Dokter, DailyRevenueRollup, CustomUser
 )
+from .audit import (
+    AuditContext, current_actor, current_context as current_audit_context,
+    record as record_audit
+)
+from .batching import CommitBatch
+from .inventory import apply_stock_deltas, catat_saldo_awal, sinkron_expired_lot_default
+from .notifications import alert_stok_menipis, notify, ubah_unread
+from .realtime import channel_antrian, publish_antrian, publish_keluar_antrian
+from .search import FIELDS_KLINIS, index_rekam_medis, sinkron_pasien_search
+from .slots import invalidate_slot
+from .stats import invalidate_dashboard_stats
 
 
 # ============================================
 # PHASE 1: AUTO-CALCULATE PEMBAYARAN
 # ============================================
 
+class RecalculatePembayaranBatch(CommitBatch):
+    """
+    Janji temu yang pembayarannya perlu dihitung ulang. Perubahan rekam medis,
+    tindakan dan detail resep dalam satu transaksi digabung sehingga
+    calculate_total jalan paling banyak sekali per pembayaran saat commit.
+    """
+    entries_factory = set
+    
+    def __init__(self):
+        super().__init__()
+        self.janji_per_resep = {}
+    
+    def add_resep(self, resep_id):
+        # Cukup satu lookup resep -> janji temu per resep per transaksi
+        if resep_id not in self.janji_per_resep:
+            self.janji_per_resep[resep_id] = RekamMedis.objects.filter(
+                resep=resep_id
+            ).values_list('janji_temu_id', flat=True).first()
+        if self.janji_per_resep[resep_id]:
+            self.entries.add(self.janji_per_resep[resep_id])
+    
+    def write(self, janji_temu_ids):
+        for pembayaran in Pembayaran.objects.filter(janji_temu_id__in=janji_temu_ids):
+            pembayaran.calculate_total()
+            pembayaran.save()
+
+
+def schedule_recalculate(janji_temu_id=None, resep_id=None):
+    """Hitung ulang pembayaran janji temu/resep ini saat transaksi commit"""
+    batch = RecalculatePembayaranBatch.current()
+    if resep_id:
+        batch.add_resep(resep_id)
+    elif janji_temu_id:
+        batch.entries.add(janji_temu_id)
+    if batch.entries:
+        batch.register()
+
+
+def unschedule_recalculate(janji_temu_id):
+    """Batalkan hitung ulang; dipakai jika pemanggil sudah menghitung total final"""
+    for batch in RecalculatePembayaranBatch.pending():
+        batch.entries.discard(janji_temu_id)
+
+
 @receiver(post_save, sender=RekamMedis)
 def update_pembayaran_on_rekam_medis(sender, instance, created, **kwargs):
     """Update pembayaran saat rekam medis dibuat/diupdate"""
-    try:
-        if instance.janji_temu and hasattr(instance.janji_temu, 'pembayaran'):
-            pembayaran = instance.janji_temu.pembayaran
-            pembayaran.calculate_total()
-            pembayaran.save()
-    except Pembayaran.DoesNotExist:
-        pass
+    schedule_recalculate(janji_temu_id=instance.janji_temu_id)
+
+
+@receiver(m2m_changed, sender=RekamMedis.tindakan.through)
+def update_pembayaran_on_tindakan(sender, instance, action, **kwargs):
+    """Update pembayaran saat tindakan rekam medis berubah"""
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, RekamMedis):
+        schedule_recalculate(janji_temu_id=instance.janji_temu_id)
 
 
 @receiver(post_save, sender=DetailResep)
 def update_pembayaran_on_detail_resep(sender, instance, created, **kwargs):
     """Update pembayaran saat detail resep ditambah/diupdate"""
-    try:
-        pembayaran = instance.resep.rekam_medis.janji_temu.pembayaran
-        pembayaran.calculate_total()
-        pembayaran.save()
-    except (Pembayaran.DoesNotExist, AttributeError):
-        pass
+    schedule_recalculate(resep_id=instance.resep_id)
 
 
 @receiver(post_delete, sender=DetailResep)
 def update_pembayaran_on_detail_resep_delete(sender, instance, **kwargs):
     """Update pembayaran saat detail resep dihapus"""
-    try:
-        pembayaran = instance.resep.rekam_medis.janji_temu.pembayaran
-        pembayaran.calculate_total()
-        pembayaran.save()
-    except (Pembayaran.DoesNotExist, AttributeError):
-        pass
+    schedule_recalculate(resep_id=instance.resep_id)
+
+
+# ============================================
+# ROLLUP REVENUE HARIAN
+# ============================================
+
+@receiver(post_save, sender=Pembayaran)
+def update_revenue_rollup(sender, instance, created, **kwargs):
+    """Terapkan delta kontribusi pembayaran ke DailyRevenueRollup"""
+    if created:
+        awal = None
+    elif hasattr(instance, '_rollup_awal'):
+        awal = instance._rollup_awal
+    else:
+        # State awal tidak diketahui; diperbaiki oleh `manage.py rebuild_rollups`
+        return
+    
+    baru = instance.revenue_contribution()
+    if awal != baru:
+        dokter_id = instance.janji_temu.dokter_id
+        if awal:
+            DailyRevenueRollup.apply(dokter_id, awal, sign=-1)
+        if baru:
+            DailyRevenueRollup.apply(dokter_id, baru)
+    instance._rollup_awal = baru
+
+
+@receiver(post_delete, sender=Pembayaran)
+def update_revenue_rollup_on_delete(sender, instance, **kwargs):
+    """Keluarkan pembayaran lunas yang dihapus dari DailyRevenueRollup"""
+    awal = getattr(instance, '_rollup_awal', None)
+    if awal:
+        try:
+            DailyRevenueRollup.apply(instance.janji_temu.dokter_id, awal, sign=-1)
+        except JanjiTemu.DoesNotExist:
+            pass
 
 
 # ============================================
@@ -54,49 +138,66 @@ def update_pembayaran_on_detail_resep_delete(sender, instance, **kwargs):
 
 @receiver(post_save, sender=Resep)
 def reduce_stok_on_resep_delivered(sender, instance, created, **kwargs):
-    """Kurangi stok obat saat resep status delivered"""
-    if not created and instance.status == 'delivered':
-        for detail in instance.detail_resep.all():
-            obat = detail.obat
-            obat.stok -= detail.jumlah
-            obat.save()
+    """Kurangi stok obat sekali saat status resep berubah menjadi delivered"""
+    if not created and instance.status == 'delivered' and getattr(instance, '_status_awal', None) != 'delivered':
+        jumlah_per_obat = instance.detail_resep.values('obat').annotate(total=Sum('jumlah')).order_by()
+        apply_stock_deltas({row['obat']: -row['total'] for row in jumlah_per_obat}, 'resep', resep=instance)
+    instance._status_awal = instance.status
+
+
+@receiver(post_save, sender=Obat)
+def catat_stok_awal(sender, instance, created, **kwargs):
+    """Catat stok obat baru di ledger StokMovement dan lot default"""
+    if created:
+        catat_saldo_awal(instance)
+    elif getattr(instance, '_expired_awal', instance.expired_date) != instance.expired_date:
+        sinkron_expired_lot_default(instance)
+    instance._expired_awal = instance.expired_date
 
 
 # ============================================
 # PHASE 2: AUDIT TRAIL
 # ============================================
 
-def get_client_ip(request):
-    """Get client IP from request"""
-    if hasattr(request, 'META'):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
-    return None
-
-
 def log_audit(user, action, model_name, object_id, object_str, changes=None, request=None):
-    """Log audit trail"""
-    ip_address = None
-    user_agent = ''
-    
-    if request:
-        ip_address = get_client_ip(request)
-        user_agent = request.META.get('HTTP_USER_AGENT', '') if hasattr(request, 'META') else ''
+    """
+    Log audit trail. `user` boleh instance user atau user id; IP dan user agent
+    diambil dari `request`, atau dari konteks audit request yang sedang berjalan.
+    """
+    context = AuditContext(request) if request else current_audit_context()
     
-    AuditLog.objects.create(
-        user=user,
+    log = AuditLog(
         action=action,
         model_name=model_name,
         object_id=object_id,
         object_str=object_str,
         changes=changes or {},
-        ip_address=ip_address,
-        user_agent=user_agent
+        ip_address=context.ip_address if context else None,
+        user_agent=context.user_agent if context else ''
     )
+    if isinstance(user, int):
+        log.user_id = user
+    else:
+        log.user = user
+    
+    # Ditulis batch (bulk_create) saat transaksi commit, lihat core/audit.py
+    record_audit(log)
+
+
+def user_profil(instance, field):
+    """
+    user_id profil (dokter/kasir) pada FK `field` untuk aktor audit di luar
+    request: dari objek yang sudah dimuat, atau satu query values_list tanpa
+    memuat baris profilnya. None jika FK kosong.
+    """
+    descriptor = getattr(type(instance), field)
+    if descriptor.is_cached(instance):
+        profil = getattr(instance, field)
+        return profil.user_id if profil else None
+    pk = getattr(instance, f'{field}_id')
+    if pk is None:
+        return None
+    return descriptor.field.related_model.objects.filter(pk=pk).values_list('user_id', flat=True).first()
 
 
 @receiver(post_save, sender=RekamMedis)
@@ -104,7 +205,7 @@ def audit_rekam_medis(sender, instance, created, **kwargs):
     """Audit log untuk rekam medis"""
     action = 'create' if created else 'update'
     log_audit(
-        user=instance.dokter.user,
+        user=current_actor() or user_profil(instance, 'dokter'),
         action=action,
         model_name='RekamMedis',
         object_id=instance.id,
@@ -121,7 +222,7 @@ def audit_pembayaran(sender, instance, created, **kwargs):
     """Audit log untuk pembayaran"""
     action = 'create' if created else 'update'
     log_audit(
-        user=instance.processed_by.user if instance.processed_by else None,
+        user=current_actor() or user_profil(instance, 'processed_by'),
         action=action,
         model_name='Pembayaran',
         object_id=instance.id,
@@ -137,15 +238,9 @@ def audit_pembayaran(sender, instance, created, **kwargs):
 # PHASE 2: NOTIFIKASI SYSTEM
 # ============================================
 
-def send_notification(user, tipe, judul, pesan, data=None):
-    """Send notification to user"""
-    Notifikasi.objects.create(
-        user=user,
-        tipe=tipe,
-        judul=judul,
-        pesan=pesan,
-        data=data or {}
-    )
+def send_notification(user, tipe, judul, pesan, data=None, dedup_key=None):
+    """Send notification to user (ditulis saat transaksi commit)"""
+    notify(user, tipe, judul, pesan, data=data, dedup_key=dedup_key)
 
 
 @receiver(post_save, sender=JanjiTemu)
@@ -192,17 +287,131 @@ def notify_pembayaran_lunas(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=Obat)
 def notify_stok_menipis(sender, instance, created, **kwargs):
-    """Notify apoteker saat stok menipis"""
-    if not created and instance.stok < 10 and instance.stok > 0:
-        # Notify semua apoteker
-        from .models import Apoteker
-        apotekers = Apoteker.objects.all()
-        for apoteker in apotekers:
-            send_notification(
-                user=apoteker.user,
-                tipe='stok',
-                judul='Stok Obat Menipis',
-                pesan=f'Stok {instance.nama} tinggal {instance.stok} {instance.satuan}. '
-                      f'Segera lakukan pemesanan.',
-                data={'obat_id': instance.id}
-            )
+    """Notify apoteker saat stok menipis (edit manual data obat)"""
+    if not created:
+        alert_stok_menipis(instance)
+
+
+@receiver(post_save, sender=Notifikasi)
+def update_unread_on_notifikasi(sender, instance, created, **kwargs):
+    """Terapkan delta counter belum dibaca saat notifikasi dibuat atau status bacanya berubah"""
+    if created:
+        awal = True
+    elif hasattr(instance, '_is_read_awal'):
+        awal = instance._is_read_awal
+    else:
+        # State awal tidak diketahui; diperbaiki oleh `manage.py rekonsiliasi_notifikasi`
+        return
+    ubah_unread({instance.user_id: int(not instance.is_read) - int(not awal)})
+    instance._is_read_awal = instance.is_read
+
+
+@receiver(post_delete, sender=Notifikasi)
+def update_unread_on_notifikasi_delete(sender, instance, **kwargs):
+    """Keluarkan notifikasi belum dibaca yang dihapus dari counter"""
+    if not getattr(instance, '_is_read_awal', instance.is_read):
+        ubah_unread({instance.user_id: -1})
+
+
+# ============================================
+# LIVE ANTRIAN
+# ============================================
+
+AKSI_ANTRIAN = {
+    'confirmed': 'dikonfirmasi',
+    'completed': 'selesai',
+    'cancelled': 'dibatalkan',
+}
+
+
+@receiver(post_save, sender=JanjiTemu)
+def publish_delta_antrian(sender, instance, created, **kwargs):
+    """Kirim delta janji temu ke layar antrian (stream SSE) saat transaksi commit"""
+    if created:
+        aksi = 'baru'
+    elif getattr(instance, '_dipanggil', False):
+        aksi = 'dipanggil'
+    elif getattr(instance, '_status_awal', None) != instance.status:
+        aksi = AKSI_ANTRIAN.get(instance.status, 'diubah')
+    else:
+        aksi = 'diubah'
+    publish_antrian(instance, aksi)
+
+    # Dijadwal ulang: layar antrian lama juga harus melepas barisnya
+    slot_awal = getattr(instance, '_slot_awal', None)
+    if not created and slot_awal not in (None, (instance.dokter_id, instance.tanggal)):
+        publish_keluar_antrian(
+            instance.pk, *slot_awal, 'dipindah',
+            kecuali={channel_antrian(instance.tanggal), channel_antrian(instance.tanggal, instance.dokter_id)},
+        )
+    instance._status_awal = instance.status
+    instance._dipanggil = False
+
+
+@receiver(post_delete, sender=JanjiTemu)
+def publish_hapus_antrian(sender, instance, **kwargs):
+    """Hapus baris janji temu dari layar antrian saat transaksi commit"""
+    dokter_id, tanggal = getattr(instance, '_slot_awal', None) or (instance.dokter_id, instance.tanggal)
+    publish_keluar_antrian(instance.pk, dokter_id, tanggal, 'dihapus')
+
+
+# ============================================
+# INDEX PENCARIAN PASIEN & TEKS KLINIS
+# ============================================
+
+FIELDS_PENCARIAN_USER = {'first_name', 'last_name', 'phone'}
+
+
+@receiver(post_save, sender=Pasien)
+def sinkron_index_pasien(sender, instance, created, **kwargs):
+    """Pasien baru masuk index pencarian (nama/telepon berikutnya lewat signal user)"""
+    if created:
+        sinkron_pasien_search([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+def sinkron_index_pasien_user(sender, instance, created, update_fields=None, **kwargs):
+    """Nama/telepon user pasien berubah: perbarui index (update last_login dsb. dilewati)"""
+    if created or instance.role != 'pasien':
+        return
+    if update_fields is not None and not FIELDS_PENCARIAN_USER & set(update_fields):
+        return
+    sinkron_pasien_search(Pasien.objects.filter(user=instance).values('pk'))
+
+
+@receiver(post_save, sender=RekamMedis)
+def sinkron_index_rekam_medis(sender, instance, update_fields=None, **kwargs):
+    """Perbarui index teks klinis (save yang hanya mengubah waktu konsultasi dilewati)"""
+    if update_fields is not None and not set(FIELDS_KLINIS) & set(update_fields):
+        return
+    index_rekam_medis([instance])
+
+
+# ============================================
+# CACHE SLOT PRAKTIK DOKTER
+# ============================================
+
+@receiver(post_save, sender=JanjiTemu)
+@receiver(post_delete, sender=JanjiTemu)
+def invalidate_slot_cache(sender, instance, **kwargs):
+    """Hapus cache slot terisi (tanggal baru dan lama jika dijadwal ulang) setelah transaksi commit"""
+    slots = {(instance.dokter_id, instance.tanggal), getattr(instance, '_slot_awal', None)} - {None}
+    for dokter_id, tanggal in slots:
+        transaction.on_commit(lambda dokter_id=dokter_id, tanggal=tanggal: invalidate_slot(dokter_id, tanggal))
+
+
+# ============================================
+# INVALIDASI CACHE STATISTIK DASHBOARD
+# ============================================
+
+@receiver(post_save, sender=Pembayaran)
+@receiver(post_delete, sender=Pembayaran)
+@receiver(post_save, sender=JanjiTemu)
+@receiver(post_delete, sender=JanjiTemu)
+@receiver(post_save, sender=Pasien)
+@receiver(post_delete, sender=Pasien)
+@receiver(post_save, sender=Dokter)
+@receiver(post_delete, sender=Dokter)
+def invalidate_stats_cache(sender, instance, **kwargs):
+    """Hapus cache statistik dashboard setelah transaksi commit"""
+    transaction.on_commit(invalidate_dashboard_stats)
@@ -0,0 +1,167 @@
+"""
+Slot praktik dokter: jadwal_praktik mingguan dijabarkan menjadi slot konkret
+per tanggal, dikurangi janji temu yang sudah dibooking. Waktu terisi per
+(dokter, tanggal) di-cache dan dihapus signal saat janji temu berubah;
+jadwal dijabarkan ulang tiap request sehingga perubahan jadwal langsung berlaku.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import JanjiTemu
+
+
+HARI = ('senin', 'selasa', 'rabu', 'kamis', 'jumat', 'sabtu', 'minggu')
+
+CACHE_KEY = 'core:slot-terisi:{dokter_id}:{tanggal}'
+
+# Janji temu yang menempati slot (yang dibatalkan membebaskan slotnya),
+# sama dengan kondisi constraint unique_slot_aktif_per_dokter_tanggal
+STATUS_TERISI = ('pending', 'confirmed', 'completed')
+
+
+def _menit(waktu):
+    return waktu.hour * 60 + waktu.minute
+
+
+def _jam(menit):
+    return time(menit // 60, menit % 60)
+
+
+def shift_praktik(dokter, tanggal):
+    """
+    (mulai, selesai, durasi menit) praktik dokter pada hari `tanggal`, atau None
+    jika tidak praktik / jadwal tidak valid. Durasi slot dari key "durasi" pada
+    jadwal hari itu, default settings.SLOT_DURASI_MENIT.
+    """
+    shift = (dokter.jadwal_praktik or {}).get(HARI[tanggal.weekday()])
+    if not isinstance(shift, dict):
+        return None
+    try:
+        mulai = datetime.strptime(shift['mulai'], '%H:%M').time()
+        selesai = datetime.strptime(shift['selesai'], '%H:%M').time()
+        durasi = int(shift.get('durasi') or getattr(settings, 'SLOT_DURASI_MENIT', 15))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if durasi <= 0 or mulai >= selesai:
+        return None
+    return mulai, selesai, durasi
+
+
+def slot_hari(mulai, selesai, durasi):
+    """Waktu mulai tiap slot yang selesai paling lambat pada jam `selesai`"""
+    return [_jam(m) for m in range(_menit(mulai), _menit(selesai) - durasi + 1, durasi)]
+
+
+def slot_untuk(waktu, mulai, durasi):
+    """Waktu mulai slot yang memuat `waktu` (janji temu di luar kelipatan durasi ikut menempati slotnya)"""
+    return _jam(_menit(mulai) + (_menit(waktu) - _menit(mulai)) // durasi * durasi)
+
+
+def waktu_terisi(dokter_id, tanggal_list):
+    """
+    {tanggal: set waktu janji temu aktif} untuk dokter ini. Tanggal yang belum
+    ada di cache diambil sekaligus dalam satu query lalu disimpan ke cache.
+    """
+    keys = {CACHE_KEY.format(dokter_id=dokter_id, tanggal=tanggal.isoformat()): tanggal for tanggal in tanggal_list}
+    cached = cache.get_many(list(keys))
+    hasil = {keys[key]: set(waktu) for key, waktu in cached.items()}
+
+    kurang = [tanggal for key, tanggal in keys.items() if key not in cached]
+    if kurang:
+        terisi = {tanggal: set() for tanggal in kurang}
+        rows = JanjiTemu.objects.filter(
+            dokter_id=dokter_id, tanggal__in=kurang, status__in=STATUS_TERISI
+        ).values_list('tanggal', 'waktu')
+        for tanggal, waktu in rows:
+            terisi[tanggal].add(waktu)
+        cache.set_many(
+            {CACHE_KEY.format(dokter_id=dokter_id, tanggal=tanggal.isoformat()): sorted(waktu)
+             for tanggal, waktu in terisi.items()},
+            getattr(settings, 'SLOT_CACHE_TIMEOUT', 60 * 60),
+        )
+        hasil.update(terisi)
+    return hasil
+
+
+def slot_dokter(dokter, dari, sampai):
+    """
+    Slot praktik dokter per tanggal dalam [dari, sampai], hanya hari praktik:
+    [{'tanggal', 'hari', 'mulai', 'selesai', 'durasi', 'slots': [{'waktu', 'tersedia'}]}].
+    Slot yang sudah lewat atau sudah dibooking tidak tersedia.
+    """
+    shifts = {}
+    tanggal = dari
+    while tanggal <= sampai:
+        shift = shift_praktik(dokter, tanggal)
+        if shift:
+            shifts[tanggal] = shift
+        tanggal += timedelta(days=1)
+
+    terisi = waktu_terisi(dokter.pk, list(shifts))
+    sekarang = timezone.localtime()
+    hasil = []
+    for tanggal, (mulai, selesai, durasi) in shifts.items():
+        dipakai = {slot_untuk(waktu, mulai, durasi) for waktu in terisi[tanggal] if mulai <= waktu < selesai}
+        hasil.append({
+            'tanggal': tanggal,
+            'hari': HARI[tanggal.weekday()],
+            'mulai': mulai,
+            'selesai': selesai,
+            'durasi': durasi,
+            'slots': [
+                {
+                    'waktu': slot,
+                    'tersedia': slot not in dipakai and (
+                        tanggal > sekarang.date()
+                        or (tanggal == sekarang.date() and slot > sekarang.time())
+                    ),
+                }
+                for slot in slot_hari(mulai, selesai, durasi)
+            ],
+        })
+    return hasil
+
+
+def slot_terisi(dokter, tanggal, waktu, durasi, kecuali=None):
+    """
+    Apakah slot yang dimulai pada `waktu` sudah ditempati janji temu aktif
+    (langsung ke DB). `kecuali` = pk janji temu yang sedang dijadwal ulang.
+    """
+    return JanjiTemu.objects.filter(
+        dokter=dokter, tanggal=tanggal, status__in=STATUS_TERISI,
+        waktu__gte=waktu, waktu__lt=_jam(_menit(waktu) + durasi),
+    ).exclude(pk=kecuali).exists()
+
+
+def cek_slot(dokter, tanggal, waktu, kecuali=None):
+    """
+    Pesan kesalahan jika `waktu` pada `tanggal` bukan slot praktik dokter yang
+    masih bisa dibooking (bukan hari praktik, di luar jam/grid slot, sudah lewat,
+    atau sudah terisi), None jika boleh.
+    """
+    nama = dokter.user.get_full_name()
+    hari = HARI[tanggal.weekday()].capitalize()
+    shift = shift_praktik(dokter, tanggal)
+    if shift is None:
+        return f"Dokter {nama} tidak praktik pada hari {hari}."
+
+    mulai, selesai, durasi = shift
+    # Bandingkan sebagai waktu, bukan string "HH:MM" (yang salah untuk "9:00" vs "10:00")
+    if waktu not in slot_hari(mulai, selesai, durasi):
+        return (
+            f"Jam praktik Dokter {nama} pada hari {hari} adalah "
+            f"{mulai:%H:%M} - {selesai:%H:%M}, dengan slot tiap {durasi} menit."
+        )
+    if timezone.make_aware(datetime.combine(tanggal, waktu)) <= timezone.now():
+        return "Slot ini sudah lewat."
+    if slot_terisi(dokter, tanggal, waktu, durasi, kecuali):
+        return f"Slot {waktu:%H:%M} pada {tanggal:%d/%m/%Y} sudah dibooking. Pilih slot lain."
+    return None
+
+
+def invalidate_slot(dokter_id, tanggal):
+    """Hapus cache waktu terisi dokter pada tanggal ini"""
+    cache.delete(CACHE_KEY.format(dokter_id=dokter_id, tanggal=tanggal.isoformat()))
@@ -0,0 +1,169 @@
+"""
+Statistik dashboard (admin & kasir) dengan conditional aggregation dan cache
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DateField, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import CustomUser, JanjiTemu, Pembayaran
+
+
+CACHE_KEY = 'core:dashboard-stats:{tanggal}'
+
+
+def local_day_range(tanggal):
+    """Rentang datetime [awal hari, awal hari berikutnya) di timezone lokal"""
+    start = timezone.make_aware(datetime.combine(tanggal, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _compute_dashboard_stats(today):
+    today_start, today_end = local_day_range(today)
+    month_start, _ = local_day_range(today.replace(day=1))
+
+    lunas_hari_ini = Q(status='lunas', tanggal_bayar__gte=today_start, tanggal_bayar__lt=today_end)
+    lunas_bulan_ini = Q(status='lunas', tanggal_bayar__gte=month_start)
+
+    # Query 1: semua KPI transaksi; WHERE membatasi scan ke pending + lunas bulan ini
+    pembayaran = Pembayaran.objects.filter(
+        Q(status='pending') | lunas_bulan_ini
+    ).aggregate(
+        pembayaran_pending=Count('id', filter=Q(status='pending')),
+        pembayaran_hari_ini=Count('id', filter=lunas_hari_ini),
+        revenue_hari_ini=Sum('total_biaya', filter=lunas_hari_ini),
+        revenue_bulan_ini=Sum('total_biaya', filter=lunas_bulan_ini),
+    )
+
+    # Query 2: data master lewat relasi one-to-one user -> profile (tanpa fan-out)
+    master = CustomUser.objects.aggregate(
+        total_pasien=Count('pasien_profile'),
+        pasien_baru_bulan_ini=Count('pasien_profile', filter=Q(pasien_profile__created_at__gte=month_start)),
+        total_dokter=Count('dokter_profile', filter=Q(dokter_profile__status_aktif=True)),
+    )
+
+    # Query 3: janji temu hari ini
+    janji_hari_ini = JanjiTemu.objects.filter(tanggal=today).count()
+
+    return {
+        'total_pasien': master['total_pasien'],
+        'total_dokter': master['total_dokter'],
+        'pasien_baru_bulan_ini': master['pasien_baru_bulan_ini'],
+        'janji_hari_ini': janji_hari_ini,
+        'pembayaran_pending': pembayaran['pembayaran_pending'],
+        'pembayaran_hari_ini': pembayaran['pembayaran_hari_ini'],
+        'revenue_hari_ini': pembayaran['revenue_hari_ini'] or 0,
+        'revenue_bulan_ini': pembayaran['revenue_bulan_ini'] or 0,
+    }
+
+
+def dashboard_stats():
+    """
+    Semua KPI dashboard admin dan kasir dalam satu snapshot.
+    Snapshot di-cache selama settings.DASHBOARD_STATS_CACHE_TIMEOUT detik dan
+    dihapus oleh signal setiap kali Pembayaran/JanjiTemu/Pasien/Dokter berubah.
+    """
+    today = timezone.localdate()
+    key = CACHE_KEY.format(tanggal=today.isoformat())
+    stats = cache.get(key)
+    if stats is None:
+        stats = _compute_dashboard_stats(today)
+        cache.set(key, stats, getattr(settings, 'DASHBOARD_STATS_CACHE_TIMEOUT', 60))
+    return stats
+
+
+def invalidate_dashboard_stats():
+    """Hapus snapshot statistik hari ini"""
+    cache.delete(CACHE_KEY.format(tanggal=timezone.localdate().isoformat()))
+
+
+# ==================== REVENUE TIME SERIES ====================
+
+REVENUE_WINDOWS = (7, 30, 90, 365)
+REVENUE_BUCKETS = ('day', 'week', 'month')
+REVENUE_GROUP_BY = {
+    'metode': ('metode',),
+    'spesialisasi': ('janji_temu__dokter__spesialisasi',),
+    'dokter': (
+        'janji_temu__dokter',
+        'janji_temu__dokter__user__first_name',
+        'janji_temu__dokter__user__last_name',
+    ),
+}
+BUCKET_LABEL_FORMAT = {'day': '%a', 'week': '%d %b', 'month': '%b %Y'}
+
+
+def _bucket_start(tanggal, bucket):
+    if bucket == 'week':
+        return tanggal - timedelta(days=tanggal.weekday())
+    if bucket == 'month':
+        return tanggal.replace(day=1)
+    return tanggal
+
+
+def _next_bucket(tanggal, bucket):
+    if bucket == 'week':
+        return tanggal + timedelta(days=7)
+    if bucket == 'month':
+        return (tanggal.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return tanggal + timedelta(days=1)
+
+
+def _breakdown_label(row, group_by):
+    if group_by == 'dokter':
+        nama = f"{row['janji_temu__dokter__user__first_name']} {row['janji_temu__dokter__user__last_name']}"
+        return f"Dr. {nama.strip()}"
+    return row[REVENUE_GROUP_BY[group_by][0]]
+
+
+def revenue_series(window=7, bucket='day', group_by=None):
+    """
+    Revenue pembayaran lunas untuk `window` hari terakhir per `bucket`
+    (day/week/month), opsional dipecah per metode/dokter/spesialisasi.
+    Seluruh deret dihitung dengan satu query GROUP BY; bucket tanpa
+    transaksi diisi 0 di Python.
+    """
+    today = timezone.localdate()
+    start = _bucket_start(today - timedelta(days=window - 1), bucket)
+    range_start, _ = local_day_range(start)
+    _, range_end = local_day_range(today)
+
+    group_fields = REVENUE_GROUP_BY[group_by] if group_by else ()
+    rows = Pembayaran.objects.filter(
+        status='lunas',
+        tanggal_bayar__gte=range_start,
+        tanggal_bayar__lt=range_end,
+    ).annotate(
+        bucket=Trunc('tanggal_bayar', bucket, output_field=DateField())
+    ).values('bucket', *group_fields).annotate(
+        revenue=Sum('total_biaya')
+    ).order_by()
+
+    totals = {}
+    breakdowns = {}
+    labels = set()
+    for row in rows:
+        totals[row['bucket']] = totals.get(row['bucket'], 0) + row['revenue']
+        if group_by:
+            label = _breakdown_label(row, group_by)
+            labels.add(label)
+            per_label = breakdowns.setdefault(row['bucket'], {})
+            per_label[label] = per_label.get(label, 0) + row['revenue']
+
+    data = []
+    tanggal = start
+    while tanggal <= today:
+        point = {
+            'date': tanggal.strftime('%Y-%m-%d'),
+            'day': tanggal.strftime(BUCKET_LABEL_FORMAT[bucket]),
+            'revenue': float(totals.get(tanggal, 0)),
+        }
+        if group_by:
+            per_label = breakdowns.get(tanggal, {})
+            point['breakdown'] = {label: float(per_label.get(label, 0)) for label in sorted(labels)}
+        data.append(point)
+        tanggal = _next_bucket(tanggal, bucket)
+    return data
@@ -1,3 +1,1819 @@
-from django.test import TestCase
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import connection, transaction, IntegrityError, OperationalError
+from django.db.models import Sum
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import serializers
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .forecast import hitung_forecast
+from .stats import local_day_range
+from .realtime import AntrianEventBatch, buat_tiket_stream, channel_antrian, get_broker
+from .search import normalisasi_klinis
+from .slots import HARI
+from .inventory import StokTidakCukup, apply_stock_deltas, snapshot_stok, stok_pada
+from .notifications import notify, rekonsiliasi_unread
+from .audit import SyncAuditWriter, ThreadedAuditWriter, current_context as current_audit_context, record as record_audit
+from .middleware import AuditContextMiddleware
+from .serializers import RekamMedisCreateSerializer
+from .models import (
+    CustomUser, Dokter, Pasien, Resepsionis, Kasir, LayananTindakan,
+    JanjiTemu, AntrianCounter, RekamMedis, Obat, Resep, DetailResep, Pembayaran,
+    SequenceCounter, DailyRevenueRollup, AuditLog, Apoteker, Notifikasi, StokAdjustment,
+    StokMovement, StokSnapshot, ObatLot, ObatForecast, NotifikasiUnread, PasienSearch,
+    RekamMedisSearch
+)
+
+
+FAST_HASHER = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+class KlinikTestMixin:
+    """Helper untuk membuat data master di test"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Hasher cepat untuk semua test (termasuk setUpTestData): PBKDF2 default
+        # pada tiap create_user membuat suite jauh lebih lambat
+        hasher = override_settings(PASSWORD_HASHERS=FAST_HASHER)
+        hasher.enable()
+        cls.addClassCleanup(hasher.disable)
+        super().setUpClass()
+
+    def buat_user(self, username, role, **extra):
+        return CustomUser.objects.create_user(
+            username=username, password='password123', role=role,
+            first_name=username.capitalize(), **extra
+        )
+
+    def buat_dokter(self, username='sitirahma', **extra):
+        user = self.buat_user(username, 'dokter')
+        return Dokter.objects.create(
+            user=user, no_str=f'STR-{username}', biaya_konsultasi=Decimal('100000'), **extra
+        )
+
+    def buat_pasien(self, username):
+        return Pasien.objects.create(user=self.buat_user(username, 'pasien'))
+
+    def buat_janji(self, pasien, dokter, tanggal=None, waktu=None, **extra):
+        tanggal = tanggal or timezone.now().date()
+        if waktu is None:
+            # Slot 15 menit berikutnya mulai 09:00 (satu janji aktif per slot)
+            n = JanjiTemu.objects.filter(dokter=dokter, tanggal=tanggal).count()
+            waktu = time(9 + n // 4, n % 4 * 15)
+        return JanjiTemu.objects.create(
+            pasien=pasien, dokter=dokter, tanggal=tanggal, waktu=waktu, keluhan='Demam', **extra
+        )
+
+    def buat_obat(self, nama='Paracetamol', stok=100, harga=Decimal('5000'), **extra):
+        return Obat.objects.create(
+            nama=nama, stok=stok, harga_jual=harga, harga_beli=harga / 2, **extra
+        )
+
+
+class JanjiTemuQueryCountTest(KlinikTestMixin, TestCase):
+    """Endpoint list janji temu harus memakai jumlah query konstan"""
+
+    def setUp(self):
+        self.dokter = self.buat_dokter()
+        resepsionis_user = self.buat_user('resepsionis', 'resepsionis')
+        Resepsionis.objects.create(user=resepsionis_user)
+        kasir_user = self.buat_user('kasir', 'kasir')
+        Kasir.objects.create(user=kasir_user)
+        self.client = APIClient()
+        self.client.force_authenticate(resepsionis_user)
+        self.kasir_client = APIClient()
+        self.kasir_client.force_authenticate(kasir_user)
+
+    def tambah_janji(self, jumlah):
+        for i in range(jumlah):
+            pasien = self.buat_pasien(f'pasien{JanjiTemu.objects.count()}')
+            janji = self.buat_janji(pasien, self.dokter)
+            if i % 2 == 0:
+                Pembayaran.objects.create(janji_temu=janji)
+
+    def hitung_query(self, client, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def assert_query_konstan(self, client, url):
+        self.tambah_janji(2)
+        sedikit, _ = self.hitung_query(client, url)
+        self.tambah_janji(6)
+        banyak, response = self.hitung_query(client, url)
+        self.assertEqual(sedikit, banyak)
+        return response
+
+    def test_resepsionis_janji_temu_list(self):
+        response = self.assert_query_konstan(self.client, reverse('janji-temu-list'))
+        results = response.data['results']
+        self.assertEqual(len(results), 8)
+        self.assertEqual(sum(1 for r in results if r['has_pembayaran']), 4)
+        self.assertFalse(any(r['has_rekam_medis'] for r in results))
+
+    def test_antrian(self):
+        response = self.assert_query_konstan(self.client, reverse('antrian'))
+        self.assertEqual(response.data['count'], 8)
+
+    def test_pembayaran_list(self):
+        response = self.assert_query_konstan(self.kasir_client, reverse('pembayaran-list'))
+        self.assertTrue(all(r['janji_temu']['has_pembayaran'] for r in response.data['results']))
+
+
+class RekamMedisQueryCountTest(KlinikTestMixin, TestCase):
+    """Riwayat rekam medis pasien harus memakai jumlah query konstan"""
+
+    def setUp(self):
+        self.dokter = self.buat_dokter()
+        self.pasien = self.buat_pasien('jono')
+        self.tindakan = LayananTindakan.objects.create(nama_tindakan='Cek Darah', biaya=Decimal('50000'))
+        self.obat = [self.buat_obat(f'Obat {i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.pasien.user)
+
+    def tambah_kunjungan(self, jumlah):
+        for i in range(jumlah):
+            janji = self.buat_janji(self.pasien, self.dokter, status='confirmed')
+            rekam_medis = RekamMedis.objects.create(
+                pasien=self.pasien, dokter=self.dokter, janji_temu=janji,
+                diagnosa='ISPA', anamnesa='Batuk'
+            )
+            rekam_medis.tindakan.set([self.tindakan])
+            resep = Resep.objects.create(rekam_medis=rekam_medis)
+            for obat in self.obat:
+                DetailResep.objects.create(resep=resep, obat=obat, jumlah=2, aturan_pakai='3x1')
+
+    def hitung_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('rekam-medis-saya'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_riwayat_rekam_medis(self):
+        self.tambah_kunjungan(1)
+        sedikit, _ = self.hitung_query()
+        self.tambah_kunjungan(4)
+        banyak, response = self.hitung_query()
+        self.assertEqual(sedikit, banyak)
+        resep = response.data['results'][0]['resep_list'][0]
+        self.assertEqual(len(resep['detail_resep']), 3)
+        self.assertEqual(resep['total_harga'], Decimal('30000'))
+        self.assertEqual(resep['pasien_nama'], 'Jono')
+
+
+class NomorAntrianTest(KlinikTestMixin, TestCase):
+    """Generator nomor antrian per dokter per tanggal"""
+
+    def setUp(self):
+        self.dokter = self.buat_dokter('siti')
+        self.pasien = self.buat_pasien('jono')
+
+    def test_nomor_berurutan_melewati_99(self):
+        AntrianCounter.objects.create(dokter=self.dokter, tanggal=timezone.now().date(), last_number=98)
+        nomor = [self.buat_janji(self.pasien, self.dokter).nomor_antrian for _ in range(3)]
+        self.assertEqual(nomor, ['SIT-99', 'SIT-100', 'SIT-101'])
+
+    def test_jadwal_ulang_mengambil_nomor_baru(self):
+        hari_ini = timezone.now().date()
+        besok = hari_ini + timedelta(days=1)
+        self.buat_janji(self.pasien, self.dokter, tanggal=besok)
+        janji = self.buat_janji(self.pasien, self.dokter, tanggal=hari_ini)
+        self.assertEqual(janji.nomor_antrian, 'SIT-01')
+
+        # SIT-01 sudah dipakai besok: nomor lama akan melanggar unique constraint
+        self.dokter.jadwal_praktik = {hari: {'mulai': '08:00', 'selesai': '16:00'} for hari in HARI}
+        self.dokter.save()
+        resepsionis = self.buat_user('resepsionis', 'resepsionis')
+        Resepsionis.objects.create(user=resepsionis)
+        client = APIClient()
+        client.force_authenticate(resepsionis)
+        response = client.patch(reverse('janji-temu-detail', args=[janji.pk]), {
+            'tanggal': besok.isoformat(), 'waktu': '10:00',
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['nomor_antrian'], 'SIT-02')
+
+        # Pindah dokter: prefix dokter baru, counter dokter baru
+        dokter_lain = self.buat_dokter('doni')
+        janji = JanjiTemu.objects.get(pk=janji.pk)
+        janji.dokter = dokter_lain
+        janji.save(update_fields=['dokter'])
+        janji.refresh_from_db()
+        self.assertEqual(janji.nomor_antrian, 'DON-01')
+
+        # Perubahan lain tidak mengubah nomor
+        janji.keluhan = 'Batuk'
+        janji.save()
+        self.assertEqual(JanjiTemu.objects.get(pk=janji.pk).nomor_antrian, 'DON-01')
+
+    def test_counter_terpisah_per_tanggal(self):
+        hari_ini = timezone.now().date()
+        besok = hari_ini + timedelta(days=1)
+        self.assertEqual(self.buat_janji(self.pasien, self.dokter, tanggal=hari_ini).nomor_antrian, 'SIT-01')
+        self.assertEqual(self.buat_janji(self.pasien, self.dokter, tanggal=besok).nomor_antrian, 'SIT-01')
+        self.assertEqual(self.buat_janji(self.pasien, self.dokter, tanggal=hari_ini).nomor_antrian, 'SIT-02')
+
+
+class NomorAntrianConcurrencyTest(KlinikTestMixin, TransactionTestCase):
+    """Booking paralel tidak boleh menghasilkan nomor antrian duplikat"""
+
+    JUMLAH_BOOKING = 500
+
+    def test_booking_paralel(self):
+        dokter = self.buat_dokter('siti')
+        pasien = self.buat_pasien('jono')
+        tanggal = timezone.now().date()
+
+        def booking(i):
+            try:
+                return self.buat_janji(
+                    pasien, dokter, tanggal=tanggal, waktu=time(i // 60 % 24, i % 60)
+                ).nomor_antrian
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            nomor = list(executor.map(booking, range(self.JUMLAH_BOOKING)))
+
+        self.assertEqual(len(set(nomor)), self.JUMLAH_BOOKING)
+        self.assertEqual(
+            sorted(int(n.split('-')[1]) for n in nomor),
+            list(range(1, self.JUMLAH_BOOKING + 1))
+        )
+        self.assertEqual(AntrianCounter.objects.get(dokter=dokter, tanggal=tanggal).last_number, self.JUMLAH_BOOKING)
+
+
+class SequenceCounterTest(KlinikTestMixin, TestCase):
+    """Nomor invoice dan no_rm dari SequenceCounter"""
+
+    def tearDown(self):
+        SequenceCounter._blocks.clear()
+
+    def test_no_rm_dan_invoice_berurutan(self):
+        tahun = timezone.now().year
+        pasien = [self.buat_pasien(f'pasien{i}') for i in range(2)]
+        self.assertEqual([p.no_rm for p in pasien], [f'RM{tahun}00001', f'RM{tahun}00002'])
+
+        dokter = self.buat_dokter()
+        prefix = f"INV-{timezone.now().strftime('%Y%m%d')}"
+        invoice = [
+            Pembayaran.objects.create(janji_temu=self.buat_janji(p, dokter)).invoice_number
+            for p in pasien
+        ]
+        self.assertEqual(invoice, [f'{prefix}-0001', f'{prefix}-0002'])
+
+    def test_pre_alokasi_blok(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(SequenceCounter.next_value('TEST', block_size=3), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(SequenceCounter.next_value('TEST', block_size=3), 2)
+            self.assertEqual(SequenceCounter.next_value('TEST', block_size=3), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(SequenceCounter.next_value('TEST', block_size=3), 4)
+        self.assertEqual(SequenceCounter.objects.get(name='TEST').last_value, 6)
+
+    def test_blok_tidak_dipakai_setelah_rollback(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            SequenceCounter.next_value('TEST', block_size=5)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotIn('TEST', SequenceCounter._blocks)
+
+
+class DashboardStatsTest(KlinikTestMixin, TestCase):
+    """Statistik dashboard admin dan kasir"""
+
+    def setUp(self):
+        cache.clear()
+        self.dokter = self.buat_dokter()
+        pasien = [self.buat_pasien(f'pasien{i}') for i in range(3)]
+        kasir = Kasir.objects.create(user=self.buat_user('kasir', 'kasir'))
+        for i, p in enumerate(pasien):
+            pembayaran = Pembayaran.objects.create(
+                janji_temu=self.buat_janji(p, self.dokter), total_biaya=Decimal('100000')
+            )
+            if i:
+                pembayaran.status = 'lunas'
+                pembayaran.tanggal_bayar = timezone.now()
+                pembayaran.processed_by = kasir
+                pembayaran.save()
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(self.buat_user('admin', 'admin'))
+        self.kasir_client = APIClient()
+        self.kasir_client.force_authenticate(kasir.user)
+
+    def test_overview_dan_kasir_stats(self):
+        response = self.admin_client.get(reverse('laporan-overview'))
+        self.assertEqual(response.data['total_pasien'], 3)
+        self.assertEqual(response.data['total_dokter'], 1)
+        self.assertEqual(response.data['janji_hari_ini'], 3)
+        self.assertEqual(response.data['pasien_baru_bulan_ini'], 3)
+        self.assertEqual(response.data['pembayaran_pending'], 1)
+        self.assertEqual(Decimal(response.data['revenue_bulan_ini']), Decimal('200000'))
+
+        # Snapshot dipakai bersama oleh dashboard kasir tanpa query tambahan
+        with self.assertNumQueries(0):
+            response = self.kasir_client.get(reverse('kasir-stats'))
+        self.assertEqual(response.data, {
+            'pembayaran_hari_ini': 2,
+            'pending': 1,
+            'revenue_bulan_ini': 200000.0,
+            'revenue_hari_ini': 200000.0,
+        })
+
+    def test_cache_diinvalidasi_saat_pembayaran_disimpan(self):
+        self.kasir_client.get(reverse('kasir-stats'))
+        pembayaran = Pembayaran.objects.get(status='pending')
+        pembayaran.status = 'lunas'
+        pembayaran.tanggal_bayar = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            pembayaran.save()
+        response = self.kasir_client.get(reverse('kasir-stats'))
+        self.assertEqual(response.data['pending'], 0)
+        self.assertEqual(response.data['pembayaran_hari_ini'], 3)
+
+
+class RevenueChartTest(KlinikTestMixin, TestCase):
+    """Time series revenue untuk chart admin"""
+
+    def setUp(self):
+        self.dokter = self.buat_dokter()
+        self.client = APIClient()
+        self.client.force_authenticate(self.buat_user('admin', 'admin'))
+        now = timezone.now()
+        for i, (hari_lalu, metode) in enumerate([(0, 'tunai'), (0, 'qris'), (2, 'tunai'), (40, 'tunai')]):
+            janji = self.buat_janji(self.buat_pasien(f'pasien{i}'), self.dokter)
+            Pembayaran.objects.create(
+                janji_temu=janji, status='lunas', metode=metode,
+                total_biaya=Decimal('100000'), tanggal_bayar=now - timedelta(days=hari_lalu)
+            )
+
+    def test_default_tujuh_hari(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('revenue-chart'))
+        self.assertEqual(len(response.data), 7)
+        self.assertEqual(response.data[-1]['date'], timezone.localdate().strftime('%Y-%m-%d'))
+        self.assertEqual(response.data[-1]['revenue'], 200000.0)
+        self.assertEqual(sum(p['revenue'] for p in response.data), 300000.0)
+
+    def test_breakdown_per_metode(self):
+        response = self.client.get(reverse('revenue-chart'), {'window': 90, 'bucket': 'month', 'group_by': 'metode'})
+        self.assertEqual(sum(p['revenue'] for p in response.data), 400000.0)
+        self.assertEqual(response.data[-1]['breakdown']['qris'], 100000.0)
+        self.assertEqual(set(response.data[0]['breakdown']), {'qris', 'tunai'})
+
+    def test_parameter_tidak_valid(self):
+        response = self.client.get(reverse('revenue-chart'), {'window': 12})
+        self.assertEqual(response.status_code, 400)
+
+
+class DailyRevenueRollupTest(KlinikTestMixin, TestCase):
+    """Rollup revenue harian dipelihara incremental dari Pembayaran"""
+
+    def setUp(self):
+        self.dokter = self.buat_dokter()
+        self.pembayaran = Pembayaran.objects.create(
+            janji_temu=self.buat_janji(self.buat_pasien('jono'), self.dokter),
+            total_biaya=Decimal('150000'), biaya_konsultasi=Decimal('100000'), biaya_obat=Decimal('50000'),
+        )
+
+    def bayar(self, pembayaran, metode='tunai'):
+        pembayaran.status = 'lunas'
+        pembayaran.metode = metode
+        pembayaran.tanggal_bayar = timezone.now()
+        pembayaran.save()
+
+    def snapshot(self):
+        return list(DailyRevenueRollup.objects.filter(jumlah_transaksi__gt=0).values_list(
+            'tanggal', 'metode', 'dokter', 'jumlah_transaksi', 'total_biaya', 'biaya_obat'
+        ).order_by('metode'))
+
+    def test_lunas_masuk_rollup_sekali(self):
+        self.assertEqual(self.snapshot(), [])
+        self.bayar(self.pembayaran)
+        self.pembayaran.save()
+        Pembayaran.objects.get(pk=self.pembayaran.pk).save()
+        hari_ini = timezone.localdate()
+        self.assertEqual(self.snapshot(), [
+            (hari_ini, 'tunai', self.dokter.pk, 1, Decimal('150000'), Decimal('50000'))
+        ])
+
+    def test_perubahan_metode_dan_rebuild(self):
+        self.bayar(self.pembayaran)
+        pembayaran = Pembayaran.objects.get(pk=self.pembayaran.pk)
+        pembayaran.metode = 'qris'
+        pembayaran.save()
+        lain = Pembayaran.objects.create(
+            janji_temu=self.buat_janji(self.buat_pasien('budi'), self.dokter), total_biaya=Decimal('100000')
+        )
+        self.bayar(lain)
+        incremental = self.snapshot()
+        self.assertEqual([row[1] for row in incremental], ['qris', 'tunai'])
+
+        DailyRevenueRollup.objects.update(jumlah_transaksi=99)
+        DailyRevenueRollup.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+        lain.delete()
+        self.assertEqual([row[1] for row in self.snapshot()], ['qris'])
+
+    def test_laporan_keuangan_dari_rollup(self):
+        self.bayar(self.pembayaran, metode='transfer')
+        kasir = Kasir.objects.create(user=self.buat_user('kasir', 'kasir'))
+        client = APIClient()
+        client.force_authenticate(kasir.user)
+        with self.assertNumQueries(1):
+            response = client.get(reverse('laporan-keuangan'))
+        self.assertEqual(len(response.data), 1)
+        laporan = response.data[0]
+        self.assertEqual(laporan['total_transaksi'], 1)
+        self.assertEqual(laporan['total_revenue'], Decimal('150000'))
+        self.assertEqual(laporan['transfer'], Decimal('150000'))
+        self.assertEqual(laporan['tunai'], Decimal('0'))
+
+
+class KeysetPaginationTest(KlinikTestMixin, TestCase):
+    """List bervolume tinggi memakai keyset pagination tanpa COUNT/OFFSET"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def ambil_semua(self, url, params):
+        hasil = []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            for query in ctx.captured_queries:
+                self.assertNotIn('COUNT(', query['sql'].upper())
+                self.assertNotIn('OFFSET', query['sql'].upper())
+            hasil.extend(item['id'] for item in response.data['results'])
+            url, params = response.data['next'], None
+        return hasil
+
+    def test_audit_log_cursor_tanpa_duplikat(self):
+        admin = self.buat_user('admin', 'admin')
+        self.client.force_authenticate(admin)
+        # bulk_create -> timestamp identik, urutan ditentukan tie-breaker id
+        AuditLog.objects.bulk_create([
+            AuditLog(user=admin, action='update', model_name='Obat', object_id=i, object_str=f'Obat {i}')
+            for i in range(25)
+        ])
+        ids = self.ambil_semua(reverse('audit-log-list'), {'page_size': 10})
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_pembayaran_page_number_default_dan_cursor(self):
+        kasir = Kasir.objects.create(user=self.buat_user('kasir', 'kasir'))
+        self.client.force_authenticate(kasir.user)
+        dokter = self.buat_dokter()
+        for i in range(12):
+            Pembayaran.objects.create(
+                janji_temu=self.buat_janji(self.buat_pasien(f'pasien{i}'), dokter, waktu=time(8 + i % 8, i)),
+                total_biaya=Decimal('100000'),
+            )
+
+        response = self.client.get(reverse('pembayaran-list'))
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 10)
+
+        ids = self.ambil_semua(reverse('pembayaran-list'), {'pagination': 'cursor', 'page_size': 5})
+        self.assertEqual(sorted(ids), sorted(Pembayaran.objects.values_list('id', flat=True)))
+
+
+class NotifikasiBatchTest(KlinikTestMixin, TestCase):
+    """Notifikasi ditulis sekali per commit dan alert stok tidak berulang"""
+
+    def setUp(self):
+        self.apoteker = [
+            Apoteker.objects.create(user=self.buat_user(f'apoteker{i}', 'apoteker'), no_sipa=f'SIPA-{i}')
+            for i in range(3)
+        ]
+        self.dokter = self.buat_dokter()
+        self.obat = [self.buat_obat(f'Obat {i}', stok=19) for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.apoteker[0].user)
+
+    def buat_resep(self, username):
+        pasien = self.buat_pasien(username)
+        rekam_medis = RekamMedis.objects.create(
+            pasien=pasien, dokter=self.dokter, diagnosa='ISPA', anamnesa='Batuk',
+            janji_temu=self.buat_janji(pasien, self.dokter, status='confirmed'),
+        )
+        resep = Resep.objects.create(rekam_medis=rekam_medis)
+        for obat in self.obat:
+            DetailResep.objects.create(resep=resep, obat=obat, jumlah=5, aturan_pakai='3x1')
+        return resep
+
+    def proses(self, resep):
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse('resep-proses', args=[resep.pk]), {'status': 'delivered'}
+                )
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "notifikasi"')]
+
+    def test_fan_out_satu_insert_dan_dedup(self):
+        insert = self.proses(self.buat_resep('jono'))
+        self.assertEqual(len(insert), 1)
+        self.assertEqual(Notifikasi.objects.filter(tipe='stok').count(), 0)
+
+        # Resep kedua menurunkan stok ke bawah 10: 3 obat x 3 apoteker + 1 notifikasi resep
+
+        insert = self.proses(self.buat_resep('budi'))
+        self.assertEqual(len(insert), 1)
+        self.assertEqual(Notifikasi.objects.filter(tipe='stok').count(), 9)
+        self.assertEqual(Notifikasi.objects.filter(tipe='resep').count(), 2)
+
+        # Alert stok obat yang sama dalam window dedup tidak dikirim ulang
+        for obat in self.obat:
+            obat.refresh_from_db()
+            obat.stok = 14
+            obat.save()
+        self.proses(self.buat_resep('tono'))
+        self.assertEqual(Notifikasi.objects.filter(tipe='stok').count(), 9)
+
+    def test_batas_reorder_point_forecast(self):
+        # Obat 0 reorder di 15, obat 1 reorder di 3, obat 2 tanpa forecast (batas 10)
+        for obat, reorder_point in zip(self.obat, (15, 3)):
+            ObatForecast.objects.create(
+                obat=obat, lead_time_hari=7, reorder_point=reorder_point, dihitung_at=timezone.now()
+            )
+        self.proses(self.buat_resep('jono'))
+        self.assertEqual(
+            set(Notifikasi.objects.filter(tipe='stok').values_list('data__obat_id', flat=True)),
+            {self.obat[0].pk},
+        )
+        self.proses(self.buat_resep('budi'))
+        self.assertEqual(
+            set(Notifikasi.objects.filter(tipe='stok').values_list('data__obat_id', flat=True)),
+            {self.obat[0].pk, self.obat[2].pk},
+        )
+
+    def test_rollback_tidak_menulis_notifikasi(self):
+        obat = self.obat[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    obat.stok = 5
+                    obat.save()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertFalse(Notifikasi.objects.filter(tipe='stok').exists())
+
+
+
+class NotifikasiUnreadTest(KlinikTestMixin, TestCase):
+    """Counter notifikasi belum dibaca dipelihara incremental dan dibaca tanpa tabel notifikasi"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.buat_user('jono', 'pasien')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def kirim(self, jumlah):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(jumlah):
+                notify(self.user, 'system', f'Info {i}', 'Pesan')
+
+    def unread(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('notifikasi-unread-count'))
+        self.assertFalse([q for q in ctx.captured_queries if '"notifikasi"' in q['sql']])
+        return response.json()['unread_count']
+
+    def test_counter_incremental(self):
+        self.kirim(3)
+        self.assertEqual(self.unread(), 3)
+
+        notifikasi = Notifikasi.objects.filter(user=self.user).order_by('id')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('notifikasi-mark-read', args=[notifikasi[0].pk]))
+            # Menandai ulang notifikasi yang sudah dibaca tidak mengurangi lagi
+            self.client.post(reverse('notifikasi-mark-read', args=[notifikasi[0].pk]))
+        self.assertEqual(self.unread(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('notifikasi-detail', args=[notifikasi[1].pk]))
+        self.assertEqual(self.unread(), 1)
+
+        self.kirim(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('notifikasi-mark-all-read'))
+        self.assertEqual(self.unread(), 0)
+
+    def test_cache_kosong_dibaca_dari_counter(self):
+        self.kirim(2)
+        # Commit menghapus cache, bukan menulisnya; baca berikutnya mengisi ulang
+        self.assertIsNone(cache.get(f'notifikasi:unread:{self.user.pk}'))
+        self.assertEqual(self.unread(), 2)
+        self.assertEqual(cache.get(f'notifikasi:unread:{self.user.pk}'), 2)
+
+    def test_rekonsiliasi_menyegarkan_cache_tanpa_selisih(self):
+        self.kirim(2)
+        # Nilai lama tersimpan di cache walau counter di DB sudah benar
+        cache.set(f'notifikasi:unread:{self.user.pk}', 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rekonsiliasi_unread(), {})
+        self.assertEqual(self.unread(), 2)
+
+    def test_rekonsiliasi_memperbaiki_selisih(self):
+        self.kirim(4)
+        # Perubahan di luar jalur incremental: counter dan cache jadi selisih
+        Notifikasi.objects.filter(user=self.user).update(is_read=True)
+        self.assertEqual(self.unread(), 4)
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rekonsiliasi_notifikasi', stdout=out)
+        self.assertIn('1 counter', out.getvalue())
+        self.assertEqual(self.unread(), 0)
+        self.assertEqual(NotifikasiUnread.objects.get(user=self.user).jumlah, 0)
+
+    async def test_stream_unread(self):
+        tiket = await sync_to_async(buat_tiket_stream)(self.user)
+        response = await self.async_client.get(reverse('notifikasi-stream'), {'ticket': tiket})
+        stream = aiter(response.streaming_content)
+
+        event, data = await AntrianStreamTest.event_berikutnya(stream)
+        self.assertEqual((event, data), ('snapshot', {'unread_count': 0}))
+        await sync_to_async(self.kirim)(2)
+        event, data = await AntrianStreamTest.event_berikutnya(stream)
+        self.assertEqual((event, data), ('unread', {'unread_count': 2}))
+
+        menunggu = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        menunggu.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await menunggu
+
+
+class AuditLogWriterTest(KlinikTestMixin, TestCase):
+    """Audit log ditulis batch saat commit, tidak satu INSERT per save"""
+
+    def test_checkout_satu_insert_saat_commit(self):
+        janji = self.buat_janji(self.buat_pasien('jono'), self.buat_dokter())
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    pembayaran = Pembayaran.objects.create(janji_temu=janji, total_biaya=Decimal('100000'))
+                    pembayaran.calculate_total()
+                    pembayaran.save()
+                    pembayaran.status = 'lunas'
+                    pembayaran.save()
+                    self.assertFalse(AuditLog.objects.filter(model_name='Pembayaran').exists())
+        insert = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "audit_log"')]
+        self.assertEqual(len(insert), 1)
+        self.assertEqual(
+            list(AuditLog.objects.filter(model_name='Pembayaran').order_by('id').values_list('action', flat=True)),
+            ['create', 'update', 'update']
+        )
+
+    def test_rollback_tidak_menulis_audit(self):
+        janji = self.buat_janji(self.buat_pasien('jono'), self.buat_dokter())
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Pembayaran.objects.create(janji_temu=janji, total_biaya=Decimal('100000'))
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertFalse(AuditLog.objects.exists())
+
+        # Batch dari transaksi yang di-rollback tidak terbawa ke transaksi berikutnya
+        with self.captureOnCommitCallbacks(execute=True):
+            Pembayaran.objects.filter(janji_temu=janji).delete()
+            Pembayaran.objects.create(janji_temu=janji, total_biaya=Decimal('100000'))
+        self.assertEqual(AuditLog.objects.filter(model_name='Pembayaran', action='create').count(), 1)
+
+    def test_rollback_savepoint_dalam(self):
+        janji = self.buat_janji(self.buat_pasien('jono'), self.buat_dokter())
+        user = janji.pasien.user
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                pembayaran = Pembayaran.objects.create(janji_temu=janji, total_biaya=Decimal('100000'))
+                notify(user, 'system', 'Tetap', 'Pesan')
+                try:
+                    # Entri dari savepoint yang di-rollback tidak ikut di-flush saat commit luar
+                    with transaction.atomic():
+                        pembayaran.status = 'lunas'
+                        pembayaran.save()
+                        notify(user, 'system', 'Dibatalkan', 'Pesan')
+                        raise ValueError
+                except ValueError:
+                    pass
+        self.assertEqual(
+            list(AuditLog.objects.filter(model_name='Pembayaran').values_list('action', flat=True)), ['create']
+        )
+        self.assertEqual(list(Notifikasi.objects.filter(user=user).values_list('judul', flat=True)), ['Tetap'])
+
+    def test_gagal_menulis_tidak_sampai_ke_view(self):
+        janji = self.buat_janji(self.buat_pasien('jono'), self.buat_dokter())
+        writer = SyncAuditWriter()
+        with mock.patch('core.audit._writer', writer), \
+                mock.patch.object(AuditLog.objects, 'bulk_create', side_effect=OperationalError('disk penuh')), \
+                self.assertLogs('core.audit', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                pembayaran = Pembayaran.objects.create(janji_temu=janji, total_biaya=Decimal('100000'))
+        self.assertTrue(Pembayaran.objects.filter(pk=pembayaran.pk).exists())
+        self.assertEqual(writer.stats()['errors'], 1)
+
+
+class ThreadedAuditWriterTest(KlinikTestMixin, TransactionTestCase):
+    """Worker background dengan antrian terbatas; antrian penuh ditulis di thread pemanggil"""
+
+    def test_backpressure_dan_drain(self):
+        user = self.buat_user('admin', 'admin')
+        writer = ThreadedAuditWriter(max_size=2, batch_size=10)
+        with mock.patch('core.audit._writer', writer):
+            # Worker belum jalan: 2 entri masuk antrian, 3 sisanya kena backpressure
+            with mock.patch.object(writer, 'start'):
+                with transaction.atomic():
+                    for i in range(5):
+                        record_audit(AuditLog(user=user, action='view', model_name='Obat', object_id=i, object_str='Obat'))
+            self.assertEqual(AuditLog.objects.count(), 3)
+            writer.start()
+            writer.drain()
+        self.assertEqual(AuditLog.objects.count(), 5)
+        stats = writer.stats()
+        self.assertEqual(
+            (stats['submitted'], stats['written'], stats['backpressure'], stats['errors'], stats['queue_size']),
+            (5, 5, 3, 0, 0)
+        )
+
+
+class AuditContextTest(KlinikTestMixin, TestCase):
+    """Aktor, IP dan user agent audit log diambil dari konteks request"""
+
+    def test_pembayaran_mencatat_aktor_ip_dan_user_agent(self):
+        kasir = Kasir.objects.create(user=self.buat_user('kasir', 'kasir'))
+        with self.captureOnCommitCallbacks(execute=True):
+            pembayaran = Pembayaran.objects.create(
+                janji_temu=self.buat_janji(self.buat_pasien('jono'), self.buat_dokter()), total_biaya=Decimal('100000')
+            )
+        client = APIClient(REMOTE_ADDR='10.0.0.7', HTTP_USER_AGENT='KasirApp/1.0')
+        client.force_authenticate(kasir.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('pembayaran-bayar', args=[pembayaran.pk]), {'metode': 'tunai'})
+        self.assertEqual(response.status_code, 200)
+        log = AuditLog.objects.filter(model_name='Pembayaran', action='update').latest('id')
+        self.assertEqual((log.user_id, log.ip_address, log.user_agent), (kasir.user_id, '10.0.0.7', 'KasirApp/1.0'))
+        self.assertIsNone(current_audit_context())
+
+    def test_aktor_di_luar_request_tanpa_memuat_profil(self):
+        kasir = Kasir.objects.create(user=self.buat_user('kasir', 'kasir'))
+        janji = self.buat_janji(self.buat_pasien('jono'), self.buat_dokter())
+        Pembayaran.objects.create(janji_temu=janji, total_biaya=Decimal('100000'), processed_by=kasir)
+        pembayaran = Pembayaran.objects.select_related('janji_temu__pasien__user').get(janji_temu=janji)
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                pembayaran.save()
+        # Tanpa konteks request: user_id kasir lewat values_list, baris kasir tidak dimuat utuh
+        kasir_sql = [q['sql'] for q in ctx.captured_queries if 'FROM "kasir"' in q['sql']]
+        self.assertEqual(len(kasir_sql), 1)
+        self.assertTrue(kasir_sql[0].startswith('SELECT "kasir"."user_id" AS "user_id" FROM'))
+        log = AuditLog.objects.filter(model_name='Pembayaran', action='update').latest('id')
+        self.assertEqual(log.user_id, kasir.user_id)
+
+    def test_middleware_async(self):
+        async def get_response(request):
+            return current_audit_context()
+
+        middleware = AuditContextMiddleware(get_response)
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='203.0.113.9, 10.0.0.1', HTTP_USER_AGENT='Mobile')
+        context = async_to_sync(middleware)(request)
+        self.assertEqual((context.ip_address, context.user_agent), ('203.0.113.9', 'Mobile'))
+        self.assertIsNone(current_audit_context())
+
+
+class CalculateTotalTest(KlinikTestMixin, TestCase):
+    """Total pembayaran dihitung satu query dan sekali per commit"""
+
+    def setUp(self):
+        pasien = self.buat_pasien('jono')
+        self.janji = self.buat_janji(pasien, self.buat_dokter(), status='confirmed')
+        self.tindakan = LayananTindakan.objects.create(nama_tindakan='Cek Darah', biaya=Decimal('50000'))
+        self.obat = [self.buat_obat(f'Obat {i}') for i in range(10)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pembayaran = Pembayaran.objects.create(janji_temu=self.janji)
+            self.rekam_medis = RekamMedis.objects.create(
+                pasien=pasien, dokter=self.janji.dokter, janji_temu=self.janji, diagnosa='ISPA', anamnesa='Batuk'
+            )
+
+    def test_satu_query(self):
+        self.rekam_medis.tindakan.set([self.tindakan])
+        resep = Resep.objects.create(rekam_medis=self.rekam_medis)
+        for obat in self.obat[:3]:
+            DetailResep.objects.create(resep=resep, obat=obat, jumlah=2, aturan_pakai='3x1')
+        with self.assertNumQueries(1):
+            total = self.pembayaran.calculate_total()
+        self.assertEqual(total, Decimal('180000'))
+        self.assertEqual(
+            (self.pembayaran.biaya_konsultasi, self.pembayaran.biaya_obat, self.pembayaran.biaya_tindakan),
+            (Decimal('100000'), Decimal('30000'), Decimal('50000'))
+        )
+
+    def test_digabung_sekali_per_commit(self):
+        with mock.patch.object(
+            Pembayaran, 'calculate_total', autospec=True, side_effect=Pembayaran.calculate_total
+        ) as calculate_total:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    self.rekam_medis.tindakan.set([self.tindakan])
+                    resep = Resep.objects.create(rekam_medis=self.rekam_medis)
+                    for obat in self.obat:
+                        DetailResep.objects.create(resep=resep, obat=obat, jumlah=1, aturan_pakai='3x1')
+                    self.rekam_medis.save()
+        self.assertEqual(calculate_total.call_count, 1)
+        self.pembayaran.refresh_from_db()
+        self.assertEqual(self.pembayaran.total_biaya, Decimal('200000'))
+
+
+class RekamMedisCreateBulkTest(KlinikTestMixin, TestCase):
+    """Selesai konsultasi: resep dibuat bulk, jumlah query tidak tergantung jumlah baris"""
+
+    def setUp(self):
+        self.dokter = self.buat_dokter()
+        self.obat = [self.buat_obat(f'Obat {i}', stok=20) for i in range(10)]
+        self.tindakan = LayananTindakan.objects.create(nama_tindakan='Cek Darah', biaya=Decimal('50000'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.dokter.user)
+
+    def selesaikan(self, username, obat, jumlah=2):
+        janji = self.buat_janji(self.buat_pasien(username), self.dokter, status='confirmed')
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('rekam-medis-list'), {
+                    'janji_temu_id': janji.pk, 'diagnosa': 'ISPA', 'anamnesa': 'Batuk',
+                    'tindakan_ids': [self.tindakan.pk],
+                    'obat_list': [{'obat_id': o.pk, 'jumlah': jumlah, 'aturan_pakai': '3x1'} for o in obat],
+                }, format='json')
+        return response, len(ctx.captured_queries), janji
+
+    def test_query_konstan_dan_total(self):
+        self.selesaikan('tono', self.obat[:1], jumlah=1)  # counter invoice hari ini dibuat di sini
+        _, sedikit, _ = self.selesaikan('jono', self.obat[:1], jumlah=1)
+        response, banyak, janji = self.selesaikan('budi', self.obat)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sedikit, banyak)
+        pembayaran = Pembayaran.objects.get(janji_temu=janji)
+        self.assertEqual(pembayaran.total_biaya, Decimal('250000'))
+        self.assertEqual(DetailResep.objects.filter(resep__rekam_medis__janji_temu=janji).count(), 10)
+        janji.refresh_from_db()
+        self.assertEqual(janji.status, 'completed')
+
+    def test_validasi_stok_dan_expired(self):
+        response, _, janji = self.selesaikan('jono', [self.obat[0], self.obat[0]], jumlah=15)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('obat_list', response.data)
+
+        self.obat[1].expired_date = timezone.localdate() - timedelta(days=1)
+        self.obat[1].save()
+        response, _, _ = self.selesaikan('budi', self.obat[:2])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RekamMedis.objects.exists())
+
+
+class StokEngineTest(KlinikTestMixin, TestCase):
+    """Stok berubah lewat satu UPDATE atomik dan tidak pernah negatif"""
+
+    def setUp(self):
+        self.apoteker = Apoteker.objects.create(user=self.buat_user('apoteker', 'apoteker'), no_sipa='SIPA-1')
+        self.dokter = self.buat_dokter()
+        self.obat = [self.buat_obat('Paracetamol', stok=20), self.buat_obat('Amoxicillin', stok=20)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.apoteker.user)
+
+    def buat_resep(self, jumlah):
+        pasien = self.buat_pasien(f'pasien{Resep.objects.count()}')
+        rekam_medis = RekamMedis.objects.create(pasien=pasien, dokter=self.dokter, diagnosa='ISPA', anamnesa='Batuk')
+        resep = Resep.objects.create(rekam_medis=rekam_medis)
+        for obat, n in zip([self.obat[0], self.obat[0], self.obat[1]], jumlah):
+            DetailResep.objects.create(resep=resep, obat=obat, jumlah=n, aturan_pakai='3x1')
+        return resep
+
+    def deliver(self, resep):
+        return self.client.post(reverse('resep-proses', args=[resep.pk]), {'status': 'delivered'})
+
+    def stok(self):
+        return [Obat.objects.get(pk=obat.pk).stok for obat in self.obat]
+
+    def test_deliver_mengurangi_stok_sekali(self):
+        resep = self.buat_resep([3, 2, 4])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.deliver(resep)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stok(), [15, 16])
+        update = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "obat" SET "stok"')]
+        self.assertEqual(len(update), 1)
+
+        # Deliver ulang tidak mengurangi stok lagi
+        self.deliver(resep)
+        self.assertEqual(self.stok(), [15, 16])
+
+    def test_stok_tidak_cukup_rollback(self):
+        resep = self.buat_resep([15, 10, 4])
+        response = self.deliver(resep)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Paracetamol', str(response.data))
+        self.assertEqual(self.stok(), [20, 20])
+        self.assertEqual(Resep.objects.get(pk=resep.pk).status, 'pending')
+
+    def test_stok_adjustment(self):
+        StokAdjustment.objects.create(obat=self.obat[0], jumlah=5, reason='opname', created_by=self.apoteker.user)
+        self.assertEqual(self.obat[0].stok, 25)
+        adjustment = StokAdjustment.objects.latest('id')
+        adjustment.catatan = 'Dicek ulang'
+        adjustment.save()
+        self.assertEqual(self.stok(), [25, 20])
+
+        response = self.client.post(reverse('stok-adjustment-list'), {
+            'obat': self.obat[1].pk, 'jumlah': -21, 'reason': 'rusak'
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StokAdjustment.objects.filter(obat=self.obat[1]).exists())
+        with self.assertRaises(StokTidakCukup):
+            apply_stock_deltas({self.obat[0].pk: -1, self.obat[1].pk: -21}, 'adjustment')
+        self.assertEqual(self.stok(), [25, 20])
+
+
+class StokConcurrencyTest(KlinikTestMixin, TransactionTestCase):
+    """Pengurangan stok paralel tidak kehilangan update dan berhenti di 0"""
+
+    def test_pengurangan_paralel(self):
+        obat = self.buat_obat(stok=100)
+
+        def kurangi(i):
+            try:
+                return apply_stock_deltas({obat.pk: -1}, 'resep')[obat.pk]
+            except StokTidakCukup:
+                return None
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            hasil = list(executor.map(kurangi, range(110)))
+
+        self.assertEqual(Obat.objects.get(pk=obat.pk).stok, 0)
+        self.assertEqual(sorted(h for h in hasil if h is not None), list(range(100)))
+        self.assertEqual(hasil.count(None), 10)
+
+
+class StokLedgerTest(KlinikTestMixin, TestCase):
+    """Ledger mutasi stok, snapshot harian dan endpoint riwayat stok"""
+
+    def setUp(self):
+        self.apoteker = Apoteker.objects.create(user=self.buat_user('apoteker', 'apoteker'), no_sipa='SIPA-1')
+        self.obat = self.buat_obat(stok=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.apoteker.user)
+
+    def mutasi(self, jumlah, hari_lalu, tipe='resep'):
+        apply_stock_deltas({self.obat.pk: jumlah}, tipe)
+        StokMovement.objects.filter(pk=StokMovement.objects.latest('id').pk).update(
+            created_at=timezone.now() - timedelta(days=hari_lalu)
+        )
+
+    def test_semua_mutasi_tercatat(self):
+        StokAdjustment.objects.create(obat=self.obat, jumlah=-5, reason='rusak')
+        self.client.post(reverse('obat-restock', args=[self.obat.pk]), {'jumlah': 30})
+        self.client.patch(reverse('obat-detail', args=[self.obat.pk]), {'stok': 120, 'supplier': 'Kimia Farma'})
+        self.obat.refresh_from_db()
+        self.assertEqual((self.obat.stok, self.obat.supplier), (120, 'Kimia Farma'))
+        self.assertEqual(
+            list(StokMovement.objects.order_by('id').values_list('tipe', 'jumlah', 'stok_setelah')),
+            [('awal', 100, 100), ('adjustment', -5, 95), ('restock', 30, 125), ('koreksi', -5, 120)]
+        )
+
+    def test_stok_pada_snapshot_dan_replay(self):
+        StokMovement.objects.update(created_at=timezone.now() - timedelta(days=30))
+        self.mutasi(-10, hari_lalu=20)
+        self.mutasi(-5, hari_lalu=10)
+        self.mutasi(40, hari_lalu=5, tipe='restock')
+        self.mutasi(-7, hari_lalu=1)
+        hari_ini = timezone.localdate()
+        harapan = {25: 100, 15: 90, 8: 85, 3: 125, 0: 118}
+        tanpa_snapshot = {h: stok_pada(self.obat.pk, hari_ini - timedelta(days=h)) for h in harapan}
+        self.assertEqual(tanpa_snapshot, harapan)
+
+        for hari_lalu in (12, 4):
+            snapshot_stok(hari_ini - timedelta(days=hari_lalu))
+        self.assertEqual(
+            list(StokSnapshot.objects.order_by('tanggal').values_list('stok', flat=True)), [90, 125]
+        )
+        with self.assertNumQueries(2):
+            self.assertEqual(stok_pada(self.obat.pk, hari_ini - timedelta(days=3)), 125)
+        self.assertEqual({h: stok_pada(self.obat.pk, hari_ini - timedelta(days=h)) for h in harapan}, harapan)
+
+    def test_endpoint_riwayat_stok(self):
+        self.mutasi(-6, hari_lalu=0)
+        response = self.client.get(reverse('obat-riwayat-stok', args=[self.obat.pk]), {'minggu': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stok'], 94)
+        self.assertEqual([row['jumlah'] for row in response.data['konsumsi_mingguan']], [0, 6])
+        self.assertEqual(response.data['rata_rata_mingguan'], 3)
+
+        response = self.client.get(reverse('obat-riwayat-stok', args=[self.obat.pk]), {'tanggal': 'kemarin'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ObatLotFefoTest(KlinikTestMixin, TestCase):
+    """Stok per lot: keluar first-expire-first-out, lot kedaluwarsa tidak diberikan ke pasien"""
+
+    def setUp(self):
+        self.apoteker = Apoteker.objects.create(user=self.buat_user('apoteker', 'apoteker'), no_sipa='SIPA-1')
+        self.dokter = self.buat_dokter()
+        self.today = timezone.localdate()
+        self.obat = self.buat_obat(stok=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.apoteker.user)
+
+    def restock(self, nomor_lot, jumlah, hari):
+        return self.client.post(reverse('obat-restock', args=[self.obat.pk]), {
+            'jumlah': jumlah, 'nomor_lot': nomor_lot,
+            'expired_date': (self.today + timedelta(days=hari)).isoformat(),
+        })
+
+    def deliver(self, jumlah):
+        pasien = self.buat_pasien(f'pasien{Resep.objects.count()}')
+        rekam_medis = RekamMedis.objects.create(pasien=pasien, dokter=self.dokter, diagnosa='ISPA', anamnesa='Batuk')
+        resep = Resep.objects.create(rekam_medis=rekam_medis)
+        DetailResep.objects.create(resep=resep, obat=self.obat, jumlah=jumlah, aturan_pakai='3x1')
+        return self.client.post(reverse('resep-proses', args=[resep.pk]), {'status': 'delivered'})
+
+    def isi_lot(self):
+        return dict(ObatLot.objects.filter(obat=self.obat).values_list('nomor_lot', 'jumlah'))
+
+    def test_fefo_dan_expired_date_terdekat(self):
+        self.restock('B-90', 10, hari=90)
+        response = self.restock('B-30', 10, hari=30)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['expired_date'], (self.today + timedelta(days=30)).isoformat())
+
+        self.assertEqual(self.deliver(12).status_code, 200)
+        self.assertEqual(self.isi_lot(), {'B-30': 0, 'B-90': 8})
+        self.obat.refresh_from_db()
+        self.assertEqual((self.obat.stok, self.obat.expired_date), (8, self.today + timedelta(days=90)))
+
+        response = self.client.get(reverse('obat-lots', args=[self.obat.pk]))
+        self.assertEqual([row['nomor_lot'] for row in response.data], ['B-90'])
+
+        response = self.client.post(reverse('obat-restock', args=[self.obat.pk]), {
+            'jumlah': 5, 'expired_date': 'besok'
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_restock_sehari_dengan_kedaluwarsa_berbeda(self):
+        # Tanpa nomor_lot: dua penerimaan hari ini menjadi dua lot, bukan satu lot dengan kedaluwarsa pertama
+        for jumlah, hari in [(10, 90), (10, 30)]:
+            response = self.client.post(reverse('obat-restock', args=[self.obat.pk]), {
+                'jumlah': jumlah, 'expired_date': (self.today + timedelta(days=hari)).isoformat(),
+            })
+            self.assertEqual(response.status_code, 200)
+        lots = dict(ObatLot.objects.filter(obat=self.obat, jumlah__gt=0).values_list('expired_date', 'jumlah'))
+        self.assertEqual(lots, {self.today + timedelta(days=90): 10, self.today + timedelta(days=30): 10})
+
+        self.assertEqual(self.deliver(12).status_code, 200)
+        lots = dict(ObatLot.objects.filter(obat=self.obat).values_list('expired_date', 'jumlah'))
+        self.assertEqual(lots, {self.today + timedelta(days=90): 8, self.today + timedelta(days=30): 0})
+
+        # Nomor lot yang sama dengan kedaluwarsa lain ditolak
+        self.restock('B-1', 5, hari=60)
+        response = self.restock('B-1', 5, hari=45)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('B-1', response.data['error'])
+        self.assertEqual(self.isi_lot()['B-1'], 5)
+
+    def test_restock_tanpa_kedaluwarsa_mewarisi_obat(self):
+        obat = self.buat_obat('Amoxicillin', stok=0, expired_date=self.today + timedelta(days=100))
+        response = self.client.post(reverse('obat-restock', args=[obat.pk]), {'jumlah': 5, 'nomor_lot': 'X'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ObatLot.objects.get(obat=obat, nomor_lot='X').expired_date, self.today + timedelta(days=100))
+
+    def test_stok_habis_lalu_restock_tanpa_lot(self):
+        self.restock('B-30', 10, hari=30)
+        self.assertEqual(self.deliver(10).status_code, 200)
+        # Stok habis: expired_date obat tidak dikosongkan
+        self.obat.refresh_from_db()
+        self.assertEqual((self.obat.stok, self.obat.expired_date), (0, self.today + timedelta(days=30)))
+
+        response = self.client.post(reverse('obat-restock', args=[self.obat.pk]), {'jumlah': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            ObatLot.objects.filter(obat=self.obat, jumlah=5).values_list('expired_date', flat=True).get(),
+            self.today + timedelta(days=30),
+        )
+        self.obat.refresh_from_db()
+        self.assertEqual(self.obat.expired_date, self.today + timedelta(days=30))
+
+    def test_lot_kedaluwarsa_dilewati(self):
+        self.restock('LAMA', 10, hari=-1)
+        self.restock('BARU', 5, hari=60)
+
+        self.assertEqual(self.deliver(4).status_code, 200)
+        self.assertEqual(self.isi_lot(), {'LAMA': 10, 'BARU': 1})
+
+        # Sisa stok cukup secara total, tapi hanya 1 yang layak pakai
+        response = self.deliver(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('kedaluwarsa', str(response.data))
+        self.assertEqual(self.isi_lot(), {'LAMA': 10, 'BARU': 1})
+
+        # Pemusnahan (adjustment) boleh mengambil lot kedaluwarsa
+        StokAdjustment.objects.create(obat=self.obat, jumlah=-10, reason='expired')
+        self.assertEqual(self.isi_lot(), {'LAMA': 0, 'BARU': 1})
+
+    def test_laporan_kedaluwarsa(self):
+        lain = self.buat_obat('Amoxicillin', stok=20, expired_date=self.today + timedelta(days=200))
+        self.restock('SEGERA', 5, hari=10)
+        self.restock('LAMA', 5, hari=-3)
+
+        response = self.client.get(reverse('obat-expired-soon'))
+        self.assertEqual([row['id'] for row in response.data], [self.obat.pk])
+        response = self.client.get(reverse('obat-already-expired'))
+        self.assertEqual([row['id'] for row in response.data], [self.obat.pk])
+
+        # expired_date obat yang diubah manual ikut ke lot default
+        lain.expired_date = self.today + timedelta(days=5)
+        lain.save()
+        response = self.client.get(reverse('obat-expired-soon'))
+        self.assertEqual({row['id'] for row in response.data}, {self.obat.pk, lain.pk})
+
+    def test_validasi_resep_memakai_stok_layak_pakai(self):
+        self.restock('LAMA', 10, hari=-1)
+        self.restock('BARU', 2, hari=60)
+        serializer = RekamMedisCreateSerializer()
+        with self.assertRaisesMessage(serializers.ValidationError, 'tersedia 2'):
+            serializer.validate_obat_list([{'obat_id': self.obat.pk, 'jumlah': 3}])
+        self.assertEqual(len(serializer.validate_obat_list([{'obat_id': self.obat.pk, 'jumlah': 2}])), 1)
+
+
+@override_settings(FORECAST_LEAD_TIME_SUPPLIER={'PT Cepat': 3})
+class ObatForecastTest(KlinikTestMixin, TestCase):
+    """Reorder point dinamis dari konsumsi resep harian"""
+
+    def setUp(self):
+        self.apoteker = Apoteker.objects.create(user=self.buat_user('apoteker', 'apoteker'), no_sipa='SIPA-1')
+        self.dokter = self.buat_dokter()
+        self.today = timezone.localdate()
+        self.laris = self.buat_obat('Paracetamol', stok=9, supplier='PT Cepat')
+        self.jarang = self.buat_obat('Ampicillin Injeksi', stok=5)
+        Obat.objects.filter(pk=self.laris.pk).update(created_at=timezone.now() - timedelta(days=60))
+        Obat.objects.filter(pk=self.jarang.pk).update(created_at=timezone.now() - timedelta(days=400))
+        self.client = APIClient()
+        self.client.force_authenticate(self.apoteker.user)
+
+    def resep_delivered(self, jumlah, hari_lalu):
+        pasien = self.buat_pasien(f'pasien{Resep.objects.count()}')
+        rekam_medis = RekamMedis.objects.create(pasien=pasien, dokter=self.dokter, diagnosa='ISPA', anamnesa='Batuk')
+        resep = Resep.objects.create(rekam_medis=rekam_medis)
+        DetailResep.objects.create(resep=resep, obat=self.laris, jumlah=jumlah, aturan_pakai='3x1')
+        Resep.objects.filter(pk=resep.pk).update(
+            status='delivered', processed_at=timezone.now() - timedelta(days=hari_lalu)
+        )
+
+    def test_reorder_point(self):
+        for jumlah, hari_lalu in [(6, 1), (4, 3), (8, 10), (50, 0)]:
+            self.resep_delivered(jumlah, hari_lalu)
+        # Resep yang belum diserahkan tidak dihitung
+        Resep.objects.create(rekam_medis=RekamMedis.objects.first())
+
+        with self.assertNumQueries(3):
+            hitung_forecast()
+        laris = ObatForecast.objects.get(obat=self.laris)
+        # 18 tablet dalam 60 hari umur obat (pemakaian hari ini belum dihitung)
+        self.assertAlmostEqual(laris.rata_rata_7_hari, 10 / 7)
+        self.assertAlmostEqual(laris.rata_rata_28_hari, 18 / 28)
+        self.assertAlmostEqual(laris.kebutuhan_harian, 10 / 7)
+        self.assertAlmostEqual(laris.std_harian, ((116 - 60 * 0.3 ** 2) / 59) ** 0.5)
+        self.assertEqual((laris.lead_time_hari, laris.safety_stock, laris.reorder_point), (3, 4, 9))
+
+        jarang = ObatForecast.objects.get(obat=self.jarang)
+        self.assertEqual((jarang.lead_time_hari, jarang.kebutuhan_harian, jarang.reorder_point), (7, 0, 0))
+
+    def test_endpoint_dan_stok_menipis(self):
+        self.resep_delivered(10, 2)
+        call_command('forecast_stok', stdout=StringIO())
+        baru = self.buat_obat('Vitamin C', stok=5)
+
+        response = self.client.get(reverse('obat-stok-menipis'))
+        self.assertEqual({row['id'] for row in response.data}, {self.laris.pk, baru.pk})
+
+        response = self.client.get(reverse('obat-forecast'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['obat'] for row in response.data], [self.laris.pk, self.jarang.pk])
+        self.assertAlmostEqual(response.data[0]['days_of_cover'], 9 / (10 / 7))
+        self.assertIsNone(response.data[1]['days_of_cover'])
+
+        response = self.client.get(reverse('obat-forecast'), {'perlu_restock': 1})
+        self.assertEqual([row['obat'] for row in response.data], [self.laris.pk])
+
+
+class ObatIndexPlanTest(KlinikTestMixin, TestCase):
+    """Query laporan obat di dashboard apoteker harus memakai index, bukan scan tabel obat"""
+
+    def setUp(self):
+        self.apoteker = Apoteker.objects.create(user=self.buat_user('apoteker', 'apoteker'), no_sipa='SIPA-1')
+        today = timezone.localdate()
+        self.obat = [
+            self.buat_obat(f'Obat {i}', stok=i * 3, expired_date=today + timedelta(days=i * 10 - 20))
+            for i in range(1, 8)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.apoteker.user)
+
+    def query_plan(self, url_name):
+        """Jalankan endpoint, lalu EXPLAIN QUERY PLAN setiap query ke tabel obat"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                if 'FROM "obat"' in query['sql']:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                    plans.append('\n'.join(row[-1] for row in cursor.fetchall()))
+        self.assertTrue(plans)
+        return response, plans
+
+    def assertTanpaScanObat(self, plan):
+        self.assertNotRegex(plan, r'SCAN (obat|"obat")(?! USING)')
+
+    def test_stok_menipis(self):
+        response, plans = self.query_plan('obat-stok-menipis')
+        self.assertEqual(len(response.data), 3)
+        self.assertIn('obat_aktif_stok_idx', plans[0])
+        self.assertTanpaScanObat(plans[0])
+
+        response, plans = self.query_plan('apoteker-stats')
+        self.assertEqual(response.data['obat_menipis'], 3)
+        self.assertIn('obat_aktif_stok_idx', plans[0])
+
+    def test_kedaluwarsa(self):
+        for url_name, jumlah in (('obat-expired-soon', 3), ('obat-already-expired', 1)):
+            response, plans = self.query_plan(url_name)
+            self.assertEqual(len(response.data), jumlah)
+            self.assertIn('obat_lot_expiry_idx', plans[0])
+            self.assertTanpaScanObat(plans[0])
+
+
+class HotFilterIndexTest(KlinikTestMixin, TestCase):
+    """Filter utama view memakai index komposit; filter tanggal ditulis sebagai range"""
+
+    def setUp(self):
+        self.apoteker = Apoteker.objects.create(user=self.buat_user('apoteker', 'apoteker'), no_sipa='SIPA-1')
+        self.dokter = self.buat_dokter()
+
+    def test_query_plan(self):
+        today = timezone.localdate()
+        self.assertIn('janji_tanggal_status_idx', JanjiTemu.objects.filter(
+            tanggal=today, status__in=['confirmed', 'pending']
+        ).order_by('nomor_antrian').explain())
+        self.assertIn('pembayaran_status_bayar_idx', Pembayaran.objects.filter(
+            status='lunas', tanggal_bayar__gte=timezone.now()
+        ).explain())
+        self.assertIn('rekam_medis_dokter_idx', RekamMedis.objects.filter(
+            dokter=self.dokter
+        ).order_by('-tanggal_periksa')[:20].explain())
+
+    def test_resep_hari_ini_range_lokal(self):
+        pasien = self.buat_pasien('budi')
+        rekam_medis = RekamMedis.objects.create(pasien=pasien, dokter=self.dokter, diagnosa='ISPA', anamnesa='Batuk')
+        mulai_hari, _ = local_day_range(timezone.localdate())
+        for processed_at in (mulai_hari, mulai_hari - timedelta(seconds=1), mulai_hari + timedelta(hours=23)):
+            resep = Resep.objects.create(rekam_medis=rekam_medis)
+            Resep.objects.filter(pk=resep.pk).update(status='delivered', processed_at=processed_at)
+
+        client = APIClient()
+        client.force_authenticate(self.apoteker.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse('apoteker-stats'))
+        self.assertEqual(response.data['resep_hari_ini'], 2)
+        sql = next(q['sql'] for q in ctx.captured_queries if 'processed_at' in q['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('resep_status_processed_idx (status=? AND processed_at>? AND processed_at<?)', plan)
+
+    def test_benchmark_tidak_mengubah_index(self):
+        out = StringIO()
+        call_command('benchmark_index', ulang=1, stdout=out)
+        self.assertIn('rekam medis dokter', out.getvalue())
+        self.assertIn('rekam_medis_dokter_idx', RekamMedis.objects.filter(dokter=self.dokter).explain())
+
+
+class SeedDataScaleTest(KlinikTestMixin, TestCase):
+    """seed_data --scale: volume sintetis konsisten, deterministik, dan nomor dokumen tetap unik"""
+
+    def seed(self, **options):
+        call_command('seed_data', scale=0.05, tahun=1, stdout=StringIO(), **options)
+        return (
+            list(JanjiTemu.objects.order_by('id').values_list('tanggal', 'waktu', 'status', 'nomor_antrian', 'keluhan')),
+            list(Pembayaran.objects.order_by('id').values_list('status', 'metode', 'total_biaya')),
+            DetailResep.objects.count(),
+        )
+
+    def test_volume_dan_konsistensi(self):
+        self.seed()
+        self.assertEqual(Pasien.objects.filter(user__username__startswith='psn').count(), 50)
+        self.assertEqual(PasienSearch.objects.count(), Pasien.objects.count())
+        sintetis = JanjiTemu.objects.filter(dokter__no_str__startswith='STR-SIM')
+        self.assertGreater(sintetis.count(), 300)
+        selesai = sintetis.filter(status='completed')
+        self.assertEqual(RekamMedis.objects.filter(janji_temu__in=selesai).count(), selesai.count())
+        self.assertEqual(Pembayaran.objects.filter(janji_temu__in=selesai).count(), selesai.count())
+        self.assertFalse(sintetis.exclude(status='completed').filter(rekam_medis__isnull=False).exists())
+
+        # Timestamp historis, bukan waktu seeding
+        self.assertLess(RekamMedis.objects.earliest('tanggal_periksa').tanggal_periksa,
+                        timezone.now() - timedelta(days=200))
+
+        # Total pembayaran sama dengan hitungan model dan rollup ikut dibangun ulang
+        for pembayaran in Pembayaran.objects.filter(janji_temu__in=selesai).order_by('?')[:5]:
+            total = pembayaran.total_biaya
+            pembayaran.calculate_total()
+            self.assertEqual(pembayaran.total_biaya, total)
+        lunas = Pembayaran.objects.filter(status='lunas').aggregate(total=Sum('total_biaya'))['total']
+        self.assertEqual(DailyRevenueRollup.objects.aggregate(total=Sum('total_biaya'))['total'], lunas)
+
+        # Nomor dokumen berikutnya tidak bentrok dengan data sintetis
+        pasien = self.buat_pasien('pasienbaru')
+        self.assertFalse(Pasien.objects.filter(no_rm=pasien.no_rm).exclude(pk=pasien.pk).exists())
+        janji = self.buat_janji(pasien, Dokter.objects.get(no_str='STR-SIM-0001'))
+        self.assertEqual(JanjiTemu.objects.filter(
+            dokter=janji.dokter, tanggal=janji.tanggal, nomor_antrian=janji.nomor_antrian
+        ).count(), 1)
+
+    def test_deterministik(self):
+        pertama = self.seed(seed=7)
+        self.assertEqual(self.seed(seed=7), pertama)
+        self.assertNotEqual(self.seed(seed=8), pertama)
+
+
+@override_settings(SSE_HEARTBEAT=60)
+class AntrianStreamTest(KlinikTestMixin, TestCase):
+    """Layar antrian menerima snapshot lalu delta janji temu lewat SSE"""
+
+    def setUp(self):
+        self.dokter = self.buat_dokter()
+        self.resepsionis = self.buat_user('resepsionis', 'resepsionis')
+        Resepsionis.objects.create(user=self.resepsionis)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.janji = self.buat_janji(self.buat_pasien('jono'), self.dokter)
+        self.url = reverse('antrian-stream')
+        self.params = {'ticket': buat_tiket_stream(self.resepsionis), 'dokter_id': self.dokter.pk}
+
+    @staticmethod
+    async def event_berikutnya(stream):
+        # Delta harus sampai ke layar dalam satu detik
+        chunk = await asyncio.wait_for(anext(stream), timeout=1)
+        event, data = chunk.decode().strip().split('\n')
+        return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+    def konfirmasi_dan_booking(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.janji.status = 'confirmed'
+            self.janji.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.buat_janji(self.buat_pasien('budi'), self.dokter, waktu=time(10, 0))
+
+    async def test_snapshot_lalu_delta(self):
+        response = await self.async_client.get(self.url, self.params)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+
+        event, data = await self.event_berikutnya(stream)
+        self.assertEqual(event, 'snapshot')
+        self.assertEqual([(row['id'], row['status'], row['pasien_nama']) for row in data],
+                         [(self.janji.pk, 'pending', 'Jono')])
+
+        baru = await sync_to_async(self.konfirmasi_dan_booking)()
+        event, data = await self.event_berikutnya(stream)
+        self.assertEqual((event, data['aksi'], data['janji']['id'], data['janji']['status']),
+                         ('antrian', 'dikonfirmasi', self.janji.pk, 'confirmed'))
+        _, data = await self.event_berikutnya(stream)
+        self.assertEqual((data['aksi'], data['janji']['id'], data['janji']['nomor_antrian']),
+                         ('baru', baru.pk, 'SIT-02'))
+        # Layar ditutup: handler ASGI membatalkan stream yang sedang menunggu
+        menunggu = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        menunggu.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await menunggu
+        self.assertFalse(get_broker().has_subscribers(channel_antrian(self.janji.tanggal, self.dokter.pk)))
+
+    def pindah_dan_hapus(self, dokter_lain):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.janji.dokter = dokter_lain
+            self.janji.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            JanjiTemu.objects.get(pk=self.janji.pk).delete()
+
+    async def test_dipindah_dan_dihapus(self):
+        dokter_lain = await sync_to_async(self.buat_dokter)('doni')
+        response = await self.async_client.get(self.url, self.params)
+        stream = aiter(response.streaming_content)
+        lain = await self.async_client.get(self.url, {**self.params, 'dokter_id': dokter_lain.pk})
+        stream_lain = aiter(lain.streaming_content)
+        self.assertEqual((await self.event_berikutnya(stream))[1][0]['id'], self.janji.pk)
+        self.assertEqual((await self.event_berikutnya(stream_lain))[1], [])
+
+        await sync_to_async(self.pindah_dan_hapus)(dokter_lain)
+        # Antrian dokter lama melepas barisnya, antrian dokter baru menerimanya lalu melepasnya
+        _, data = await self.event_berikutnya(stream)
+        self.assertEqual((data['aksi'], data['janji']['id']), ('dipindah', self.janji.pk))
+        _, data = await self.event_berikutnya(stream_lain)
+        self.assertEqual((data['aksi'], data['janji']['id'], data['janji']['nomor_antrian']),
+                         ('diubah', self.janji.pk, 'DON-01'))
+        _, data = await self.event_berikutnya(stream_lain)
+        self.assertEqual((data['aksi'], data['janji']['id']), ('dihapus', self.janji.pk))
+
+        for menunggu in [asyncio.ensure_future(anext(stream)), asyncio.ensure_future(anext(stream_lain))]:
+            await asyncio.sleep(0)
+            menunggu.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await menunggu
+
+    def test_tanpa_layar_tidak_ada_query(self):
+        batch = AntrianEventBatch()
+        batch.entries['delta'][self.janji.pk] = ('baru', (channel_antrian(self.janji.tanggal),))
+        with self.assertNumQueries(0):
+            batch.write(batch.entries)
+
+    def test_autentikasi_dan_parameter(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.assertEqual(self.client.get(self.url, {'ticket': buat_tiket_stream(self.dokter.user)}).status_code, 403)
+        response = self.client.get(self.url, {**self.params, 'tanggal': '18-10-2026'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+    def test_tiket_stream(self):
+        client = APIClient()
+        client.force_authenticate(self.resepsionis)
+        response = client.post(reverse('stream-ticket'))
+        self.assertEqual(response.data['expires_in'], 60)
+        tiket = response.data['ticket']
+        # Access token JWT tidak diterima lewat URL; tiket tidak bisa dipakai sebagai bearer token
+        token = str(AccessToken.for_user(self.resepsionis))
+        self.assertEqual(self.client.get(self.url, {'token': token}).status_code, 401)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION=f'Bearer {tiket}').status_code, 401)
+        with override_settings(STREAM_TICKET_TIMEOUT=-1):
+            self.assertEqual(self.client.get(self.url, {'ticket': tiket}).status_code, 401)
+        # Server WSGI (runserver) tidak bisa melayani stream async: 501, bukan request menggantung
+        response = self.client.get(self.url, {'ticket': tiket})
+        self.assertEqual(response.status_code, 501)
+        self.assertIn('ASGI', response.json()['error'])
+
+
+class PasienSearchTest(KlinikTestMixin, TestCase):
+    """Pencarian pasien lewat index FTS5 / prefix, sinkron dari CustomUser dan Pasien"""
+
+    def setUp(self):
+        resepsionis = self.buat_user('resepsionis', 'resepsionis')
+        Resepsionis.objects.create(user=resepsionis)
+        self.client = APIClient()
+        self.client.force_authenticate(resepsionis)
+        self.siti = self.buat_pasien_lengkap('siti', 'Siti', 'Rahmawati', '+62 812-3456-7890')
+        self.sitompul = self.buat_pasien_lengkap('andi', 'Andi', 'Sitompul', '0813 1111 2222')
+        self.budi = self.buat_pasien_lengkap('budi', 'Budi', 'Santoso', '081399998888')
+
+    def buat_pasien_lengkap(self, username, first_name, last_name, phone):
+        user = self.buat_user(username, 'pasien', last_name=last_name, phone=phone)
+        user.first_name = first_name
+        user.save()
+        return Pasien.objects.create(user=user)
+
+    def cari(self, q, client=None, url=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = (client or self.client).get(url or reverse('pasien-list'), {'search': q})
+        self.assertEqual(response.status_code, 200)
+        # Tidak ada leading-wildcard LIKE (icontains) dari SearchFilter
+        self.assertFalse([query for query in ctx.captured_queries if ' LIKE ' in query['sql']])
+        return [row['id'] for row in response.data['results']]
+
+    def test_nama_prefix_dan_urutan(self):
+        self.assertEqual(sorted(self.cari('sit')), sorted([self.siti.pk, self.sitompul.pk]))
+        self.assertEqual(self.cari('siti rah'), [self.siti.pk])
+        self.assertEqual(self.cari('SANTOSO'), [self.budi.pk])
+        self.assertEqual(self.cari('zzz'), [])
+
+    def test_telepon_dan_no_rm(self):
+        for q in ['0812 3456', '+62812345', '812-3456-7890']:
+            self.assertEqual(self.cari(q), [self.siti.pk])
+        self.assertEqual(sorted(self.cari('0813')), sorted([self.sitompul.pk, self.budi.pk]))
+        self.assertEqual(self.cari(self.budi.no_rm.lower()), [self.budi.pk])
+        self.assertEqual(self.cari(self.budi.no_rm[2:]), [self.budi.pk])
+        self.assertEqual(len(self.cari('RM')), 3)
+
+    def test_akhiran_no_rm_dan_telepon(self):
+        # Nomor urut RM dan digit terakhir HP dicari lewat kolom terbalik
+        self.assertEqual(self.cari(self.budi.no_rm[-5:]), [self.budi.pk])
+        self.assertEqual(self.cari('7890'), [self.siti.pk])
+        self.assertEqual(self.cari('2222'), [self.sitompul.pk])
+        self.assertEqual(self.cari('1111 2222'), [self.sitompul.pk])
+
+    @override_settings(PASIEN_SEARCH_LIMIT=1)
+    def test_paginasi_melewati_batas_relevansi(self):
+        # Batas hanya untuk urutan relevansi: count dan hasil tetap semua pasien yang cocok
+        response = self.client.get(reverse('pasien-list'), {'search': 'sit'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(reverse('pasien-list'), {'search': '0813'})
+        self.assertEqual(response.data['count'], 2)
+
+    def test_sinkron_saat_user_berubah(self):
+        user = self.budi.user
+        user.first_name = 'Bambang'
+        user.phone = '0857 0000 1111'
+        user.save()
+        user.save(update_fields=['last_login'])
+        self.assertEqual(self.cari('bambang'), [self.budi.pk])
+        self.assertEqual(self.cari('budi'), [])
+        self.assertEqual(self.cari('0857'), [self.budi.pk])
+
+        user.delete()
+        self.assertEqual(self.cari('bambang'), [])
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO pasien_fts(pasien_fts, rank) VALUES ('integrity-check', 1)")
+
+    def test_scope_pasien_dokter(self):
+        dokter = self.buat_dokter()
+        self.buat_janji(self.siti, dokter)
+        client = APIClient()
+        client.force_authenticate(dokter.user)
+        self.assertEqual(self.cari('sit', client, reverse('dokter-pasien-saya')), [self.siti.pk])
+
+    def test_rebuild_search(self):
+        PasienSearch.objects.all().delete()
+        self.assertEqual(self.cari('siti'), [])
+        out = StringIO()
+        call_command('rebuild_search', stdout=out)
+        self.assertIn('3 pasien', out.getvalue())
+        self.assertEqual(self.cari('siti'), [self.siti.pk])
+
+
+class RekamMedisSearchTest(KlinikTestMixin, TestCase):
+    """Pencarian teks klinis rekam medis: kata dasar, singkatan, skor dan highlight"""
+
+    def setUp(self):
+        self.dokter = self.buat_dokter()
+        self.client = APIClient()
+        self.client.force_authenticate(self.dokter.user)
+        self.pasien = self.buat_pasien('budi')
+        self.ispa = self.buat_rekam_medis('ISPA', 'Pasien mengeluh batuk pilek 3 hari')
+        self.ht = self.buat_rekam_medis(
+            'Hipertensi grade 1', 'Keluhan pusing, sesak nafas', pemeriksaan_fisik='TD 150/90'
+        )
+        self.kontrol = self.buat_rekam_medis('Kontrol rutin', 'Riwayat HT, tidak ada keluhan <b>')
+
+    def buat_rekam_medis(self, diagnosa, anamnesa, dokter=None, **extra):
+        return RekamMedis.objects.create(
+            pasien=self.pasien, dokter=dokter or self.dokter,
+            diagnosa=diagnosa, anamnesa=anamnesa, **extra
+        )
+
+    def cari(self, q):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('rekam-medis-cari'), {'q': q})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in ctx.captured_queries if ' LIKE ' in query['sql']])
+        return response.data
+
+    def ids(self, q):
+        return [row['id'] for row in self.cari(q)]
+
+    def test_kata_dasar_dan_ejaan(self):
+        semua = {self.ispa.pk, self.ht.pk, self.kontrol.pk}
+        self.assertEqual(set(self.ids('keluhan')), semua)
+        self.assertEqual(set(self.ids('mengeluhkan')), semua)
+        self.assertEqual(self.ids('sesek'), [self.ht.pk])
+        # ISPA di-index bersama kepanjangannya (saluran pernapasan)
+        self.assertEqual(set(self.ids('napas')), {self.ispa.pk, self.ht.pk})
+        self.assertEqual(self.ids('batuk keluh'), [self.ispa.pk])
+        self.assertEqual(self.ids('demam'), [])
+
+    def test_singkatan_dua_arah(self):
+        self.assertEqual(self.ids('infeksi saluran pernapasan'), [self.ispa.pk])
+        self.assertEqual(self.ids('ispa'), [self.ispa.pk])
+        # Diagnosa berbobot lebih besar dari anamnesa
+        self.assertEqual(self.ids('hipertensi'), [self.ht.pk, self.kontrol.pk])
+        self.assertEqual(self.ids('HT'), [self.ht.pk, self.kontrol.pk])
+        self.assertEqual(self.ids('tekanan darah'), [self.ht.pk])
+
+    def test_highlight(self):
+        hasil = self.cari('ht keluhan')
+        kontrol = next(row for row in hasil if row['id'] == self.kontrol.pk)
+        self.assertEqual(kontrol['pasien']['no_rm'], self.pasien.no_rm)
+        self.assertGreater(kontrol['skor'], 0)
+        self.assertEqual(
+            kontrol['highlight'],
+            {'anamnesa': 'Riwayat <mark>HT</mark>, tidak ada <mark>keluhan</mark> &lt;b&gt;'},
+        )
+        response = self.client.get(reverse('rekam-medis-cari'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_scope_dokter_dan_search_list(self):
+        lain = self.buat_dokter('dokterlain')
+        self.buat_rekam_medis('ISPA berulang', 'Batuk', dokter=lain)
+        self.assertEqual(self.ids('ispa'), [self.ispa.pk])
+
+        response = self.client.get(reverse('rekam-medis-list'), {'search': 'ispa'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.ispa.pk])
+        # ?search= juga mencocokkan pasien (nama, no RM)
+        response = self.client.get(reverse('rekam-medis-list'), {'search': 'budi'})
+        self.assertEqual(len(response.data['results']), 3)
+
+    @override_settings(REKAM_MEDIS_SEARCH_LIMIT=1)
+    def test_search_list_melewati_batas_skor(self):
+        # Batas hanya untuk urutan skor: semua yang cocok tetap terhitung dan dipaginasi
+        response = self.client.get(reverse('rekam-medis-list'), {'search': 'hipertensi'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.ht.pk, self.kontrol.pk])
+
+    def test_normalisasi_migrasi_sama_dengan_index(self):
+        # Migrasi 0015 memakai salinan normalisasi, tidak mengimpor core.search
+        migrasi = import_module('core.migrations.0015_rekam_medis_search')
+        for teks in ['Pasien mengeluhkan sesek nafas, riwayat HT & DM', 'Menyakiti memeriksa', '']:
+            self.assertEqual(migrasi.normalisasi_klinis(teks), normalisasi_klinis(teks))
+
+    def test_sinkron_saat_disimpan(self):
+        self.ispa.diagnosa = 'Dispepsia'
+        self.ispa.save()
+        self.assertEqual(self.ids('ispa'), [])
+        self.assertEqual(self.ids('dispepsia'), [self.ispa.pk])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.ispa.waktu_mulai = timezone.now()
+            self.ispa.save(update_fields=['waktu_mulai'])
+        self.assertFalse([query for query in ctx.captured_queries if 'rekam_medis_search' in query['sql']])
+
+        self.ispa.delete()
+        self.assertEqual(self.ids('dispepsia'), [])
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO rekam_medis_fts(rekam_medis_fts, rank) VALUES ('integrity-check', 1)")
+
+    def test_rebuild_search(self):
+        RekamMedisSearch.objects.all().delete()
+        self.assertEqual(self.ids('ispa'), [])
+        out = StringIO()
+        call_command('rebuild_search', index=['rekam_medis'], stdout=out)
+        self.assertIn('3 rekam medis', out.getvalue())
+        self.assertNotIn('pasien', out.getvalue())
+        self.assertEqual(self.ids('ispa'), [self.ispa.pk])
+
+
+class DokterSlotTest(KlinikTestMixin, TestCase):
+    """Slot praktik dari jadwal mingguan dikurangi booking, dengan cache per (dokter, tanggal)"""
+
+    def setUp(self):
+        cache.clear()
+        self.tanggal = timezone.localdate() + timedelta(days=7)
+        self.hari = HARI[self.tanggal.weekday()]
+        self.dokter = self.buat_dokter(jadwal_praktik={
+            self.hari: {'mulai': '9:00', 'selesai': '10:00'},
+        })
+        self.pasien = self.buat_pasien('budi')
+        self.client = APIClient()
+        self.client.force_authenticate(self.pasien.user)
+        self.url = reverse('dokter-slots', args=[self.dokter.pk])
+
+    def slots(self, **params):
+        params.setdefault('from', self.tanggal.isoformat())
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return {
+            row['waktu'].strftime('%H:%M'): row['tersedia']
+            for hari in response.data['jadwal'] for row in hari['slots']
+        }
+
+    def booking(self, waktu, client=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return (client or self.client).post(reverse('booking-create'), {
+                'dokter_id': self.dokter.pk, 'tanggal': self.tanggal.isoformat(),
+                'waktu': waktu, 'keluhan': 'Demam',
+            })
+
+    def test_slot_dikurangi_booking(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buat_janji(self.pasien, self.dokter, tanggal=self.tanggal, waktu=time(9, 15))
+            self.buat_janji(self.pasien, self.dokter, tanggal=self.tanggal, waktu=time(9, 30), status='cancelled')
+            # Di luar kelipatan slot: menempati slot 09:45
+            self.buat_janji(self.pasien, self.dokter, tanggal=self.tanggal, waktu=time(9, 50))
+        self.assertEqual(
+            self.slots(), {'09:00': True, '09:15': False, '09:30': True, '09:45': False}
+        )
+
+    def test_satu_query_lalu_cache(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.slots(to=(self.tanggal + timedelta(days=27)).isoformat())
+        janji = [query for query in ctx.captured_queries if 'janji_temu' in query['sql']]
+        self.assertEqual(len(janji), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.slots(to=(self.tanggal + timedelta(days=27)).isoformat())
+        self.assertFalse([query for query in ctx.captured_queries if 'janji_temu' in query['sql']])
+
+    def test_booking_menghapus_cache(self):
+        self.assertTrue(self.slots()['09:00'])
+        response = self.booking('09:00')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(self.slots()['09:00'])
+
+        # Slot yang sama tidak bisa dibooking dua kali
+        lain = APIClient()
+        lain.force_authenticate(self.buat_pasien('ani').user)
+        response = self.booking('09:00', lain)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('sudah dibooking', str(response.data))
+
+        janji = JanjiTemu.objects.get(dokter=self.dokter, tanggal=self.tanggal)
+        with self.captureOnCommitCallbacks(execute=True):
+            janji.status = 'cancelled'
+            janji.save()
+        self.assertTrue(self.slots()['09:00'])
+
+    def test_validasi_booking(self):
+        # "9:30" < "9:00" dan "10:00" < "9:00" sebagai string; dibandingkan sebagai waktu
+        self.assertEqual(self.booking('09:30').status_code, 201)
+        for waktu in ['08:45', '09:10', '10:00']:
+            response = self.booking(waktu)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('09:00 - 10:00', str(response.data))
+
+    def test_booking_bersamaan_ditolak_constraint(self):
+        self.assertEqual(self.booking('09:00').status_code, 201)
+        lain = APIClient()
+        lain.force_authenticate(self.buat_pasien('ani').user)
+        # Request kedua lolos validasi sebelum request pertama commit: database yang menolak
+        with mock.patch('core.serializers.cek_slot', return_value=None):
+            response = self.booking('09:00', lain)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('baru saja dibooking', str(response.data))
+        self.assertEqual(JanjiTemu.objects.filter(dokter=self.dokter, tanggal=self.tanggal).count(), 1)
+
+    def test_integrity_error_lain_tidak_dianggap_bentrok_slot(self):
+        error = IntegrityError('UNIQUE constraint failed: janji_temu.nomor_antrian')
+        with mock.patch('rest_framework.serializers.ModelSerializer.create', side_effect=error):
+            with self.assertRaises(IntegrityError):
+                self.booking('09:00')
+
+    def test_jadwal_ulang_resepsionis_divalidasi(self):
+        janji = self.buat_janji(self.pasien, self.dokter, tanggal=self.tanggal, waktu=time(9, 0))
+        ani = self.buat_pasien('ani')
+        self.buat_janji(ani, self.dokter, tanggal=self.tanggal, waktu=time(9, 15))
+        resepsionis = self.buat_user('resepsionis', 'resepsionis')
+        Resepsionis.objects.create(user=resepsionis)
+        client = APIClient()
+        client.force_authenticate(resepsionis)
+        url = reverse('janji-temu-detail', args=[janji.pk])
+
+        for data, pesan in [
+            ({'waktu': '09:15'}, 'sudah dibooking'),
+            ({'waktu': '09:20'}, 'slot tiap 15 menit'),
+            ({'tanggal': (self.tanggal + timedelta(days=1)).isoformat()}, 'tidak praktik'),
+        ]:
+            response = client.patch(url, data)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(pesan, str(response.data))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(url, {'waktu': '09:45'})
+        self.assertEqual(response.status_code, 200)
+        # Perubahan selain slot tidak divalidasi ulang
+        self.assertEqual(client.patch(url, {'keluhan': 'Batuk'}).status_code, 200)
+        self.assertEqual(self.slots(), {'09:00': True, '09:15': False, '09:30': True, '09:45': False})
+
+    def test_perubahan_jadwal_langsung_berlaku(self):
+        self.assertEqual(len(self.slots()), 4)
+        client = APIClient()
+        client.force_authenticate(self.dokter.user)
+        response = client.put(reverse('dokter-jadwal-saya'), {
+            'jadwal_praktik': {self.hari: {'mulai': '13:00', 'selesai': '14:00', 'durasi': 30}},
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.slots(), {'13:00': True, '13:30': True})
+
+    def test_parameter_tidak_valid(self):
+        for params in [{'from': 'besok'}, {'from': '2026-01-10', 'to': '2026-01-09'},
+                       {'from': '2026-01-01', 'to': '2026-03-01'}]:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.data)
+        self.assertEqual(self.client.get(reverse('dokter-slots', args=[999])).status_code, 404)
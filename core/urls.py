@@ -12,16 +12,16 @@ from .views import (
     DokterJanjiTemuViewSet, RekamMedisViewSet,
     DokterJadwalView, DokterPasienListView,
     # Resepsionis
-    PasienViewSet, ResepsionisJanjiTemuViewSet, AntrianView,
+    PasienViewSet, ResepsionisJanjiTemuViewSet, AntrianView, antrian_stream,
     # Pasien
     CreateBookingView, PasienJanjiTemuListView, PasienRekamMedisListView,
-    DokterJadwalPublicView, JanjiTemuCancelView, PasienPembayaranListView,
+    DokterJadwalPublicView, DokterSlotView, JanjiTemuCancelView, PasienPembayaranListView,
     # Apoteker
     ObatViewSet, ResepViewSet, ApotekerStatsView,
     # Kasir
     PembayaranViewSet, LaporanKeuanganView, KasirStatsView,
     # PHASE 2: Audit, Stok, Notifikasi
-    AuditLogViewSet, StokAdjustmentViewSet, NotifikasiViewSet,
+    AuditLogViewSet, StokAdjustmentViewSet, NotifikasiViewSet, notifikasi_stream, StreamTicketView,
     # PHASE 3: Cicilan, Payment Gateway, QR Code
     CicilanViewSet, PaymentGatewayViewSet, PaymentTransactionViewSet, InvoiceQRCodeViewSet,
 )
@@ -71,6 +71,7 @@ urlpatterns = [
     path('rekam-medis/saya/', PasienRekamMedisListView.as_view(), name='rekam-medis-saya'),
     path('pembayaran/riwayat/', PasienPembayaranListView.as_view(), name='pembayaran-riwayat'),
     path('dokter/jadwal/', DokterJadwalPublicView.as_view(), name='dokter-jadwal-public'),
+    path('dokter/<int:pk>/slots/', DokterSlotView.as_view(), name='dokter-slots'),
     path('janji-temu/<int:pk>/cancel/', JanjiTemuCancelView.as_view(), name='janji-temu-cancel'),
     
     # 3. Dokter specific routes (must be before router)
@@ -90,7 +91,12 @@ urlpatterns = [
     
     # 7. Resepsionis routes
     path('antrian/', AntrianView.as_view(), name='antrian'),
+    path('antrian/stream/', antrian_stream, name='antrian-stream'),
     
-    # 8. Router URLs (LAST - catch-all for viewsets)
+    # 8. Notifikasi stream (sebelum router, supaya tidak tertangkap notifikasi/<pk>/)
+    path('notifikasi/stream/', notifikasi_stream, name='notifikasi-stream'),
+    path('stream/ticket/', StreamTicketView.as_view(), name='stream-ticket'),
+    
+    # 9. Router URLs (LAST - catch-all for viewsets)
     path('', include(router.urls)),
 ]
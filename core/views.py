@@ -2,17 +2,26 @@ from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db.models import Sum, Count
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from django.db.models import Sum, Count, F, Q, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from datetime import timedelta
+from datetime import date, timedelta
+from decimal import Decimal
 
 from .models import (
     CustomUser, Dokter, Pasien, Resepsionis, Apoteker, Kasir,
     LayananTindakan, JanjiTemu, RekamMedis, Obat, Resep, DetailResep, Pembayaran,
-    StokAdjustment
+    StokAdjustment, DailyRevenueRollup, ObatForecast
 )
 from .serializers import (
     CustomUserSerializer, CustomUserAdminSerializer, UserRegistrationSerializer, LoginSerializer, UserProfileSerializer,
@@ -21,7 +30,21 @@ from .serializers import (
     ObatSerializer, JanjiTemuSerializer, JanjiTemuBookingSerializer, RekamMedisSerializer,
     RekamMedisCreateSerializer, ResepSerializer, ResepProcessSerializer, DetailResepSerializer,
     PembayaranSerializer, PembayaranProcessSerializer, LaporanOverviewSerializer,
-    StokAdjustmentSerializer
+    StokAdjustmentSerializer, ObatLotSerializer, ObatForecastSerializer
+)
+from .audit import get_writer as get_audit_writer
+from .filters import PasienSearchFilter, RekamMedisSearchFilter
+from .forecast import obat_stok_menipis, with_days_of_cover
+from .notifications import channel_notifikasi, tandai_semua_dibaca, unread_count
+from .inventory import LotTidakCocok, apply_stock_deltas, konsumsi_mingguan, obat_kedaluwarsa, stok_pada
+from .realtime import (
+    buat_tiket_stream, channel_antrian, publish_antrian, snapshot_antrian, sse_response, user_tiket_stream
+)
+from .search import FIELDS_KLINIS, cari_rekam_medis, sorot
+from .slots import slot_dokter
+from .pagination import AuditLogPagination, NotifikasiPagination, PembayaranPagination, ResepPagination
+from .stats import (
+    dashboard_stats, local_day_range, revenue_series, REVENUE_WINDOWS, REVENUE_BUCKETS, REVENUE_GROUP_BY
 )
 from .permissions import (
     IsAdmin, IsDokter, IsPasien, IsResepsionis, IsApoteker, IsKasir,
@@ -226,13 +249,13 @@ class UserViewSet(viewsets.ModelViewSet):
             
             history['recent_transactions'] = {
                 'janji_temu': JanjiTemuSerializer(
-                    janji_temu.order_by('-created_at')[:5], many=True
+                    janji_temu.for_api().order_by('-created_at')[:5], many=True
                 ).data,
                 'rekam_medis': RekamMedisSerializer(
-                    rekam_medis.order_by('-tanggal_periksa')[:5], many=True
+                    rekam_medis.for_api().order_by('-tanggal_periksa')[:5], many=True
                 ).data,
                 'pembayaran': PembayaranSerializer(
-                    pembayaran.order_by('-created_at')[:5], many=True
+                    pembayaran.for_api().order_by('-created_at')[:5], many=True
                 ).data,
             }
         
@@ -250,10 +273,10 @@ class UserViewSet(viewsets.ModelViewSet):
             
             history['recent_transactions'] = {
                 'janji_temu': JanjiTemuSerializer(
-                    janji_temu.order_by('-created_at')[:5], many=True
+                    janji_temu.for_api().order_by('-created_at')[:5], many=True
                 ).data,
                 'rekam_medis': RekamMedisSerializer(
-                    rekam_medis.order_by('-tanggal_periksa')[:5], many=True
+                    rekam_medis.for_api().order_by('-tanggal_periksa')[:5], many=True
                 ).data,
             }
         
@@ -270,7 +293,7 @@ class UserViewSet(viewsets.ModelViewSet):
             
             history['recent_transactions'] = {
                 'resep': ResepSerializer(
-                    resep.order_by('-processed_at')[:5], many=True
+                    resep.for_api().order_by('-processed_at')[:5], many=True
                 ).data,
                 'stok_adjustment': StokAdjustmentSerializer(
                     stok_adj.order_by('-created_at')[:5], many=True
@@ -291,7 +314,7 @@ class UserViewSet(viewsets.ModelViewSet):
             
             history['recent_transactions'] = {
                 'pembayaran': PembayaranSerializer(
-                    pembayaran.order_by('-tanggal_bayar')[:5], many=True
+                    pembayaran.for_api().order_by('-tanggal_bayar')[:5], many=True
                 ).data,
             }
         
@@ -322,58 +345,36 @@ class LaporanOverviewView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated, IsAdmin]
     
     def get(self, request, *args, **kwargs):
-        today = timezone.now().date()
-        first_day_of_month = today.replace(day=1)
-        
-        total_pasien = Pasien.objects.count()
-        total_dokter = Dokter.objects.filter(status_aktif=True).count()
-        janji_hari_ini = JanjiTemu.objects.filter(tanggal=today).count()
-        
-        revenue_bulan_ini = Pembayaran.objects.filter(
-            status='lunas',
-            tanggal_bayar__date__gte=first_day_of_month
-        ).aggregate(total=Sum('total_biaya'))['total'] or 0
-        
-        pasien_baru_bulan_ini = Pasien.objects.filter(
-            created_at__date__gte=first_day_of_month
-        ).count()
-        
-        pembayaran_pending = Pembayaran.objects.filter(status='pending').count()
-        
-        data = {
-            'total_pasien': total_pasien,
-            'total_dokter': total_dokter,
-            'janji_hari_ini': janji_hari_ini,
-            'revenue_bulan_ini': revenue_bulan_ini,
-            'pasien_baru_bulan_ini': pasien_baru_bulan_ini,
-            'pembayaran_pending': pembayaran_pending,
-        }
-        
-        return Response(LaporanOverviewSerializer(data).data)
+        return Response(LaporanOverviewSerializer(dashboard_stats()).data)
 
 
 class RevenueChartView(generics.GenericAPIView):
-    """View untuk chart revenue 7 hari terakhir"""
+    """
+    View untuk chart revenue.
+    Query params: window (7/30/90/365 hari, default 7), bucket (day/week/month,
+    default day), group_by (metode/dokter/spesialisasi, opsional).
+    """
     permission_classes = [IsAuthenticated, IsAdmin]
     
     def get(self, request, *args, **kwargs):
-        today = timezone.now().date()
-        data = []
+        try:
+            window = int(request.query_params.get('window', 7))
+        except ValueError:
+            window = None
+        bucket = request.query_params.get('bucket', 'day')
+        group_by = request.query_params.get('group_by') or None
         
-        for i in range(6, -1, -1):
-            date = today - timedelta(days=i)
-            revenue = Pembayaran.objects.filter(
-                status='lunas',
-                tanggal_bayar__date=date
-            ).aggregate(total=Sum('total_biaya'))['total'] or 0
-            
-            data.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'day': date.strftime('%a'),
-                'revenue': float(revenue)
-            })
+        if window not in REVENUE_WINDOWS:
+            return Response({'error': f'window harus salah satu dari {list(REVENUE_WINDOWS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if bucket not in REVENUE_BUCKETS:
+            return Response({'error': f'bucket harus salah satu dari {list(REVENUE_BUCKETS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if group_by and group_by not in REVENUE_GROUP_BY:
+            return Response({'error': f'group_by harus salah satu dari {list(REVENUE_GROUP_BY)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(data)
+        return Response(revenue_series(window=window, bucket=bucket, group_by=group_by))
 
 
 # ==================== DOKTER VIEWS ====================
@@ -398,21 +399,18 @@ class DokterPasienListView(generics.ListAPIView):
     """View untuk daftar pasien dokter"""
     serializer_class = PasienSerializer
     permission_classes = [IsAuthenticated, IsDokter]
-    filter_backends = [DjangoFilterBackend, SearchFilter]
-    search_fields = ['user__first_name', 'user__last_name', 'no_rm']
+    filter_backends = [DjangoFilterBackend, PasienSearchFilter]
     
     def get_queryset(self):
         dokter = self.request.user.dokter_profile
         tanggal = self.request.query_params.get('tanggal')
         
-        queryset = Pasien.objects.filter(
-            janji_temu__dokter=dokter
-        ).distinct()
-        
+        # Subquery pasien_id, bukan join + distinct, supaya bisa diurutkan relevansi pencarian
+        janji_temu = JanjiTemu.objects.filter(dokter=dokter)
         if tanggal:
-            queryset = queryset.filter(janji_temu__tanggal=tanggal)
+            janji_temu = janji_temu.filter(tanggal=tanggal)
         
-        return queryset
+        return Pasien.objects.filter(pk__in=janji_temu.values('pasien_id'))
 
 
 class DokterJanjiTemuViewSet(viewsets.ReadOnlyModelViewSet):
@@ -425,15 +423,18 @@ class DokterJanjiTemuViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         dokter = self.request.user.dokter_profile
-        return JanjiTemu.objects.filter(dokter=dokter)
+        return JanjiTemu.objects.for_api().filter(dokter=dokter)
     
     @action(detail=True, methods=['post'])
     def mulai_konsultasi(self, request, pk=None):
-        """Mulai konsultasi (update status ke confirmed)"""
+        """Mulai konsultasi (update status ke confirmed), pasien dipanggil di layar antrian"""
         janji = self.get_object()
         if janji.status == 'pending':
             janji.status = 'confirmed'
+            janji._dipanggil = True
             janji.save()
+        else:
+            publish_antrian(janji, 'dipanggil')
         return Response(JanjiTemuSerializer(janji).data)
 
 
@@ -447,7 +448,7 @@ class RekamMedisViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         dokter = self.request.user.dokter_profile
-        return RekamMedis.objects.filter(dokter=dokter)
+        return RekamMedis.objects.for_api().filter(dokter=dokter)
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -467,6 +468,34 @@ class DokterJadwalPublicView(generics.ListAPIView):
     search_fields = ['user__first_name', 'user__last_name']
 
 
+class DokterSlotView(generics.GenericAPIView):
+    """
+    Slot praktik dokter per tanggal beserta ketersediaannya, untuk halaman booking.
+    Query params: from, to (YYYY-MM-DD, default hari ini s/d 6 hari ke depan).
+    """
+    queryset = Dokter.objects.filter(status_aktif=True)
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, pk=None):
+        dokter = self.get_object()
+        try:
+            dari = date.fromisoformat(request.query_params.get('from') or timezone.localdate().isoformat())
+            sampai = date.fromisoformat(request.query_params.get('to') or (dari + timedelta(days=6)).isoformat())
+        except ValueError:
+            return Response({'error': 'from dan to harus YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        max_hari = getattr(settings, 'SLOT_MAX_HARI', 31)
+        if not 0 <= (sampai - dari).days < max_hari:
+            return Response({'error': f'to harus antara from dan {max_hari - 1} hari setelahnya'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'dokter_id': dokter.pk,
+            'from': dari,
+            'to': sampai,
+            'jadwal': slot_dokter(dokter, dari, sampai),
+        })
+
+
 class CreateBookingView(generics.CreateAPIView):
     """View untuk booking janji temu (pasien) - Renamed for clarity"""
     serializer_class = JanjiTemuBookingSerializer
@@ -485,7 +514,7 @@ class PasienJanjiTemuListView(generics.ListAPIView):
         # Support both pasien role and other roles viewing their appointments
         user = self.request.user
         if hasattr(user, 'pasien_profile'):
-            return JanjiTemu.objects.filter(pasien=user.pasien_profile).order_by('-created_at')
+            return JanjiTemu.objects.for_api().filter(pasien=user.pasien_profile).order_by('-created_at')
         return JanjiTemu.objects.none()
 
 
@@ -497,7 +526,7 @@ class PasienRekamMedisListView(generics.ListAPIView):
     def get_queryset(self):
         user = self.request.user
         if hasattr(user, 'pasien_profile'):
-            return RekamMedis.objects.filter(pasien=user.pasien_profile).order_by('-tanggal_periksa')
+            return RekamMedis.objects.for_api().filter(pasien=user.pasien_profile).order_by('-tanggal_periksa')
         return RekamMedis.objects.none()
 
 
@@ -509,7 +538,7 @@ class PasienPembayaranListView(generics.ListAPIView):
     def get_queryset(self):
         user = self.request.user
         if hasattr(user, 'pasien_profile'):
-            return Pembayaran.objects.filter(janji_temu__pasien=user.pasien_profile).order_by('-created_at')
+            return Pembayaran.objects.for_api().filter(janji_temu__pasien=user.pasien_profile).order_by('-created_at')
         return Pembayaran.objects.none()
 
 
@@ -522,7 +551,7 @@ class JanjiTemuCancelView(generics.UpdateAPIView):
         # Allow any authenticated user with pasien_profile to cancel their appointments
         user = self.request.user
         if hasattr(user, 'pasien_profile'):
-            return JanjiTemu.objects.filter(
+            return JanjiTemu.objects.for_api().filter(
                 pasien=user.pasien_profile, 
                 status__in=['pending', 'confirmed']
             )
@@ -543,8 +572,8 @@ class PasienViewSet(viewsets.ModelViewSet):
     queryset = Pasien.objects.all().order_by('-created_at')
     serializer_class = PasienSerializer
     permission_classes = [IsAuthenticated, IsResepsionis]
-    filter_backends = [DjangoFilterBackend, SearchFilter]
-    search_fields = ['user__first_name', 'user__last_name', 'no_rm', 'user__phone']
+    # ?search= nama, no RM atau telepon lewat index pencarian (core/search.py)
+    filter_backends = [DjangoFilterBackend, PasienSearchFilter]
     
     def create(self, request, *args, **kwargs):
         """Registrasi pasien baru oleh resepsionis"""
@@ -603,7 +632,7 @@ class ResepsionisJanjiTemuViewSet(viewsets.ModelViewSet):
     ordering_fields = ['tanggal', 'waktu', 'nomor_antrian']
     
     def get_queryset(self):
-        return JanjiTemu.objects.all()
+        return JanjiTemu.objects.for_api()
     
     @action(detail=True, methods=['post'])
     def konfirmasi(self, request, pk=None):
@@ -634,7 +663,7 @@ class AntrianView(generics.ListAPIView):
         today = timezone.now().date()
         dokter_id = self.request.query_params.get('dokter_id')
         
-        queryset = JanjiTemu.objects.filter(
+        queryset = JanjiTemu.objects.for_api().filter(
             tanggal=today,
             status__in=['confirmed', 'pending']
         ).order_by('nomor_antrian')
@@ -645,6 +674,78 @@ class AntrianView(generics.ListAPIView):
         return queryset
 
 
+def _user_stream(request):
+    """
+    User dari access token di header Authorization, atau dari tiket stream
+    ?ticket= (EventSource tidak bisa kirim header), lihat StreamTicketView
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    if header is None:
+        tiket = request.GET.get('ticket')
+        return user_tiket_stream(tiket) if tiket else None
+    try:
+        raw_token = auth.get_raw_token(header)
+        return auth.get_user(auth.get_validated_token(raw_token)) if raw_token else None
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _stream_tanpa_asgi(request):
+    """
+    Respons 501 jika request tidak dilayani server ASGI: handler WSGI (termasuk
+    runserver) mengonsumsi stream async sampai habis sehingga respons tidak
+    pernah terkirim dan satu worker tertahan selamanya. None jika ASGI.
+    """
+    if isinstance(request, ASGIRequest):
+        return None
+    return JsonResponse(
+        {'error': 'Live stream membutuhkan server ASGI, mis. uvicorn klinik.asgi:application'}, status=501
+    )
+
+
+class StreamTicketView(generics.GenericAPIView):
+    """Tiket berumur pendek untuk membuka antrian/notifikasi stream lewat ?ticket="""
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        return Response({
+            'ticket': buat_tiket_stream(request.user),
+            'expires_in': getattr(settings, 'STREAM_TICKET_TIMEOUT', 60),
+        })
+
+
+@require_GET
+async def antrian_stream(request):
+    """
+    Live antrian lewat Server-Sent Events, pengganti polling AntrianView.
+    Event `snapshot` berisi antrian aktif (?tanggal=, default hari ini; ?dokter_id=),
+    lalu event `antrian` {aksi, janji} untuk setiap perubahan janji temu yang commit;
+    aksi `dihapus`/`dipindah` (janji hanya berisi id, dokter_id, tanggal) berarti
+    barisnya keluar dari antrian ini.
+    Selama tidak ada perubahan koneksi hanya menunggu (keep-alive berkala).
+    Butuh server ASGI, mis. `uvicorn klinik.asgi:application` (di WSGI: 501).
+    Autentikasi: header Authorization atau ?ticket= dari StreamTicketView.
+    """
+    user = await sync_to_async(_user_stream)(request)
+    if user is None:
+        return JsonResponse({'error': 'Token tidak valid atau tidak ada'}, status=401)
+    if user.role != 'resepsionis':
+        return JsonResponse({'error': 'Hanya resepsionis yang dapat membuka antrian'}, status=403)
+    
+    try:
+        tanggal = date.fromisoformat(request.GET['tanggal']) if request.GET.get('tanggal') else timezone.localdate()
+        dokter_id = int(request.GET['dokter_id']) if request.GET.get('dokter_id') else None
+    except ValueError:
+        return JsonResponse({'error': 'Format tanggal (YYYY-MM-DD) atau dokter_id tidak valid'}, status=400)
+    
+    if (response := _stream_tanpa_asgi(request)) is not None:
+        return response
+    return sse_response(
+        channel_antrian(tanggal, dokter_id), lambda: snapshot_antrian(tanggal, dokter_id), 'antrian'
+    )
+
+
 # ==================== APOTEKER VIEWS ====================
 
 class ObatViewSet(viewsets.ModelViewSet):
@@ -677,12 +778,13 @@ class ResepViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet untuk resep (apoteker)"""
     serializer_class = ResepSerializer
     permission_classes = [IsAuthenticated, IsApoteker]
+    pagination_class = ResepPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status']
     ordering_fields = ['tanggal_resep']
     
     def get_queryset(self):
-        return Resep.objects.all()
+        return Resep.objects.for_api()
     
     @action(detail=True, methods=['post'])
     def proses(self, request, pk=None):
@@ -699,13 +801,15 @@ class ApotekerStatsView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated, IsApoteker]
     
     def get(self, request, *args, **kwargs):
-        today = timezone.now().date()
+        # Range [awal hari, besok) alih-alih processed_at__date supaya memakai index (status, processed_at)
+        today_start, today_end = local_day_range(timezone.localdate())
         
         resep_pending = Resep.objects.filter(status='pending').count()
-        obat_menipis = Obat.objects.filter(stok__lt=10, is_active=True).count()
+        obat_menipis = obat_stok_menipis().count()
         resep_hari_ini = Resep.objects.filter(
-            processed_at__date=today,
-            status='delivered'
+            status='delivered',
+            processed_at__gte=today_start,
+            processed_at__lt=today_end
         ).count()
         
         return Response({
@@ -721,17 +825,18 @@ class PembayaranViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet untuk pembayaran (kasir)"""
     serializer_class = PembayaranSerializer
     permission_classes = [IsAuthenticated, IsKasir]
+    pagination_class = PembayaranPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status', 'metode']
     ordering_fields = ['created_at', 'tanggal_bayar']
     
     def get_queryset(self):
-        return Pembayaran.objects.all()
+        return Pembayaran.objects.for_api()
     
     @action(detail=False, methods=['get'])
     def pending(self, request):
         """Pembayaran pending"""
-        pembayaran = Pembayaran.objects.filter(status='pending')
+        pembayaran = Pembayaran.objects.for_api().filter(status='pending')
         return Response(PembayaranSerializer(pembayaran, many=True).data)
     
     @action(detail=True, methods=['post'])
@@ -758,21 +863,22 @@ class LaporanKeuanganView(generics.GenericAPIView):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         
-        queryset = Pembayaran.objects.filter(status='lunas')
+        # Dibaca dari rollup harian: O(hari) alih-alih O(pembayaran)
+        queryset = DailyRevenueRollup.objects.filter(jumlah_transaksi__gt=0)
         
         if start_date:
-            queryset = queryset.filter(tanggal_bayar__date__gte=start_date)
+            queryset = queryset.filter(tanggal__gte=start_date)
         if end_date:
-            queryset = queryset.filter(tanggal_bayar__date__lte=end_date)
+            queryset = queryset.filter(tanggal__lte=end_date)
         
-        # Aggregate by date
-        from django.db.models.functions import TruncDate
-        
-        data = queryset.annotate(
-            date=TruncDate('tanggal_bayar')
-        ).values('date').annotate(
-            total_transaksi=Count('id'),
+        per_metode = {
+            metode: Coalesce(Sum('total_biaya', filter=Q(metode=metode)), Value(Decimal('0')))
+            for metode, _ in Pembayaran.METODE_CHOICES
+        }
+        data = queryset.values(date=F('tanggal')).annotate(
+            total_transaksi=Sum('jumlah_transaksi'),
             total_revenue=Sum('total_biaya'),
+            **per_metode
         ).order_by('-date')
         
         return Response(list(data))
@@ -783,31 +889,13 @@ class KasirStatsView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated, IsKasir]
     
     def get(self, request, *args, **kwargs):
-        today = timezone.now().date()
-        first_day_of_month = today.replace(day=1)
-        
-        pembayaran_hari_ini = Pembayaran.objects.filter(
-            tanggal_bayar__date=today,
-            status='lunas'
-        ).count()
-        
-        pending = Pembayaran.objects.filter(status='pending').count()
-        
-        revenue_bulan_ini = Pembayaran.objects.filter(
-            status='lunas',
-            tanggal_bayar__date__gte=first_day_of_month
-        ).aggregate(total=Sum('total_biaya'))['total'] or 0
-        
-        revenue_hari_ini = Pembayaran.objects.filter(
-            status='lunas',
-            tanggal_bayar__date=today
-        ).aggregate(total=Sum('total_biaya'))['total'] or 0
+        stats = dashboard_stats()
         
         return Response({
-            'pembayaran_hari_ini': pembayaran_hari_ini,
-            'pending': pending,
-            'revenue_bulan_ini': float(revenue_bulan_ini),
-            'revenue_hari_ini': float(revenue_hari_ini)
+            'pembayaran_hari_ini': stats['pembayaran_hari_ini'],
+            'pending': stats['pembayaran_pending'],
+            'revenue_bulan_ini': float(stats['revenue_bulan_ini']),
+            'revenue_hari_ini': float(stats['revenue_hari_ini'])
         })
 
 
@@ -823,9 +911,15 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = AuditLog.objects.all()
     serializer_class = AuditLogSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
+    pagination_class = AuditLogPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['user', 'action', 'model_name']
     ordering_fields = ['timestamp']
+    
+    @action(detail=False, methods=['get'])
+    def writer_stats(self, request):
+        """Metrik writer audit log (antrian, backpressure, error)"""
+        return Response(get_audit_writer().stats())
 
 
 # ==================== PHASE 2: STOK ADJUSTMENT VIEWS ====================
@@ -849,6 +943,7 @@ class NotifikasiViewSet(viewsets.ModelViewSet):
     """ViewSet untuk Notifikasi"""
     serializer_class = NotifikasiSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NotifikasiPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['tipe', 'is_read']
     ordering_fields = ['created_at']
@@ -868,14 +963,31 @@ class NotifikasiViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifikasi as read"""
-        Notifikasi.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        tandai_semua_dibaca(request.user.pk)
         return Response({'status': 'success', 'message': 'Semua notifikasi ditandai sudah dibaca'})
     
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        """Get unread notifikasi count"""
-        count = Notifikasi.objects.filter(user=request.user, is_read=False).count()
-        return Response({'unread_count': count})
+        """Get unread notifikasi count (counter incremental, tanpa COUNT tabel notifikasi)"""
+        return Response({'unread_count': unread_count(request.user.pk)})
+
+
+@require_GET
+async def notifikasi_stream(request):
+    """
+    Jumlah notifikasi belum dibaca lewat Server-Sent Events, pengganti polling
+    unread_count: event `snapshot` {unread_count} lalu event `unread` setiap kali
+    jumlahnya berubah. Autentikasi dan kebutuhan ASGI seperti antrian_stream.
+    """
+    user = await sync_to_async(_user_stream)(request)
+    if user is None:
+        return JsonResponse({'error': 'Token tidak valid atau tidak ada'}, status=401)
+    
+    if (response := _stream_tanpa_asgi(request)) is not None:
+        return response
+    return sse_response(
+        channel_notifikasi(user.pk), lambda: {'unread_count': unread_count(user.pk)}, 'unread'
+    )
 
 
 # ==================== PHASE 2: REKAM MEDIS DURATION TRACKING ====================
@@ -883,26 +995,64 @@ class NotifikasiViewSet(viewsets.ModelViewSet):
 class RekamMedisViewSet(viewsets.ModelViewSet):
     """ViewSet untuk Rekam Medis (Updated with duration tracking)"""
     permission_classes = [IsAuthenticated, IsDokter]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, RekamMedisSearchFilter, OrderingFilter]
     filterset_fields = ['pasien', 'dokter']
-    search_fields = ['pasien__user__first_name', 'pasien__no_rm', 'diagnosa']
     ordering_fields = ['tanggal_periksa']
     
     def get_queryset(self):
         dokter = self.request.user.dokter_profile
-        return RekamMedis.objects.filter(dokter=dokter)
+        return RekamMedis.objects.for_api().filter(dokter=dokter)
     
     def get_serializer_class(self):
         if self.action == 'create':
             return RekamMedisCreateSerializer
         return RekamMedisSerializer
     
+    @action(detail=False, methods=['get'])
+    def cari(self, request):
+        """
+        Pencarian teks klinis (diagnosa, anamnesa, pemeriksaan fisik, catatan)
+        rekam medis milik dokter ini, urut skor relevansi, dengan potongan teks
+        yang cocok ditandai <mark>. Query param: q.
+        """
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            return Response({'error': 'Parameter q wajib diisi'}, status=status.HTTP_400_BAD_REQUEST)
+
+        dokter = request.user.dokter_profile
+        hasil = cari_rekam_medis(q, scope=RekamMedis.objects.filter(dokter=dokter))
+        rows = {
+            row['id']: row for row in RekamMedis.objects.filter(pk__in=[pk for pk, _ in hasil]).values(
+                'id', 'tanggal_periksa', 'pasien_id', 'pasien__no_rm',
+                'pasien__user__first_name', 'pasien__user__last_name', *FIELDS_KLINIS
+            )
+        }
+        return Response([
+            {
+                'id': pk,
+                'tanggal_periksa': rows[pk]['tanggal_periksa'],
+                'pasien': {
+                    'id': rows[pk]['pasien_id'],
+                    'nama': ' '.join(filter(None, [
+                        rows[pk]['pasien__user__first_name'], rows[pk]['pasien__user__last_name']
+                    ])),
+                    'no_rm': rows[pk]['pasien__no_rm'],
+                },
+                'skor': skor,
+                'highlight': {
+                    field: teks for field in FIELDS_KLINIS
+                    if (teks := sorot(rows[pk][field], q)) is not None
+                },
+            }
+            for pk, skor in hasil if pk in rows
+        ])
+    
     @action(detail=True, methods=['post'])
     def mulai_konsultasi(self, request, pk=None):
         """Mulai tracking konsultasi"""
         rekam_medis = self.get_object()
         rekam_medis.waktu_mulai = timezone.now()
-        rekam_medis.save()
+        rekam_medis.save(update_fields=['waktu_mulai', 'updated_at'])
         return Response(RekamMedisSerializer(rekam_medis).data)
     
     @action(detail=True, methods=['post'])
@@ -910,7 +1060,7 @@ class RekamMedisViewSet(viewsets.ModelViewSet):
         """Selesai tracking konsultasi"""
         rekam_medis = self.get_object()
         rekam_medis.waktu_selesai = timezone.now()
-        rekam_medis.save()
+        rekam_medis.save(update_fields=['waktu_selesai', 'updated_at'])
         return Response(RekamMedisSerializer(rekam_medis).data)
 
 
@@ -941,9 +1091,26 @@ class ObatViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def stok_menipis(self, request):
-        """Obat dengan stok < 10"""
-        obat = Obat.objects.filter(stok__lt=10, is_active=True)
-        return Response(ObatSerializer(obat, many=True).data)
+        """
+        Obat dengan stok <= reorder point hasil forecast (manage.py forecast_stok);
+        obat yang belum punya forecast memakai batas lama stok < 10
+        """
+        return Response(ObatSerializer(obat_stok_menipis(), many=True).data)
+    
+    @action(detail=False, methods=['get'])
+    def forecast(self, request):
+        """
+        Forecast kebutuhan semua obat aktif, urut days-of-cover terkecil.
+        Query params: perlu_restock=1 (hanya stok <= reorder point), obat (id).
+        """
+        forecast = with_days_of_cover(
+            ObatForecast.objects.filter(obat__is_active=True).select_related('obat')
+        ).order_by(F('days_of_cover').asc(nulls_last=True), 'obat__nama')
+        if request.query_params.get('perlu_restock') in ('1', 'true'):
+            forecast = forecast.filter(obat__stok__lte=F('reorder_point'))
+        if request.query_params.get('obat'):
+            forecast = forecast.filter(obat_id=request.query_params['obat'])
+        return Response(ObatForecastSerializer(forecast, many=True).data)
     
     @action(detail=False, methods=['get'])
     def expired_soon(self, request):
@@ -951,11 +1118,8 @@ class ObatViewSet(viewsets.ModelViewSet):
         today = timezone.now().date()
         thirty_days_later = today + timedelta(days=30)
         
-        obat = Obat.objects.filter(
-            expired_date__lte=thirty_days_later,
-            expired_date__gt=today,
-            is_active=True
-        ).order_by('expired_date')
+        # Range scan atas lot yang masih ada stoknya (index parsial obat_lot_expiry_idx)
+        obat = obat_kedaluwarsa(thirty_days_later, sejak=today).order_by('expired_date')
         
         return Response(ObatSerializer(obat, many=True).data)
     
@@ -963,12 +1127,71 @@ class ObatViewSet(viewsets.ModelViewSet):
     def already_expired(self, request):
         """Obat yang sudah kadaluarsa"""
         today = timezone.now().date()
-        obat = Obat.objects.filter(
-            expired_date__lt=today,
-            is_active=True
-        )
+        obat = obat_kedaluwarsa(today - timedelta(days=1))
         
         return Response(ObatSerializer(obat, many=True).data)
+    
+    @action(detail=True, methods=['get'])
+    def riwayat_stok(self, request, pk=None):
+        """
+        Stok pada akhir suatu tanggal dan konsumsi resep per minggu.
+        Query params: tanggal (YYYY-MM-DD, default hari ini), minggu (1-52, default 4).
+        """
+        obat = self.get_object()
+        tanggal = request.query_params.get('tanggal')
+        try:
+            tanggal = date.fromisoformat(tanggal) if tanggal else timezone.localdate()
+            minggu = int(request.query_params.get('minggu', 4))
+        except ValueError:
+            return Response({'error': 'tanggal harus YYYY-MM-DD dan minggu berupa angka'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= minggu <= 52:
+            return Response({'error': 'minggu harus antara 1 dan 52'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        konsumsi = konsumsi_mingguan(obat.pk, minggu)
+        return Response({
+            'obat': obat.pk,
+            'tanggal': tanggal,
+            'stok': stok_pada(obat.pk, tanggal),
+            'konsumsi_mingguan': konsumsi,
+            'rata_rata_mingguan': sum(row['jumlah'] for row in konsumsi) / minggu,
+        })
+    
+    @action(detail=True, methods=['post'])
+    def restock(self, request, pk=None):
+        """Tambah stok dari penerimaan barang"""
+        obat = self.get_object()
+        try:
+            jumlah = int(request.data.get('jumlah', 0))
+        except (TypeError, ValueError):
+            jumlah = 0
+        if jumlah <= 0:
+            return Response({'error': 'jumlah restock harus lebih dari 0'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        expired_date = request.data.get('expired_date')
+        try:
+            expired_date = date.fromisoformat(expired_date) if expired_date else None
+        except ValueError:
+            return Response({'error': 'expired_date harus YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        # Lot baru per penerimaan; default nomor lot = tanggal terima (+ kedaluwarsa,
+        # supaya dua penerimaan sehari dengan kedaluwarsa berbeda tidak tergabung)
+        nomor_lot = request.data.get('nomor_lot') or '-'.join(
+            tanggal.strftime('%Y%m%d') for tanggal in (timezone.localdate(), expired_date) if tanggal
+        )
+        
+        try:
+            apply_stock_deltas({obat.pk: jumlah}, 'restock', lot=(nomor_lot, expired_date))
+        except LotTidakCocok as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        obat.refresh_from_db()
+        return Response(ObatSerializer(obat).data)
+    
+    @action(detail=True, methods=['get'])
+    def lots(self, request, pk=None):
+        """Lot obat yang masih ada stoknya, urut FEFO"""
+        obat = self.get_object()
+        lots = obat.lots.filter(jumlah__gt=0).order_by(F('expired_date').asc(nulls_last=True), 'id')
+        return Response(ObatLotSerializer(lots, many=True).data)
 
 
 # ==================== PHASE 3: CICILAN VIEWS ====================
@@ -133,8 +133,12 @@ export const adminService = {
         return response.data;
     },
 
-    getRevenueChart: async (): Promise<RevenueChart[]> => {
-        const response = await api.get('/laporan/revenue-chart/');
+    getRevenueChart: async (params?: {
+        window?: 7 | 30 | 90 | 365;
+        bucket?: 'day' | 'week' | 'month';
+        group_by?: 'metode' | 'dokter' | 'spesialisasi';
+    }): Promise<RevenueChart[]> => {
+        const response = await api.get('/laporan/revenue-chart/', { params });
         return response.data;
     },
 };
@@ -265,6 +265,7 @@ export interface RevenueChart {
     date: string;
     day: string;
     revenue: number;
+    breakdown?: Record<string, number>;
 }
 
 // Pagination Types
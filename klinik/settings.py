@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.AuditContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,6 +79,18 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # SQLite mengabaikan select_for_update: transaksi langsung mengambil
+            # write lock (BEGIN IMMEDIATE) sehingga writer bersamaan antre menunggu
+            # hingga `timeout` detik, bukan gagal "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # Database test berupa file: SQLite in-memory shared-cache memakai lock per
+        # tabel yang langsung gagal "table is locked" tanpa menunggu timeout
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -151,6 +164,49 @@ REST_FRAMEWORK = {
 }
 
 
+# Sequence counter (invoice_number, no_rm)
+# Jumlah nomor yang dipesan sekaligus per worker; 1 = tanpa pre-alokasi blok
+SEQUENCE_BLOCK_SIZE = int(os.environ.get('SEQUENCE_BLOCK_SIZE', 1))
+
+
+# Cache snapshot statistik dashboard admin/kasir (detik)
+DASHBOARD_STATS_CACHE_TIMEOUT = 60
+
+# Notifikasi dengan dedup_key sama tidak dikirim ulang dalam window ini (detik)
+NOTIFIKASI_DEDUP_WINDOW = 60 * 60
+
+# Penulisan audit log: 'sync' (bulk_create saat commit) atau 'thread' (worker background)
+AUDIT_LOG_WRITER = os.environ.get('AUDIT_LOG_WRITER', 'sync')
+AUDIT_LOG_QUEUE_SIZE = 10000
+AUDIT_LOG_BATCH_SIZE = 500
+
+# Forecast reorder point obat (manage.py forecast_stok)
+FORECAST_WINDOW_HARI = 90          # riwayat konsumsi yang dipakai
+FORECAST_SERVICE_LEVEL_Z = 1.65    # z untuk safety stock (~95% service level)
+FORECAST_LEAD_TIME_HARI = 7        # lead time default supplier
+FORECAST_LEAD_TIME_SUPPLIER = {}   # {'nama supplier': lead time hari}
+
+# Stream SSE live antrian & notifikasi (/api/antrian/stream/, /api/notifikasi/stream/, butuh server ASGI)
+REALTIME_BROKER = 'core.realtime.InProcessBroker'  # pub/sub; ganti untuk multi-proses
+SSE_HEARTBEAT = 15                 # detik antar komentar keep-alive saat tidak ada perubahan
+SSE_QUEUE_SIZE = 100               # event tertahan per klien sebelum dikirim snapshot ulang
+STREAM_TICKET_TIMEOUT = 60         # detik masa berlaku ?ticket= stream (/api/stream/ticket/)
+
+# Jumlah hasil pencarian pasien (?search= di /api/pasien/ dan /api/dokter/pasien-saya/) yang
+# diurutkan menurut relevansi (sisanya tetap ikut dipaginasi), dan jumlah maksimum hasil
+# teks klinis (?search= dan /cari/ di /api/rekam-medis/)
+PASIEN_SEARCH_LIMIT = 50
+REKAM_MEDIS_SEARCH_LIMIT = 50
+
+# Counter notifikasi belum dibaca per user di cache (detik), sumber cadangan tabel notifikasi_unread
+NOTIFIKASI_UNREAD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Slot praktik dokter (/api/dokter/<id>/slots/)
+SLOT_DURASI_MENIT = 15             # durasi slot default jika jadwal_praktik tidak menyebut "durasi"
+SLOT_MAX_HARI = 31                 # rentang from..to maksimum per request
+SLOT_CACHE_TIMEOUT = 60 * 60       # cache waktu terisi per (dokter, tanggal), dihapus saat janji temu berubah
+
+
 # Simple JWT
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),